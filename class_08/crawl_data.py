@@ -18,7 +18,45 @@ BINANCE_SPOT_LIMIT = 1000
 BINANCE_FUTURE_LIMIT = 1500
 
 CHINA_TZ = pytz.timezone("Asia/Shanghai")
-from threading import Thread
+from threading import Thread, Lock
+
+# 币安所有的K线周期, 每根K线的毫秒数(1M按31天算, 只用来判断最后一根K线有没有收盘).
+BINANCE_INTERVALS = {
+    '1m': 60 * 1000, '3m': 3 * 60 * 1000, '5m': 5 * 60 * 1000, '15m': 15 * 60 * 1000, '30m': 30 * 60 * 1000,
+    '1h': 3600 * 1000, '2h': 2 * 3600 * 1000, '4h': 4 * 3600 * 1000, '6h': 6 * 3600 * 1000,
+    '8h': 8 * 3600 * 1000, '12h': 12 * 3600 * 1000,
+    '1d': 86400 * 1000, '3d': 3 * 86400 * 1000, '1w': 7 * 86400 * 1000, '1M': 31 * 86400 * 1000
+}
+
+# 数据库里面只能保存这几个周期的K线, 其他周期保存到csv文件.
+DATABASE_INTERVALS = {
+    '1m': Interval.MINUTE,
+    '1h': Interval.HOUR,
+    '1d': Interval.DAILY,
+    '1w': Interval.WEEKLY
+}
+
+csv_lock = Lock()  # 多个线程下载同一个交易对的时候, csv文件一个一个写.
+
+INTERVAL_MINUTES = {
+    Interval.MINUTE: 1,
+    Interval.HOUR: 60,
+    Interval.DAILY: 1440,
+    Interval.WEEKLY: 10080
+}
+
+
+def get_download_interval(window: int, interval: Interval) -> str:
+    """
+    策略用window个interval周期的K线(比如BarGenerator的4小时K线是 4, Interval.HOUR),
+    返回能保存到数据库、而且能整除这个周期的最大的币安周期, 4小时的策略下载1h的K线, 比1m的少60倍.
+    """
+    minutes = window * INTERVAL_MINUTES[interval]
+    for binance_interval in ['1w', '1d', '1h', '1m']:
+        interval_minutes = INTERVAL_MINUTES[DATABASE_INTERVALS[binance_interval]]
+        if minutes % interval_minutes == 0:
+            return binance_interval
+    return '1m'
 
 
 def generate_datetime(timestamp: float) -> datetime:
@@ -26,20 +64,23 @@ def generate_datetime(timestamp: float) -> datetime:
     :param timestamp:
     :return:
     """
-    dt = datetime.fromtimestamp(timestamp / 1000)
-    dt = CHINA_TZ.localize(dt)
+    dt = datetime.fromtimestamp(timestamp / 1000, CHINA_TZ)  # 直接转换成北京时间, 不受本机时区的影响.
     return dt
 
 
-def get_binance_data(symbol: str, exchanges: str, start_time: str, end_time: str):
+def get_binance_data(symbol: str, exchanges: str, start_time: str, end_time: str, interval: str = '1m'):
     """
     爬取币安交易所的数据
-    :param symbol: BTCUSDT.
+    :param symbol: BTCUSDT, 币本位合约如: BTCUSD_PERP.
     :param exchanges: 现货、USDT合约, 或者币币合约.
     :param start_time: 格式如下:2020-1-1 或者2020-01-01
     :param end_time: 格式如下:2020-1-1 或者2020-01-01
+    :param interval: 币安的K线周期, 如: 1m, 5m, 1h, 4h, 1d, 参考BINANCE_INTERVALS.
+                     1m, 1h, 1d, 1w 保存到数据库, 其他的周期保存到 symbol_interval.csv 文件.
     :return:
     """
+    if interval not in BINANCE_INTERVALS:
+        raise Exception(f'K线周期请输入以下其中一个：{", ".join(BINANCE_INTERVALS.keys())}')
 
     api_url = ''
     save_symbol = symbol
@@ -50,18 +91,17 @@ def get_binance_data(symbol: str, exchanges: str, start_time: str, end_time: str
         limit = BINANCE_SPOT_LIMIT
         save_symbol = symbol.lower()
         gate_way = 'BINANCE'
-        api_url = f'https://api.binance.com/api/v3/klines?symbol={symbol}&interval=1m&limit={limit}'
+        api_url = f'https://api.binance.com/api/v3/klines?symbol={symbol}&interval={interval}&limit={limit}'
 
     elif exchanges == 'future':
         print('future')
         limit = BINANCE_FUTURE_LIMIT
-        api_url = f'https://fapi.binance.com/fapi/v1/klines?symbol={symbol}&interval=1m&limit={limit}'
+        api_url = f'https://fapi.binance.com/fapi/v1/klines?symbol={symbol}&interval={interval}&limit={limit}'
 
     elif exchanges == 'coin_future':
         print("coin_future")
         limit = BINANCE_FUTURE_LIMIT
-        f'https://dapi.binance.com/dapi/v1/klines?symbol={symbol}&interval=1m&limit={limit}'
-        pass
+        api_url = f'https://dapi.binance.com/dapi/v1/klines?symbol={symbol}&interval={interval}&limit={limit}'
 
     else:
         raise Exception('交易所名称请输入以下其中一个：spot, future, coin_future')
@@ -96,27 +136,16 @@ def get_binance_data(symbol: str, exchanges: str, start_time: str, end_time: str
 
             """
 
-            buf = []
-
-            for l in data:
-                bar = BarData(
-                    symbol=save_symbol,
-                    exchange=Exchange.BINANCE,
-                    datetime=generate_datetime(l[0]),
-                    interval=Interval.MINUTE,
-                    volume=float(l[5]),
-                    open_price=float(l[1]),
-                    high_price=float(l[2]),
-                    low_price=float(l[3]),
-                    close_price=float(l[4]),
-                    gateway_name=gate_way
-                )
-                buf.append(bar)
-
-            database_manager.save_bar_data(buf)
+            if not data:
+                break
+
+            if interval not in DATABASE_INTERVALS:
+                save_csv_data(save_symbol, interval, data)
+            else:
+                save_database_data(save_symbol, gate_way, DATABASE_INTERVALS[interval], data)
 
             # 到结束时间就退出, 后者收盘价大于当前的时间.
-            if (data[-1][0] > end_time) or data[-1][6] >= (int(time.time() * 1000) - 60 * 1000):
+            if (data[-1][0] > end_time) or data[-1][6] >= (int(time.time() * 1000) - BINANCE_INTERVALS[interval]):
                 break
 
             start_time = data[-1][0]
@@ -126,16 +155,59 @@ def get_binance_data(symbol: str, exchanges: str, start_time: str, end_time: str
             time.sleep(10)
 
 
-def download_spot():
+def save_database_data(symbol: str, gate_way: str, interval: Interval, data: list):
+    """
+    把币安的K线保存到数据库.
+    """
+    buf = []
+
+    for l in data:
+        bar = BarData(
+            symbol=symbol,
+            exchange=Exchange.BINANCE,
+            datetime=generate_datetime(l[0]),
+            interval=interval,
+            volume=float(l[5]),
+            open_price=float(l[1]),
+            high_price=float(l[2]),
+            low_price=float(l[3]),
+            close_price=float(l[4]),
+            gateway_name=gate_way
+        )
+        buf.append(bar)
+
+    database_manager.save_bar_data(buf)
+
+
+def save_csv_data(symbol: str, interval: str, data: list):
+    """
+    数据库不能保存的周期(比如4h)追加到csv文件, 多次下载有重复的时候按datetime去重.
+    """
+    df = pd.DataFrame(data).iloc[:, 0:6]
+    df.columns = ['datetime', 'open', 'high', 'low', 'close', 'volume']
+    df['datetime'] = df['datetime'].apply(generate_datetime)
+
+    file_name = f'{symbol}_{interval}.csv'
+    with csv_lock:
+        try:
+            df = pd.concat([pd.read_csv(file_name), df.astype(str)])
+            df = df.drop_duplicates(subset='datetime', keep='last').sort_values('datetime')
+        except FileNotFoundError:
+            pass
+
+        df.to_csv(file_name, index=False)
+
+
+def download_spot(interval='1m'):
     """
     下载现货数据的方法.
     :return:
     """
-    t1 = Thread(target=get_binance_data, args=('BTCUSDT', 'spot', "2018-1-1", "2019-1-1"))
+    t1 = Thread(target=get_binance_data, args=('BTCUSDT', 'spot', "2018-1-1", "2019-1-1", interval))
 
-    t2 = Thread(target=get_binance_data, args=('BTCUSDT', 'spot', "2019-1-1", "2020-1-1"))
+    t2 = Thread(target=get_binance_data, args=('BTCUSDT', 'spot', "2019-1-1", "2020-1-1", interval))
 
-    t3 = Thread(target=get_binance_data, args=('BTCUSDT', 'spot', "2020-1-1", "2020-11-16"))
+    t3 = Thread(target=get_binance_data, args=('BTCUSDT', 'spot', "2020-1-1", "2020-11-16", interval))
 
     t1.start()
     t2.start()
@@ -146,13 +218,13 @@ def download_spot():
     t3.join()
 
 
-def download_future():
+def download_future(interval='1m'):
     """
     下载合约数据的方法。
     :return:
     """
-    t1 = Thread(target=get_binance_data, args=('BTCUSDT', 'future', "2019-9-10", "2020-3-1"))
-    t2 = Thread(target=get_binance_data, args=('BTCUSDT', 'future', "2019-3-1", "2020-11-16"))
+    t1 = Thread(target=get_binance_data, args=('BTCUSDT', 'future', "2019-9-10", "2020-3-1", interval))
+    t2 = Thread(target=get_binance_data, args=('BTCUSDT', 'future', "2019-3-1", "2020-11-16", interval))
 
     t1.start()
     t2.start()
@@ -161,9 +233,25 @@ def download_future():
     t2.join()
 
 
+def download_coin_future(interval='1m'):
+    """
+    下载币本位合约数据的方法, 交易对如: BTCUSD_PERP.
+    :return:
+    """
+    t1 = Thread(target=get_binance_data, args=('BTCUSD_PERP', 'coin_future', "2020-8-11", "2020-11-16", interval))
+
+    t1.start()
+    t1.join()
+
+
 if __name__ == '__main__':
-    # download_spot() # 下载现货的数据.
+    # 4小时的策略只需要下载1h的K线: get_download_interval(4, Interval.HOUR) 返回 '1h'.
+    interval = get_download_interval(1, Interval.MINUTE)
+
+    # download_spot(interval) # 下载现货的数据.
+
+    download_future(interval)  # 下载合约的数据
 
-    download_future()  # 下载合约的数据
+    # download_coin_future(interval)  # 下载币本位合约的数据
 
 
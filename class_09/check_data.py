@@ -0,0 +1,292 @@
+"""
+    检查数据库里面K线数据的质量, 生成修复的计划.
+
+    crawl_data.py 下载的数据可能有这些问题:
+    1. 重复: 每一页从上一页最后一根K线的时间开始请求, 多个线程的时间段也会重叠, 同一根K线会保存多次.
+    2. 缺失: 下载出错或者交易所维护, 中间少了K线.
+    3. 时间不是递增的, 或者时间没有对齐到周期.
+    4. 开高低收不合理: 最高价比开盘价、收盘价低, 最低价比开盘价、收盘价高, 价格小于等于0.
+    5. 连续很多根成交量为0的K线.
+
+    所有检查都是numpy数组的运算, 几百万根K线也只要一两秒.
+    检查的结果生成修复计划: 需要重新下载的时间段(合并成按天的区间, 直接交给get_binance_data), 以及需要去重排序的数据.
+
+    使用方法:
+    python check_data.py
+"""
+
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from howtrader.trader.constant import Exchange, Interval
+from howtrader.trader.database import database_manager
+from howtrader.trader.object import BarData
+
+import crawl_data
+from crawl_data import BINANCE_INTERVALS, CHINA_TZ, DATABASE_INTERVALS
+
+# 币安的周K线从周一开始, 1970-01-01是周四, 对齐的时候要加上4天的偏移.
+INTERVAL_OFFSET_MS = {
+    '1w': 4 * 86400 * 1000
+}
+
+BINANCE_INTERVAL_NAMES = {interval: name for name, interval in DATABASE_INTERVALS.items()}
+
+ZERO_VOLUME_RUN = 30  # 连续多少根成交量为0的K线算有问题.
+
+
+def get_exchanges(symbol: str) -> str:
+    """
+    现货的交易对是小写的(btcusdt), U本位合约是大写的(BTCUSDT), 币本位合约带下划线(BTCUSD_PERP).
+    """
+    if symbol.islower():
+        return 'spot'
+    elif '_' in symbol:
+        return 'coin_future'
+    return 'future'
+
+
+def bars_to_arrays(bars: List[BarData]) -> Dict[str, np.ndarray]:
+    """
+    把BarData列表转成numpy数组, 时间是毫秒时间戳, 保持数据库返回的顺序.
+    """
+    count = len(bars)
+    return {
+        'timestamp': np.fromiter((bar.datetime.timestamp() * 1000 for bar in bars), dtype=np.float64, count=count)
+        .round().astype(np.int64),
+        'open': np.fromiter((bar.open_price for bar in bars), dtype=np.float64, count=count),
+        'high': np.fromiter((bar.high_price for bar in bars), dtype=np.float64, count=count),
+        'low': np.fromiter((bar.low_price for bar in bars), dtype=np.float64, count=count),
+        'close': np.fromiter((bar.close_price for bar in bars), dtype=np.float64, count=count),
+        'volume': np.fromiter((bar.volume for bar in bars), dtype=np.float64, count=count),
+    }
+
+
+def find_runs(mask: np.ndarray, min_length: int) -> np.ndarray:
+    """
+    mask里面连续为True的区间, 返回长度不小于min_length的 [[开始的下标, 结束的下标(包含)], ...].
+    """
+    padded = np.concatenate(([False], mask, [False])).astype(np.int8)
+    changes = np.flatnonzero(np.diff(padded))
+    starts, ends = changes[0::2], changes[1::2] - 1
+    keep = ends - starts + 1 >= min_length
+    return np.column_stack((starts[keep], ends[keep]))
+
+
+def validate_bars(data: Dict[str, np.ndarray], interval: str,
+                  zero_volume_run: int = ZERO_VOLUME_RUN) -> Dict[str, np.ndarray]:
+    """
+    检查K线数组, interval是币安的周期(如1m, 4h, 不支持月线1M), 返回每种问题对应的时间戳(毫秒):
+    unordered: 比前一根K线时间还早的K线.
+    duplicated: 重复的K线(排序之后跟前一根时间一样).
+    misaligned: 时间没有对齐到周期的K线.
+    gaps: 缺失的区间 [[缺失的第一根K线的时间, 缺失的最后一根K线的时间], ...].
+    bad_ohlc: 开高低收不合理的K线.
+    zero_volume: 连续成交量为0的区间 [[开始时间, 结束时间], ...].
+    """
+    interval_ms = BINANCE_INTERVALS[interval]
+    offset_ms = INTERVAL_OFFSET_MS.get(interval, 0)
+    timestamp = data['timestamp']
+
+    unordered = timestamp[1:][np.diff(timestamp) < 0]
+
+    order = np.argsort(timestamp, kind='stable')
+    sorted_timestamp = timestamp[order]
+    same = np.diff(sorted_timestamp) == 0
+    duplicated = np.unique(sorted_timestamp[1:][same])
+
+    # 后面的检查都用排序去重之后的数据, 重复的保留最后保存的那一根.
+    last = np.concatenate((~same, [True]))
+    index = order[last]
+    timestamp = timestamp[index]
+    open_price, high_price = data['open'][index], data['high'][index]
+    low_price, close_price = data['low'][index], data['close'][index]
+    volume = data['volume'][index]
+
+    aligned = (timestamp - offset_ms) % interval_ms == 0
+    misaligned = timestamp[~aligned]
+
+    # 没有对齐的K线不算, 它本来的位置也算缺失.
+    aligned_timestamp = timestamp[aligned]
+    gap_index = np.flatnonzero(np.diff(aligned_timestamp) > interval_ms)
+    gaps = np.column_stack((aligned_timestamp[gap_index] + interval_ms, aligned_timestamp[gap_index + 1] - interval_ms))
+
+    with np.errstate(invalid='ignore'):
+        bad = (
+            ~np.isfinite(open_price) | ~np.isfinite(high_price) | ~np.isfinite(low_price) | ~np.isfinite(close_price)
+            | (low_price <= 0)
+            | (high_price < np.maximum(open_price, close_price))
+            | (low_price > np.minimum(open_price, close_price))
+            | (high_price < low_price)
+            | (volume < 0)
+        )
+    bad_ohlc = timestamp[bad]
+
+    runs = find_runs(volume == 0, zero_volume_run)
+    zero_volume = np.column_stack((timestamp[runs[:, 0]], timestamp[runs[:, 1]])) if len(runs) \
+        else np.zeros((0, 2), dtype=np.int64)
+
+    return {
+        'unordered': unordered,
+        'duplicated': duplicated,
+        'misaligned': misaligned,
+        'gaps': gaps.reshape(-1, 2),
+        'bad_ohlc': bad_ohlc,
+        'zero_volume': zero_volume,
+    }
+
+
+def merge_day_ranges(ranges: List[List[int]]) -> List[List[datetime]]:
+    """
+    把毫秒时间的区间扩展到整天, 再合并重叠和相邻的区间, get_binance_data的时间只精确到天.
+    get_binance_data按本机的时区解析日期, 这里也用本机的时区.
+    """
+    days = []
+    for start, end in sorted(ranges):
+        start_day = datetime.fromtimestamp(start / 1000).replace(hour=0, minute=0, second=0, microsecond=0)
+        end_day = datetime.fromtimestamp(end / 1000).replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+
+        if days and start_day <= days[-1][1]:
+            days[-1][1] = max(days[-1][1], end_day)
+        else:
+            days.append([start_day, end_day])
+    return days
+
+
+def make_repair_plan(symbol: str, interval: str, issues: Dict[str, np.ndarray]) -> List[dict]:
+    """
+    生成修复计划:
+    download: 重新下载缺失、开高低收不合理、时间没有对齐的K线所在的天, 数据库保存的时候会覆盖同一时间的K线.
+    deduplicate: 有重复或者顺序不对的时候, 按时间去重排序. 数据库按时间覆盖保存, 只有csv文件需要.
+    zero_volume 只提示, 不一定是数据的问题(比如交易所维护或者没有成交).
+    """
+    plan = []
+
+    ranges = [[int(start), int(end)] for start, end in issues['gaps']]
+    for key in ('bad_ohlc', 'misaligned'):
+        ranges.extend([int(t), int(t)] for t in issues[key])
+
+    for start, end in merge_day_ranges(ranges):
+        plan.append({
+            'action': 'download',
+            'symbol': symbol,
+            'exchanges': get_exchanges(symbol),
+            'interval': interval,
+            'start': start.strftime('%Y-%m-%d'),
+            'end': end.strftime('%Y-%m-%d'),
+        })
+
+    if len(issues['duplicated']) or len(issues['unordered']):
+        plan.append({
+            'action': 'deduplicate',
+            'symbol': symbol,
+            'interval': interval,
+            'count': int(len(issues['duplicated'])),
+        })
+
+    for start, end in issues['zero_volume']:
+        plan.append({
+            'action': 'check_zero_volume',
+            'symbol': symbol,
+            'start': str(datetime.fromtimestamp(start / 1000, CHINA_TZ)),
+            'end': str(datetime.fromtimestamp(end / 1000, CHINA_TZ)),
+        })
+
+    return plan
+
+
+def deduplicate_bars(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    按datetime去重(保留最后保存的)并排序.
+    """
+    df = df.assign(timestamp=pd.to_datetime(df['datetime'], utc=True))
+    df = df.drop_duplicates(subset='timestamp', keep='last').sort_values('timestamp', kind='stable')
+    return df.drop(columns='timestamp').reset_index(drop=True)
+
+
+def run_repair_plan(plan: List[dict], proxies: dict = None) -> None:
+    """
+    执行修复计划里面的下载, 用crawl_data.py的get_binance_data重新下载, 保存的时候覆盖原来的K线.
+    """
+    crawl_data.proxies = proxies
+
+    for item in plan:
+        if item['action'] == 'download':
+            print(f"重新下载: {item['symbol']} {item['interval']} {item['start']} - {item['end']}")
+            crawl_data.get_binance_data(
+                item['symbol'].upper(), item['exchanges'], item['start'], item['end'], item['interval']
+            )
+        elif item['action'] == 'deduplicate':
+            file_name = f"{item['symbol']}_{item['interval']}.csv"
+            if os.path.exists(file_name):
+                print(f"去重排序: {file_name}")
+                with crawl_data.csv_lock:
+                    deduplicate_bars(pd.read_csv(file_name)).to_csv(file_name, index=False)
+        elif item['action'] == 'check_zero_volume':
+            print(f"连续成交量为0: {item['symbol']} {item['start']} - {item['end']}")
+
+
+def check_database(symbol: str, interval: Interval, start: datetime, end: datetime) -> List[dict]:
+    """
+    检查数据库里面一个交易对的K线, 打印每种问题的数量, 返回修复计划.
+    """
+    bars = database_manager.load_bar_data(symbol, Exchange.BINANCE, interval, start, end)
+    print(f"{symbol} K线数量: {len(bars)}")
+    if not bars:
+        return []
+
+    return check_arrays(symbol, BINANCE_INTERVAL_NAMES[interval], bars_to_arrays(bars))
+
+
+def check_csv(symbol: str, interval: str) -> List[dict]:
+    """
+    检查crawl_data.py保存的csv文件(symbol_interval.csv, 比如btcusdt_4h.csv), 返回修复计划.
+    """
+    df = pd.read_csv(f'{symbol}_{interval}.csv')
+    print(f"{symbol} {interval} K线数量: {len(df)}")
+    if df.empty:
+        return []
+
+    data = {
+        'timestamp': pd.to_datetime(df['datetime'], utc=True).values.astype('datetime64[ms]').astype(np.int64),
+        'open': df['open'].values.astype(np.float64),
+        'high': df['high'].values.astype(np.float64),
+        'low': df['low'].values.astype(np.float64),
+        'close': df['close'].values.astype(np.float64),
+        'volume': df['volume'].values.astype(np.float64),
+    }
+    return check_arrays(symbol, interval, data)
+
+
+def check_arrays(symbol: str, interval: str, data: Dict[str, np.ndarray]) -> List[dict]:
+    """"""
+    issues = validate_bars(data, interval)
+    for key, value in issues.items():
+        print(f"{key}: {len(value)}")
+
+    return make_repair_plan(symbol, interval, issues)
+
+
+if __name__ == '__main__':
+
+    # 跟crawl_data.py一样, 如果你有代理你就设置，如果没有你就设置为 None 或者空的字符串 "".
+    proxy_host = ""
+    proxy_port = 0
+
+    proxies = None
+    if proxy_host and proxy_port:
+        proxy = f'http://{proxy_host}:{proxy_port}'
+        proxies = {'http': proxy, 'https': proxy}
+
+    plan = check_database("btcusdt", Interval.MINUTE, datetime(2018, 1, 1), datetime(2020, 12, 1))  # 现货的数据
+    # plan = check_database("BTCUSDT", Interval.MINUTE, datetime(2019, 9, 10), datetime(2020, 12, 1))  # 合约的数据
+    # plan = check_csv("btcusdt", "4h")  # 保存在csv文件里面的4小时K线
+
+    for item in plan:
+        print(item)
+
+    # run_repair_plan(plan, proxies)  # 确认之后再执行修复
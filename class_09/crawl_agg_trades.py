@@ -0,0 +1,179 @@
+"""
+    下载币安的归集成交(aggTrades), 用来合成成交量K线、成交额K线、买卖不平衡K线和足迹图(footprint), 参考 trade_bars.py.
+
+    1. 按天下载, 每天的成交保存成一个numpy文件(.howtrader/agg_trades/btcusdt/20210101.npy), 已经下载过的天不会重复下载.
+    2. 第一次请求用startTime找到当天的第一笔成交, 后面用fromId一页一页往后翻, 不会漏也不会重复.
+    3. iter_agg_trades 按天、按块读取(mmap), 一次只有一块数据在内存里面, 几个月的成交也能处理.
+
+    每一笔成交: agg_id, time(毫秒), price, volume, is_buyer_maker(True表示主动卖出).
+"""
+
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Iterator, List
+
+import numpy as np
+import requests
+
+from howtrader.trader.utility import get_folder_path
+
+BINANCE_AGG_TRADES_LIMIT = 1000
+
+AGG_TRADES_URLS = {
+    'spot': 'https://api.binance.com/api/v3/aggTrades',
+    'future': 'https://fapi.binance.com/fapi/v1/aggTrades',
+    'coin_future': 'https://dapi.binance.com/dapi/v1/aggTrades',
+}
+
+TRADE_DTYPE = np.dtype([
+    ('agg_id', np.int64),
+    ('time', np.int64),
+    ('price', np.float64),
+    ('volume', np.float64),
+    ('is_buyer_maker', np.bool_),
+])
+
+DAY_MS = 86400 * 1000
+HOUR_MS = 3600 * 1000
+
+proxies = None
+
+
+def get_day_file(symbol: str, day: datetime) -> str:
+    """"""
+    folder = os.path.join(str(get_folder_path('agg_trades')), symbol)
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, f"{day.strftime('%Y%m%d')}.npy")
+
+
+def request_agg_trades(url: str, params: dict) -> list:
+    """
+    请求出错的时候等10秒重试, 跟crawl_data.py一样.
+    """
+    while True:
+        try:
+            data = requests.get(url, params=params, timeout=10, proxies=proxies).json()
+            if isinstance(data, list):
+                return data
+            print(f"请求出错: {data}")
+        except Exception as error:
+            print(error)
+        time.sleep(10)
+
+
+def to_array(data: list) -> np.ndarray:
+    """
+    [
+        {
+            "a": 26129,         // 归集成交ID
+            "p": "0.01633102",  // 成交价
+            "q": "4.70443515",  // 成交量
+            "f": 27781,         // 被归集的首个成交ID
+            "l": 27781,         // 被归集的末个成交ID
+            "T": 1498793709153, // 成交时间
+            "m": true,          // 是否为主动卖出单
+            "M": true           // 是否为最优撮合单(可忽略)
+        }
+    ]
+    """
+    trades = np.zeros(len(data), dtype=TRADE_DTYPE)
+    trades['agg_id'] = [d['a'] for d in data]
+    trades['time'] = [d['T'] for d in data]
+    trades['price'] = [float(d['p']) for d in data]
+    trades['volume'] = [float(d['q']) for d in data]
+    trades['is_buyer_maker'] = [d['m'] for d in data]
+    return trades
+
+
+def download_day(symbol: str, exchanges: str, day: datetime) -> int:
+    """
+    下载一天(UTC时间)的归集成交, 返回成交的笔数.
+    """
+    url = AGG_TRADES_URLS[exchanges]
+    day_start = int(day.timestamp() * 1000)
+    day_end = day_start + DAY_MS
+
+    # startTime和endTime之间不能超过1小时, 一个小时一个小时找当天的第一笔成交.
+    first = []
+    for hour_start in range(day_start, day_end, HOUR_MS):
+        first = request_agg_trades(url, {
+            'symbol': symbol, 'startTime': hour_start, 'endTime': hour_start + HOUR_MS - 1, 'limit': 1
+        })
+        if first:
+            break
+
+    chunks: List[np.ndarray] = []
+    if first:
+        from_id = first[0]['a']
+        while True:
+            data = request_agg_trades(url, {'symbol': symbol, 'fromId': from_id, 'limit': BINANCE_AGG_TRADES_LIMIT})
+            if not data:
+                break
+
+            trades = to_array(data)
+            chunks.append(trades[trades['time'] < day_end])
+
+            if data[-1]['T'] >= day_end or len(data) < BINANCE_AGG_TRADES_LIMIT:
+                break
+            from_id = data[-1]['a'] + 1
+
+    trades = np.concatenate(chunks) if chunks else np.zeros(0, dtype=TRADE_DTYPE)
+
+    # 先写临时文件再替换, 下载中断的时候不会留下不完整的文件.
+    file_path = get_day_file(symbol.lower() if exchanges == 'spot' else symbol, day)
+    temp_path = file_path + '.tmp.npy'
+    np.save(temp_path, trades)
+    os.replace(temp_path, file_path)
+    return len(trades)
+
+
+def download_agg_trades(symbol: str, exchanges: str, start_date: str, end_date: str) -> None:
+    """
+    下载[start_date, end_date)每一天的归集成交, 日期格式: 2021-1-1, 已经下载过的天跳过, 今天的还没有结束不下载.
+    :param symbol: BTCUSDT, 币本位合约如: BTCUSD_PERP.
+    :param exchanges: spot, future, coin_future
+    """
+    if exchanges not in AGG_TRADES_URLS:
+        raise Exception('交易所名称请输入以下其中一个：spot, future, coin_future')
+
+    day = datetime.strptime(start_date, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+    end = datetime.strptime(end_date, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+    today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    save_symbol = symbol.lower() if exchanges == 'spot' else symbol
+
+    while day < min(end, today):
+        if not os.path.exists(get_day_file(save_symbol, day)):
+            count = download_day(symbol, exchanges, day)
+            print(f"{save_symbol} {day.strftime('%Y-%m-%d')}: {count}笔成交")
+        day += timedelta(days=1)
+
+
+def iter_agg_trades(symbol: str, start_date: str, end_date: str, chunk_size: int = 1000000) -> Iterator[np.ndarray]:
+    """
+    按时间顺序一块一块读取[start_date, end_date)的归集成交, 每块最多chunk_size笔, 没有下载的天跳过.
+    """
+    day = datetime.strptime(start_date, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+    end = datetime.strptime(end_date, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+
+    while day < end:
+        file_path = get_day_file(symbol, day)
+        if os.path.exists(file_path):
+            trades = np.load(file_path, mmap_mode='r')
+            for start in range(0, len(trades), chunk_size):
+                yield np.array(trades[start:start + chunk_size])
+        day += timedelta(days=1)
+
+
+if __name__ == '__main__':
+
+    # 如果你有代理你就设置，如果没有你就设置为 None 或者空的字符串 "",
+    proxy_host = ""  # 如果没有就设置为"", 如果有就设置为你的代理主机如：127.0.0.1
+    proxy_port = 0  # 设置你的代理端口号如: 1087, 没有你修改为0,但是要保证你能访问api.binance.com这个主机。
+
+    if proxy_host and proxy_port:
+        proxy = f'http://{proxy_host}:{proxy_port}'
+        proxies = {'http': proxy, 'https': proxy}
+
+    download_agg_trades("BTCUSDT", "spot", "2021-1-1", "2021-1-8")  # 保存为btcusdt
+    # download_agg_trades("BTCUSDT", "future", "2021-1-1", "2021-1-8")
@@ -0,0 +1,137 @@
+"""
+    K线的列式存储, 保存币安K线的所有字段.
+
+    数据库里面的BarData只有开高低收和成交量, 币安的K线还有成交额、成交笔数、主动买入的成交量和成交额,
+    研究订单流(比如马丁策略V3的入场过滤)需要这些字段。
+
+    每个交易对、每个周期一个目录(.howtrader/klines/btcusdt_1m), 每一列一个numpy文件, 按开盘时间排序去重:
+    open_time, open, high, low, close, volume, quote_volume, trade_count, taker_buy_volume, taker_buy_quote_volume.
+    读取的时候用 mmap_mode="r", 不会一次读到内存里面.
+
+    crawl_data.py 下载K线的时候会同时保存到这里, 也可以单独使用:
+
+    store = KlineStore.get_store("btcusdt", "1m")
+    store.append(data)  # 币安K线接口返回的列表
+    store.save()
+    df = store.get_dataframe()
+"""
+
+import os
+from threading import Lock
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from howtrader.trader.utility import get_folder_path
+
+# 列名: (币安K线数组里面的下标, 类型)
+COLUMNS = {
+    "open_time": (0, np.int64),
+    "open": (1, np.float64),
+    "high": (2, np.float64),
+    "low": (3, np.float64),
+    "close": (4, np.float64),
+    "volume": (5, np.float64),
+    "quote_volume": (7, np.float64),
+    "trade_count": (8, np.int64),
+    "taker_buy_volume": (9, np.float64),
+    "taker_buy_quote_volume": (10, np.float64),
+}
+
+
+class KlineStore(object):
+    """
+    一个交易对一个周期的K线列式存储.
+    """
+
+    _stores: Dict[Tuple[str, str], "KlineStore"] = {}
+    _stores_lock: Lock = Lock()
+
+    @classmethod
+    def get_store(cls, symbol: str, interval: str) -> "KlineStore":
+        """
+        同一个交易对、同一个周期共用一个存储, 多个线程下载同一个交易对的时候数据会合并到一起.
+        """
+        with cls._stores_lock:
+            store = cls._stores.get((symbol, interval), None)
+            if not store:
+                store = KlineStore(symbol, interval)
+                cls._stores[(symbol, interval)] = store
+            return store
+
+    def __init__(self, symbol: str, interval: str, path: str = ""):
+        """"""
+        self.symbol: str = symbol
+        self.interval: str = interval
+        self.path: str = path or os.path.join(str(get_folder_path("klines")), f"{symbol}_{interval}")
+        os.makedirs(self.path, exist_ok=True)
+
+        self.columns: Dict[str, np.ndarray] = {name: np.zeros(0, dtype=dtype) for name, (_, dtype) in COLUMNS.items()}
+        self.pending: List[Dict[str, np.ndarray]] = []
+        self.lock: Lock = Lock()
+
+        self.load()
+
+    def load(self) -> None:
+        """"""
+        if not os.path.exists(os.path.join(self.path, "open_time.npy")):
+            return
+
+        for name in COLUMNS:
+            self.columns[name] = np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode="r")
+
+    def append(self, data: list) -> None:
+        """
+        添加币安K线接口返回的数据, 调用save的时候再合并排序, 可以在多个线程里面调用.
+        """
+        if not data:
+            return
+
+        rows = np.array(data, dtype=object)
+        arrays = {name: rows[:, index].astype(np.float64).astype(dtype) for name, (index, dtype) in COLUMNS.items()}
+
+        with self.lock:
+            self.pending.append(arrays)
+
+    def save(self) -> None:
+        """
+        把新的数据合并进来, 按开盘时间排序去重(保留最新的), 然后写到文件.
+        """
+        with self.lock:
+            if not self.pending:
+                return
+
+            pending, self.pending = self.pending, []
+
+            merged = {
+                name: np.concatenate([np.asarray(self.columns[name])] + [arrays[name] for arrays in pending])
+                for name in COLUMNS
+            }
+
+            # 新数据在后面, 稳定排序之后同一个时间的最后一条就是最新的数据.
+            order = np.argsort(merged["open_time"], kind="stable")
+            merged = {name: array[order] for name, array in merged.items()}
+
+            keep = np.ones(len(order), dtype=bool)
+            keep[:-1] = merged["open_time"][1:] != merged["open_time"][:-1]
+            merged = {name: array[keep] for name, array in merged.items()}
+
+            self.columns = merged  # 先释放mmap打开的旧文件, windows下面才能覆盖.
+            for name, array in merged.items():
+                np.save(os.path.join(self.path, f"{name}.npy"), array)
+
+    def get_columns(self, start_time: int = 0, end_time: int = 0) -> Dict[str, np.ndarray]:
+        """
+        按开盘时间(毫秒)过滤, 返回每一列的数组.
+        """
+        open_time = self.columns["open_time"]
+        left = np.searchsorted(open_time, start_time, side="left") if start_time else 0
+        right = np.searchsorted(open_time, end_time, side="right") if end_time else len(open_time)
+        return {name: np.asarray(array[left:right]) for name, array in self.columns.items()}
+
+    def get_dataframe(self, start_time: int = 0, end_time: int = 0) -> pd.DataFrame:
+        """"""
+        df = pd.DataFrame(self.get_columns(start_time, end_time))
+        df["datetime"] = pd.to_datetime(df["open_time"], unit="ms", utc=True).dt.tz_convert("Asia/Shanghai")
+        return df.set_index("datetime")
@@ -0,0 +1,233 @@
+"""
+    用归集成交(crawl_agg_trades.py)合成不按时间划分的K线和足迹图.
+
+    1. VolumeBarBuilder: 成交量每达到threshold就生成一根K线.
+    2. DollarBarBuilder: 成交额(价格*数量)每达到threshold就生成一根K线, 价格涨跌很大的时候比成交量K线稳定.
+    3. ImbalanceBarBuilder: 主动买入减去主动卖出的成交量(的绝对值)达到threshold就生成一根K线,
+       买卖力量一边倒的时候K线生成得快, 可以用来研究马丁策略V3的拉盘入场是不是有真实的主动买入.
+    4. FootprintBuilder: 按时间周期和价格档位统计主动买入和主动卖出的成交量(足迹图).
+
+    所有的合成器都是流式的: 每次 update 传入一块成交(iter_agg_trades读取的), 返回这块数据里面已经完成的K线,
+    没有完成的那根K线的成交留到下一块, 内存里面最多只有一块数据加上一根K线的成交. 最后调用 flush 返回最后一根没完成的K线.
+
+    使用方法:
+
+    builder = VolumeBarBuilder(threshold=100)
+    for trades in iter_agg_trades("btcusdt", "2021-1-1", "2021-1-8"):
+        df = builder.update(trades)
+    df = builder.flush()
+"""
+
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+from crawl_agg_trades import TRADE_DTYPE
+
+BAR_COLUMNS = ["datetime", "open", "high", "low", "close", "volume", "turnover", "buy_volume", "trade_count"]
+
+
+class TradeBarBuilder(object):
+    """
+    按成交合成K线的基类, 子类实现 find_bar_ends.
+    """
+
+    def __init__(self, threshold: float):
+        """"""
+        self.threshold: float = threshold
+        self.carry: np.ndarray = np.zeros(0, dtype=TRADE_DTYPE)  # 还没有完成的那根K线的成交.
+
+    def find_bar_ends(self, trades: np.ndarray) -> np.ndarray:
+        """
+        trades从一根新K线的第一笔成交开始, 返回每一根完成的K线最后一笔成交的下标.
+        """
+        raise NotImplementedError
+
+    def update(self, trades: np.ndarray) -> pd.DataFrame:
+        """
+        传入一块按时间排序的成交, 返回已经完成的K线.
+        """
+        trades = np.concatenate((self.carry, trades)) if len(self.carry) else np.asarray(trades)
+        ends = self.find_bar_ends(trades)
+
+        if not len(ends):
+            self.carry = trades
+            return pd.DataFrame(columns=BAR_COLUMNS)
+
+        self.carry = trades[ends[-1] + 1:]
+        return aggregate_bars(trades[:ends[-1] + 1], ends)
+
+    def flush(self) -> pd.DataFrame:
+        """
+        最后一根还没有达到threshold的K线.
+        """
+        trades, self.carry = self.carry, np.zeros(0, dtype=TRADE_DTYPE)
+        if not len(trades):
+            return pd.DataFrame(columns=BAR_COLUMNS)
+        return aggregate_bars(trades, np.array([len(trades) - 1]))
+
+
+class VolumeBarBuilder(TradeBarBuilder):
+    """
+    成交量K线.
+    """
+
+    def get_values(self, trades: np.ndarray) -> np.ndarray:
+        """"""
+        return trades["volume"]
+
+    def find_bar_ends(self, trades: np.ndarray) -> np.ndarray:
+        """
+        累计值是递增的, 每根K线用二分查找找到累计值达到threshold的那一笔, 每根K线从0开始累计.
+        """
+        cumsum = np.cumsum(self.get_values(trades))
+        ends: List[int] = []
+        base = 0.0
+
+        while True:
+            end = int(np.searchsorted(cumsum, base + self.threshold, side="left"))
+            if end >= len(cumsum):
+                break
+            ends.append(end)
+            base = cumsum[end]
+
+        return np.array(ends, dtype=np.int64)
+
+
+class DollarBarBuilder(VolumeBarBuilder):
+    """
+    成交额K线.
+    """
+
+    def get_values(self, trades: np.ndarray) -> np.ndarray:
+        """"""
+        return trades["price"] * trades["volume"]
+
+
+class ImbalanceBarBuilder(TradeBarBuilder):
+    """
+    买卖不平衡K线: 主动买入为正, 主动卖出为负, 累计的绝对值达到threshold生成一根K线.
+    """
+
+    def find_bar_ends(self, trades: np.ndarray) -> np.ndarray:
+        """
+        累计值有正有负不能二分查找, 每根K线先在一小段里面找, 找不到再把范围扩大一倍, 总的计算量跟成交的笔数成正比.
+        """
+        signed = np.where(trades["is_buyer_maker"], -trades["volume"], trades["volume"])
+        cumsum = np.cumsum(signed)
+        ends: List[int] = []
+        start = 0
+        base = 0.0
+        window = 1024
+
+        while start < len(cumsum):
+            segment = np.abs(cumsum[start:start + window] - base) >= self.threshold
+            if segment.any():
+                end = start + int(np.argmax(segment))
+                ends.append(end)
+                base = cumsum[end]
+                window = max(1024, (end + 1 - start) * 2)  # 下一根K线的长度差不多, 从两倍长度开始找.
+                start = end + 1
+            elif start + window >= len(cumsum):
+                break
+            else:
+                window *= 2
+
+        return np.array(ends, dtype=np.int64)
+
+
+class FootprintBuilder(object):
+    """
+    足迹图: 每个时间周期、每个价格档位的主动买入和主动卖出的成交量.
+    """
+
+    def __init__(self, interval_ms: int = 60 * 1000, price_step: float = 1.0):
+        """
+        interval_ms是时间周期(毫秒), price_step是价格档位的大小.
+        """
+        self.interval_ms: int = interval_ms
+        self.price_step: float = price_step
+        self.carry: np.ndarray = np.zeros(0, dtype=TRADE_DTYPE)
+
+    def update(self, trades: np.ndarray) -> pd.DataFrame:
+        """
+        返回已经结束的时间周期的足迹, 最后一个周期可能还有成交, 留到下一块.
+        """
+        trades = np.concatenate((self.carry, trades)) if len(self.carry) else np.asarray(trades)
+        if not len(trades):
+            return self.aggregate(trades)
+
+        last_bar = trades["time"][-1] // self.interval_ms
+        finished = trades["time"] // self.interval_ms < last_bar
+        self.carry = trades[~finished]
+        return self.aggregate(trades[finished])
+
+    def flush(self) -> pd.DataFrame:
+        """"""
+        trades, self.carry = self.carry, np.zeros(0, dtype=TRADE_DTYPE)
+        return self.aggregate(trades)
+
+    def aggregate(self, trades: np.ndarray) -> pd.DataFrame:
+        """
+        每一行是一个(周期, 价格档位), 按周期和价格排序.
+        """
+        bar = trades["time"] // self.interval_ms
+        level = np.floor(trades["price"] / self.price_step).astype(np.int64)
+
+        # (周期, 档位)合成一个整数再去重, 比按行去重快很多.
+        min_level = level.min() if len(level) else 0
+        level_count = level.max() - min_level + 1 if len(level) else 1
+        keys = bar * level_count + (level - min_level)
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+
+        sell = trades["is_buyer_maker"]
+        buy_volume = np.bincount(inverse, weights=np.where(sell, 0.0, trades["volume"]), minlength=len(unique_keys))
+        sell_volume = np.bincount(inverse, weights=np.where(sell, trades["volume"], 0.0), minlength=len(unique_keys))
+
+        bar_time = unique_keys // level_count * self.interval_ms
+        return pd.DataFrame({
+            "datetime": pd.to_datetime(bar_time, unit="ms", utc=True).tz_convert("Asia/Shanghai"),
+            "price": (unique_keys % level_count + min_level) * self.price_step,
+            "buy_volume": buy_volume,
+            "sell_volume": sell_volume,
+            "delta": buy_volume - sell_volume,
+        })
+
+
+def aggregate_bars(trades: np.ndarray, ends: np.ndarray) -> pd.DataFrame:
+    """
+    把成交按每根K线最后一笔的下标ends合成开高低收.
+    """
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    price, volume = trades["price"], trades["volume"]
+    buy_volume = np.where(trades["is_buyer_maker"], 0.0, volume)
+
+    return pd.DataFrame({
+        "datetime": pd.to_datetime(trades["time"][starts], unit="ms", utc=True).tz_convert("Asia/Shanghai"),
+        "open": price[starts],
+        "high": np.maximum.reduceat(price, starts),
+        "low": np.minimum.reduceat(price, starts),
+        "close": price[ends],
+        "volume": np.add.reduceat(volume, starts),
+        "turnover": np.add.reduceat(price * volume, starts),
+        "buy_volume": np.add.reduceat(buy_volume, starts),
+        "trade_count": ends - starts + 1,
+    })
+
+
+if __name__ == '__main__':
+    from crawl_agg_trades import iter_agg_trades
+
+    builder = ImbalanceBarBuilder(threshold=50)
+    footprint = FootprintBuilder(interval_ms=60 * 1000, price_step=10)
+    bars, footprints = [], []
+
+    for trades in iter_agg_trades("btcusdt", "2021-1-1", "2021-1-8"):
+        bars.append(builder.update(trades))
+        footprints.append(footprint.update(trades))
+    bars.append(builder.flush())
+    footprints.append(footprint.flush())
+
+    print(pd.concat(bars, ignore_index=True))
+    print(pd.concat(footprints, ignore_index=True))
@@ -5,7 +5,6 @@ from howtrader.app.cta_strategy import (
     BarData,
     TradeData,
     OrderData,
-    BarGenerator,
     ArrayManager
 )
 
@@ -14,6 +13,9 @@ from datetime import datetime
 from howtrader.app.cta_strategy.engine import CtaEngine, EngineType
 import pandas_ta as ta
 import pandas as pd
+from typing import List
+
+from strategies.bar_service import BarService, BarSubscription
 
 # 记得修改你的文件的类名
 class Class11SimpleStrategy(CtaTemplate):
@@ -23,10 +25,9 @@ class Class11SimpleStrategy(CtaTemplate):
     def __init__(self, cta_engine: CtaEngine, strategy_name, vt_symbol, setting):
         """"""
         super().__init__(cta_engine, strategy_name, vt_symbol, setting)
-        self.bg2 = BarGenerator(self.on_bar, 2, self.on_2min_bar, Interval.MINUTE)
-        self.bg5 = BarGenerator(self.on_bar, 5, self.on_5min_bar, Interval.MINUTE)
-        self.bg_1hour = BarGenerator(self.on_bar, 1, self.on_1hour_bar, Interval.HOUR)
-        self.bg_4hour = BarGenerator(self.on_bar, 4, self.on_4hour_bar, Interval.HOUR)
+        # 2分钟, 5分钟, 1小时, 4小时的K线由交易对共享的服务合成, 同一个交易对的策略只合成一次.
+        self.bar_service = BarService.get_service(cta_engine, vt_symbol)
+        self.bar_subscriptions: List[BarSubscription] = []
 
         self.place_order = False
         self.orders = []
@@ -37,13 +38,29 @@ class Class11SimpleStrategy(CtaTemplate):
         Callback when strategy is inited.
         """
         self.write_log("策略初始化")
+        self.subscribe_window_bars()  # 在初始化的时候订阅, 跟以前在__init__里面创建BarGenerator一样.
 
+    def subscribe_window_bars(self):
+        """
+        订阅2分钟、5分钟、1小时和4小时的K线.
+        """
+        self.bar_subscriptions.append(self.bar_service.subscribe(2, Interval.MINUTE, self.on_2min_bar))
+        self.bar_subscriptions.append(self.bar_service.subscribe(5, Interval.MINUTE, self.on_5min_bar))
+        self.bar_subscriptions.append(self.bar_service.subscribe(1, Interval.HOUR, self.on_1hour_bar))
+        self.bar_subscriptions.append(self.bar_service.subscribe(4, Interval.HOUR, self.on_4hour_bar))
 
     def on_start(self):
         """
         Callback when strategy is started.
         """
         self.write_log(f"我的策略启动, {self.trading}")
+
+        if not self.bar_subscriptions:
+            self.subscribe_window_bars()  # 停止之后重新启动.
+
+        if self.bar_service.shared:
+            self.bar_subscriptions.append(self.bar_service.subscribe(1, Interval.MINUTE, self.on_bar))
+
         self.put_event()
 
 
@@ -53,6 +70,10 @@ class Class11SimpleStrategy(CtaTemplate):
         """
         self.write_log("策略停止")
 
+        for subscription in self.bar_subscriptions:
+            subscription.cancel()
+        self.bar_subscriptions.clear()
+
         self.put_event()
 
 
@@ -80,9 +101,8 @@ class Class11SimpleStrategy(CtaTemplate):
         Callback of new bar data update.
         """
         print("1分钟的K线数据", bar)
-        self.bg2.update_bar(bar)
-        self.bg5.update_bar(bar)  # 合成2分钟的K线
-        self.bg_1hour.update_bar(bar)  # 合成一小时的数据。
+        if not self.bar_service.shared:
+            self.bar_service.update_bar(bar)  # 回测的时候自己推送1分钟K线, 合成其他周期的K线。
         self.put_event()
 
     def on_2min_bar(self, bar: BarData):
@@ -0,0 +1,230 @@
+"""
+    定投的向量化模拟, 不需要用BacktestingEngine一根一根K线回测.
+
+    1. 基于时间的定投(FixedTradeTimeStrategy): 每周固定的几个时间(周几, 几点)的1小时K线收盘买入固定的金额,
+       比如周四15点和周五16点: [(4, 15), (5, 16)], 周几跟isoweekday一样, 周一是1.
+    2. 基于价格的定投(FixedTradPriceStrategy): 4小时K线比上一根K线下跌超过price_change_pct就买入固定的金额.
+
+    所有的配置放在一个矩阵里面(配置, K线)一起算: 每根K线买多少钱, 累计投入、累计买到的币、持仓的市值都是累加和,
+    一个交易对3年的1小时K线、几百个配置一秒以内就算完。每次定投的金额只是把结果等比例放大, 所以不同金额不需要重新算.
+
+    结果的每一行是一个(交易对, 配置, 金额):
+    buy_count 买入次数, invested 投入的资金, coins 买到的币, cost_basis 平均成本, final_value 最后的市值,
+    pnl 盈亏, total_return 收益率, max_drawdown 盈亏曲线的最大回撤, max_ddpercent 最大回撤占(当时投入的资金+最高的盈亏)的比例.
+
+    使用方法:
+
+    close = load_close_frame(["btcusdt", "ethusdt"], datetime(2018, 1, 1), datetime(2020, 12, 1))
+    simulator = DcaSimulator(close, fee_rate=1/1000)
+    df = simulator.run_time_schedules([[(4, 15), (5, 16)]], amounts=[1000])
+    df = simulator.run_price_thresholds([0.03, 0.05, 0.08], amounts=[1000])
+    curve = simulator.get_pnl_curve("btcusdt", schedule=[(4, 15), (5, 16)], amount=1000)
+"""
+
+from datetime import datetime
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+HOURS_OF_WEEK = 7 * 24
+
+# (isoweekday, hour)
+Slot = Tuple[int, int]
+
+
+def load_close_frame(symbols: Sequence[str], start: datetime, end: datetime) -> pd.DataFrame:
+    """
+    从数据库加载1小时K线的收盘价, 每一列是一个交易对, 时间是北京时间, 没有上线的时间是nan.
+    """
+    from howtrader.trader.constant import Exchange, Interval
+    from howtrader.trader.database import database_manager
+
+    columns: Dict[str, pd.Series] = {}
+    for symbol in symbols:
+        bars = database_manager.load_bar_data(symbol, Exchange.BINANCE, Interval.HOUR, start, end)
+        if not bars:
+            print(f"{symbol}没有1小时K线数据")
+            continue
+
+        close = pd.Series(
+            [bar.close_price for bar in bars],
+            index=pd.DatetimeIndex([bar.datetime for bar in bars]).tz_convert("Asia/Shanghai")
+        )
+        columns[symbol] = close[~close.index.duplicated(keep="last")]
+
+    return pd.DataFrame(columns).sort_index()
+
+
+def resample_close(close: pd.DataFrame, hours: int) -> pd.DataFrame:
+    """
+    1小时的收盘价合成hours小时的收盘价, 从每天0点开始划分.
+    """
+    return close.resample(pd.Timedelta(hours=hours)).last()
+
+
+def get_schedule_name(schedule: Sequence[Slot]) -> str:
+    """"""
+    return ",".join(f"{weekday}-{hour}" for weekday, hour in schedule)
+
+
+class DcaSimulator(object):
+    """
+    多个交易对、多个定投配置一起模拟.
+    """
+
+    def __init__(self, close: pd.DataFrame, fee_rate: float = 1 / 1000):
+        """
+        close: 1小时K线的收盘价, index是北京时间, 每一列是一个交易对.
+        """
+        self.close: pd.DataFrame = close
+        self.fee_rate: float = fee_rate
+
+    def get_time_signals(self, index: pd.DatetimeIndex, schedules: Sequence[Sequence[Slot]]) -> np.ndarray:
+        """
+        (配置, K线)矩阵, 1表示这根K线定投.
+        """
+        masks = np.zeros((len(schedules), HOURS_OF_WEEK))
+        for i, schedule in enumerate(schedules):
+            for weekday, hour in schedule:
+                masks[i, (weekday - 1) * 24 + hour] = 1
+
+        hour_of_week = index.dayofweek.values * 24 + index.hour.values  # dayofweek周一是0.
+        return masks[:, hour_of_week]
+
+    def get_price_signals(self, close: np.ndarray, thresholds: Sequence[float]) -> np.ndarray:
+        """
+        (配置, K线)矩阵, 比上一根K线下跌超过阈值的K线定投.
+        """
+        last_close = np.concatenate(([np.nan], close[:-1]))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            drop = (last_close - close) / last_close
+        drop = np.nan_to_num(drop, nan=-np.inf)
+        return (drop[None, :] >= np.asarray(thresholds, dtype=float)[:, None]).astype(float)
+
+    def simulate(self, close: np.ndarray, signals: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        每次定投1块钱, 返回每个配置的结果和曲线. 没有价格的K线不买.
+        """
+        valid = np.isfinite(close)
+        signals = signals * valid
+        price = pd.Series(close).ffill().fillna(0).values
+        unit_coins = np.where(valid, (1 - self.fee_rate) / np.where(valid, close, 1), 0)
+
+        cost = np.cumsum(signals, axis=1)
+        coins = np.cumsum(signals * unit_coins, axis=1)
+        pnl = coins * price - cost
+
+        high_pnl = np.maximum.accumulate(pnl, axis=1)
+        drawdown = high_pnl - pnl
+        with np.errstate(invalid="ignore", divide="ignore"):
+            ddpercent = np.where(cost > 0, drawdown / (cost + high_pnl), 0)  # 相对于投入的资金加上最高的盈亏.
+
+        invested = cost[:, -1]
+        final_coins = coins[:, -1]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            cost_basis = invested / final_coins
+            total_return = pnl[:, -1] / invested
+
+        return {
+            "buy_count": signals.sum(axis=1),
+            "invested": invested,
+            "coins": final_coins,
+            "cost_basis": cost_basis,
+            "final_value": final_coins * price[-1],
+            "pnl": pnl[:, -1],
+            "total_return": total_return,
+            "max_drawdown": drawdown.max(axis=1),
+            "max_ddpercent": ddpercent.max(axis=1),
+            "pnl_curve": pnl,
+        }
+
+    def get_result(self, symbol: str, names: Sequence[str], result: Dict[str, np.ndarray],
+                   amounts: Sequence[float], name_column: str) -> pd.DataFrame:
+        """
+        1块钱的结果按金额放大, 收益率和回撤比例不变.
+        """
+        frames = []
+        for amount in amounts:
+            frames.append(pd.DataFrame({
+                "symbol": symbol,
+                name_column: list(names),
+                "amount": amount,
+                "buy_count": result["buy_count"].astype(np.int64),
+                "invested": result["invested"] * amount,
+                "coins": result["coins"] * amount,
+                "cost_basis": result["cost_basis"],
+                "final_value": result["final_value"] * amount,
+                "pnl": result["pnl"] * amount,
+                "total_return": result["total_return"],
+                "max_drawdown": result["max_drawdown"] * amount,
+                "max_ddpercent": result["max_ddpercent"],
+            }))
+        return pd.concat(frames, ignore_index=True)
+
+    def run_time_schedules(self, schedules: Sequence[Sequence[Slot]], amounts: Sequence[float]) -> pd.DataFrame:
+        """
+        基于时间的定投, 每个schedule是一组(周几, 几点), 在这个小时的1小时K线收盘买入.
+        """
+        signals = self.get_time_signals(self.close.index, schedules)
+        names = [get_schedule_name(schedule) for schedule in schedules]
+
+        frames = []
+        for symbol in self.close.columns:
+            result = self.simulate(self.close[symbol].values, signals)
+            frames.append(self.get_result(symbol, names, result, amounts, "schedule"))
+        return pd.concat(frames, ignore_index=True)
+
+    def run_price_thresholds(self, thresholds: Sequence[float], amounts: Sequence[float],
+                             hours: int = 4) -> pd.DataFrame:
+        """
+        基于价格的定投, hours小时K线比上一根下跌超过阈值就在收盘买入.
+        """
+        close = resample_close(self.close, hours)
+
+        frames = []
+        for symbol in close.columns:
+            values = close[symbol].values
+            result = self.simulate(values, self.get_price_signals(values, thresholds))
+            frames.append(self.get_result(symbol, thresholds, result, amounts, "threshold"))
+        return pd.concat(frames, ignore_index=True)
+
+    def get_pnl_curve(self, symbol: str, amount: float, schedule: Sequence[Slot] = None,
+                      threshold: float = 0, hours: int = 4) -> pd.Series:
+        """
+        一个配置的盈亏曲线, 设置了schedule就是基于时间的定投, 否则是基于价格的定投.
+        """
+        if schedule:
+            close = self.close[symbol]
+            signals = self.get_time_signals(close.index, [schedule])
+        else:
+            close = resample_close(self.close[[symbol]], hours)[symbol]
+            signals = self.get_price_signals(close.values, [threshold])
+
+        result = self.simulate(close.values, signals)
+        return pd.Series(result["pnl_curve"][0] * amount, index=close.index)
+
+
+def get_all_slots() -> List[List[Slot]]:
+    """
+    每周的每一个小时单独作为一个配置, 一共168个.
+    """
+    return [[(weekday, hour)] for weekday in range(1, 8) for hour in range(24)]
+
+
+if __name__ == '__main__':
+    symbols = ["btcusdt", "ethusdt", "bnbusdt"]
+    close = load_close_frame(symbols, datetime(2018, 1, 1), datetime(2020, 12, 1))
+    simulator = DcaSimulator(close, fee_rate=1 / 1000)
+
+    # 课程里面的周四15点和周五16点, 跟每周每一个小时单独定投比较.
+    schedules = [[(4, 15), (5, 16)]] + get_all_slots()
+    df = simulator.run_time_schedules(schedules, amounts=[1000])
+    print(df[df["schedule"] == get_schedule_name([(4, 15), (5, 16)])])
+    print(df.sort_values("total_return", ascending=False).groupby("symbol").head(5))
+
+    df = simulator.run_price_thresholds(np.round(np.arange(0.01, 0.11, 0.01), 2), amounts=[1000, 2000])
+    print(df.sort_values("total_return", ascending=False).groupby("symbol").head(5))
+
+    curve = simulator.get_pnl_curve("btcusdt", amount=1000, schedule=[(4, 15), (5, 16)])
+    print(curve.tail())
@@ -0,0 +1,285 @@
+"""
+    按每周的小时(周一0点到周日23点, 一共168个)统计每个交易对的收益率、波动率和成交量, 用来挑选定投的时间和马丁策略的入场时间.
+
+    1. 每个(交易对, 周几几点)只保存累加值: K线个数、收益率之和、收益率平方之和、上涨的个数、成交量之和,
+       新的1小时K线来了只需要加上去, 不需要重新扫描历史数据.
+    2. 平均收益率、波动率、成交量比例(这个小时的平均成交量/所有小时的平均成交量)、上涨的比例在查询的时候才计算,
+       有新的K线之后第一次查询算一次(168 * 交易对的数量), 后面的查询只是数组的下标读取, 策略里面每根K线都可以调用.
+    3. 累加值保存在 .howtrader/seasonality 目录(stats.npy 和 index.json), 下次启动接着更新.
+    4. 时间都按北京时间计算, 跟K线的datetime一样.
+
+    使用方法:
+
+    index = SeasonalityIndex.get_index()
+    index.update_from_database(["btcusdt"], datetime(2018, 1, 1), datetime(2021, 1, 1))  # 第一次用历史数据初始化
+    index.save()
+
+    策略里面:
+    index.update_bar(bar)  # 1小时K线
+    mean_return, volatility, volume_ratio, up_ratio, count = index.get_stats("btcusdt", bar.datetime)
+    index.get_table("btcusdt", "mean_return")  # 7行(周一到周日) * 24列(小时)
+"""
+
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from threading import Lock
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from howtrader.trader.object import BarData
+from howtrader.trader.utility import get_folder_path
+
+HOURS_OF_WEEK = 7 * 24
+HOUR_MS = 3600 * 1000
+CHINA_OFFSET_HOURS = 8
+CHINA_TZ = timezone(timedelta(hours=CHINA_OFFSET_HOURS))
+
+# 累加值的列, 收益率只统计跟上一根K线连续的K线, 成交量统计所有的K线.
+COUNT, RETURN_SUM, RETURN_SQUARE_SUM, UP_COUNT, VOLUME_COUNT, VOLUME_SUM = range(6)
+ACCUMULATOR_COUNT = 6
+
+STATS_COLUMNS = ["mean_return", "volatility", "volume_ratio", "up_ratio", "count"]
+
+
+def get_hour_of_week(timestamps: np.ndarray) -> np.ndarray:
+    """
+    毫秒时间戳对应的北京时间是一周里面的第几个小时, 周一0点是0. 1970年1月1日是周四.
+    """
+    hours = np.asarray(timestamps, dtype=np.int64) // HOUR_MS + CHINA_OFFSET_HOURS
+    return ((hours // 24 + 3) % 7) * 24 + hours % 24
+
+
+class SeasonalityIndex(object):
+    """
+    按每周的小时统计的季节性指数, 可以增量更新.
+    """
+
+    _index: "SeasonalityIndex" = None
+    _index_lock: Lock = Lock()
+
+    @classmethod
+    def get_index(cls) -> "SeasonalityIndex":
+        """
+        所有策略共用一个指数.
+        """
+        with cls._index_lock:
+            if not cls._index:
+                cls._index = SeasonalityIndex()
+            return cls._index
+
+    def __init__(self, path: str = ""):
+        """"""
+        self.path: str = path or str(get_folder_path("seasonality"))
+        os.makedirs(self.path, exist_ok=True)
+
+        self.symbols: List[str] = []
+        self.symbol_ids: Dict[str, int] = {}
+        self.accumulators: np.ndarray = np.zeros((0, HOURS_OF_WEEK, ACCUMULATOR_COUNT))
+        self.last_times: List[int] = []  # 每个交易对最后一根K线的开盘时间(毫秒).
+        self.last_closes: List[float] = []
+
+        self.stats: np.ndarray = np.zeros((0, HOURS_OF_WEEK, len(STATS_COLUMNS)))
+        self.stats_dirty: bool = False
+        self.lock: Lock = Lock()
+
+        self.load()
+
+    def load(self) -> None:
+        """"""
+        index_path = os.path.join(self.path, "index.json")
+        if not os.path.exists(index_path):
+            return
+
+        with open(index_path, mode="r", encoding="UTF-8") as f:
+            index = json.load(f)
+
+        self.symbols = index["symbols"]
+        self.symbol_ids = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self.last_times = index["last_times"]
+        self.last_closes = index["last_closes"]
+        self.accumulators = np.load(os.path.join(self.path, "stats.npy"))
+        self.stats_dirty = True
+
+    def save(self) -> None:
+        """"""
+        with self.lock:
+            np.save(os.path.join(self.path, "stats.npy"), self.accumulators)
+
+            index = {"symbols": self.symbols, "last_times": self.last_times, "last_closes": self.last_closes}
+            with open(os.path.join(self.path, "index.json"), mode="w", encoding="UTF-8") as f:
+                json.dump(index, f)
+
+    def get_symbol_id(self, symbol: str) -> int:
+        """"""
+        symbol_id = self.symbol_ids.get(symbol, None)
+        if symbol_id is None:
+            symbol_id = len(self.symbols)
+            self.symbols.append(symbol)
+            self.symbol_ids[symbol] = symbol_id
+            self.last_times.append(0)
+            self.last_closes.append(0.0)
+            self.accumulators = np.concatenate((self.accumulators, np.zeros((1, HOURS_OF_WEEK, ACCUMULATOR_COUNT))))
+        return symbol_id
+
+    def update_bar(self, bar: BarData) -> None:
+        """
+        一根新的1小时K线, 已经统计过的K线会忽略. 跟上一根K线不是连续的小时的时候只统计成交量.
+        """
+        open_time = int(bar.datetime.timestamp() * 1000)
+
+        with self.lock:
+            symbol_id = self.get_symbol_id(bar.symbol)
+            last_time = self.last_times[symbol_id]
+            if open_time <= last_time:
+                return
+
+            accumulator = self.accumulators[symbol_id, int(get_hour_of_week(open_time))]
+            accumulator[VOLUME_COUNT] += 1
+            accumulator[VOLUME_SUM] += bar.volume
+
+            last_close = self.last_closes[symbol_id]
+            if open_time - last_time == HOUR_MS and last_close > 0:
+                bar_return = bar.close_price / last_close - 1
+                accumulator[COUNT] += 1
+                accumulator[RETURN_SUM] += bar_return
+                accumulator[RETURN_SQUARE_SUM] += bar_return * bar_return
+                accumulator[UP_COUNT] += bar_return > 0
+
+            self.last_times[symbol_id] = open_time
+            self.last_closes[symbol_id] = bar.close_price
+            self.stats_dirty = True
+
+    def update_arrays(self, symbol: str, open_times: np.ndarray, close: np.ndarray, volume: np.ndarray) -> None:
+        """
+        一次加入很多根1小时K线(按时间排序), 用来从历史数据初始化或者补数据.
+        """
+        open_times = np.asarray(open_times, dtype=np.int64)
+        close = np.asarray(close, dtype=float)
+        volume = np.asarray(volume, dtype=float)
+
+        with self.lock:
+            symbol_id = self.get_symbol_id(symbol)
+            last_time = self.last_times[symbol_id]
+
+            new = open_times > last_time
+            open_times, close, volume = open_times[new], close[new], volume[new]
+            if not len(open_times):
+                return
+
+            last_times = np.concatenate(([last_time], open_times[:-1]))
+            last_closes = np.concatenate(([self.last_closes[symbol_id]], close[:-1]))
+            continuous = (open_times - last_times == HOUR_MS) & (last_closes > 0)
+
+            with np.errstate(invalid="ignore", divide="ignore"):
+                returns = np.where(continuous, close / last_closes - 1, 0.0)
+
+            hour_of_week = get_hour_of_week(open_times)
+            accumulator = self.accumulators[symbol_id]
+            for column, weights in (
+                    (COUNT, continuous),
+                    (RETURN_SUM, returns),
+                    (RETURN_SQUARE_SUM, returns * returns),
+                    (UP_COUNT, returns > 0),
+                    (VOLUME_COUNT, None),
+                    (VOLUME_SUM, volume)):
+                accumulator[:, column] += np.bincount(hour_of_week, weights=weights, minlength=HOURS_OF_WEEK)
+
+            self.last_times[symbol_id] = int(open_times[-1])
+            self.last_closes[symbol_id] = float(close[-1])
+            self.stats_dirty = True
+
+    def update_from_database(self, symbols: Sequence[str], start: datetime, end: datetime) -> None:
+        """
+        用数据库里面的1小时K线初始化.
+        """
+        from howtrader.trader.constant import Exchange, Interval
+        from howtrader.trader.database import database_manager
+
+        for symbol in symbols:
+            bars = database_manager.load_bar_data(symbol, Exchange.BINANCE, Interval.HOUR, start, end)
+            if not bars:
+                print(f"{symbol}没有1小时K线数据")
+                continue
+
+            open_times = np.array([int(bar.datetime.timestamp() * 1000) for bar in bars], dtype=np.int64)
+            order = np.argsort(open_times, kind="stable")
+            self.update_arrays(
+                symbol,
+                open_times[order],
+                np.array([bar.close_price for bar in bars])[order],
+                np.array([bar.volume for bar in bars])[order]
+            )
+            print(f"{symbol}: {len(bars)}根1小时K线")
+
+    def calculate_stats(self) -> None:
+        """
+        从累加值计算所有交易对、所有小时的统计值.
+        """
+        accumulators = self.accumulators
+        count = accumulators[:, :, COUNT]
+        bars = np.maximum(count, 1)
+
+        mean_return = accumulators[:, :, RETURN_SUM] / bars
+        variance = accumulators[:, :, RETURN_SQUARE_SUM] / bars - mean_return ** 2
+        volatility = np.sqrt(np.maximum(variance, 0))
+        up_ratio = accumulators[:, :, UP_COUNT] / bars
+
+        # 成交量比例: 这个小时的平均成交量 / 所有小时的平均成交量.
+        mean_volume = accumulators[:, :, VOLUME_SUM] / np.maximum(accumulators[:, :, VOLUME_COUNT], 1)
+        average_volume = mean_volume.mean(axis=1, keepdims=True)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            volume_ratio = np.where(average_volume > 0, mean_volume / average_volume, 0)
+
+        self.stats = np.stack((mean_return, volatility, volume_ratio, up_ratio, count), axis=2)
+        self.stats_dirty = False
+
+    def get_stats(self, symbol: str, dt: datetime) -> Tuple[float, float, float, float, float]:
+        """
+        dt所在的小时的统计值: (平均收益率, 波动率, 成交量比例, 上涨的比例, K线个数), 没有这个交易对返回全是0.
+        """
+        symbol_id = self.symbol_ids.get(symbol, None)
+        if symbol_id is None:
+            return 0.0, 0.0, 0.0, 0.0, 0.0
+
+        if self.stats_dirty:
+            with self.lock:
+                self.calculate_stats()
+
+        if dt.tzinfo:
+            dt = dt.astimezone(CHINA_TZ)
+        hour_of_week = (dt.isoweekday() - 1) * 24 + dt.hour
+        return tuple(self.stats[symbol_id, hour_of_week].tolist())
+
+    def get_table(self, symbol: str, column: str = "mean_return") -> pd.DataFrame:
+        """
+        一个交易对的某个统计值, 7行(周一到周日, 跟isoweekday一样是1到7) * 24列(小时).
+        """
+        if self.stats_dirty:
+            with self.lock:
+                self.calculate_stats()
+
+        values = self.stats[self.symbol_ids[symbol], :, STATS_COLUMNS.index(column)]
+        return pd.DataFrame(values.reshape(7, 24), index=range(1, 8), columns=range(24))
+
+    def top_slots(self, symbol: str, column: str = "mean_return", n: int = 10,
+                  ascending: bool = False) -> List[Tuple[int, int, float]]:
+        """
+        某个统计值最大(ascending=True就是最小)的n个小时: [(周几, 几点, 值), ...].
+        """
+        table = self.get_table(symbol, column).stack()
+        table = table.sort_values(ascending=ascending).head(n)
+        return [(int(weekday), int(hour), float(value)) for (weekday, hour), value in table.items()]
+
+
+if __name__ == '__main__':
+    index = SeasonalityIndex.get_index()
+    index.update_from_database(["btcusdt", "ethusdt"], datetime(2018, 1, 1), datetime(2021, 1, 1))
+    index.save()
+
+    print(index.get_table("btcusdt", "mean_return"))
+    # 定投选平均收益率最低(跌得最多)的时间, 课程里面用的是周四15点和周五16点.
+    print(index.top_slots("btcusdt", "mean_return", n=10, ascending=True))
+    print(index.get_stats("btcusdt", datetime(2020, 12, 3, 15)))
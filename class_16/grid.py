@@ -24,24 +24,216 @@
 645
 
 
+    网格设计工具.
+
+    1. 生成网格的价格(从高到低): arithmetic_grid 等差, geometric_grid 等比, piecewise_grid 分段等差
+       (比如660到620每3块一格, 620到580每5块一格, 580到500每10块一格).
+    2. design_grid 计算网格全部成交需要的资金和平均的买入价格.
+    3. GridSimulator 用历史1分钟K线的最高价和最低价模拟网格的成交: 每一格在自己的价格买入, 涨到上一格的价格卖出, 卖出之后再等价格跌回来买入.
+       每一格都是独立的, 所有候选网格的所有格子放在一个数组里面一起算,
+       "从第t根K线开始第一次最低价<=买入价"用稀疏表(每2^k根K线的最低价/最高价)二分查找, 不需要一根一根K线循环,
+       一秒可以模拟几千个网格.
+
+    同一根K线里面不知道先到最高价还是先到最低价, 所以买入之后最早下一根K线才卖出, 卖出之后最早下一根K线才买入(保守的估计).
+    买入价高于开始价格的格子在第一根K线就成交。
 """
 
-import numpy as np
-
-if __name__ == '__main__':
-
-    # prices = np.arange(660, 500, -3)
-    # print(prices)
-    #
-    # print(len(prices), prices.mean())
+from datetime import datetime
+from typing import Dict, List, Sequence, Tuple
 
-    price1 = np.arange(660, 620, -3)
-
-    price2 = np.arange(620, 580, -5)
+import numpy as np
+import pandas as pd
+
+
+def arithmetic_grid(upper: float, lower: float, step: float) -> np.ndarray:
+    """
+    等差网格, 从upper开始每次减少step, 不包括lower.
+    """
+    return np.arange(upper, lower, -step, dtype=float)
+
+
+def geometric_grid(upper: float, lower: float, ratio: float) -> np.ndarray:
+    """
+    等比网格, 每一格比上一格低ratio(比如0.01就是1%), 不包括lower.
+    """
+    count = int(np.ceil(np.log(lower / upper) / np.log(1 - ratio)))
+    prices = upper * (1 - ratio) ** np.arange(count)
+    return prices[prices > lower]
+
+
+def piecewise_grid(segments: Sequence[Tuple[float, float, float]]) -> np.ndarray:
+    """
+    分段等差网格, segments: [(660, 620, 3), (620, 580, 5), (580, 500, 10)], 每一段不包括下边界.
+    """
+    return np.concatenate([arithmetic_grid(upper, lower, step) for upper, lower, step in segments])
+
+
+def get_sell_prices(prices: np.ndarray) -> np.ndarray:
+    """
+    每一格的卖出价是上一格的买入价, 最上面一格按最上面两格的比例往上加一格.
+    """
+    if len(prices) < 2:
+        raise Exception("网格至少需要两格")
+
+    return np.concatenate(([prices[0] * prices[0] / prices[1]], prices[:-1]))
+
+
+def design_grid(prices: np.ndarray, trading_size: float) -> Dict[str, float]:
+    """
+    每一格买入trading_size个币, 全部成交需要的资金和平均的买入价格.
+    """
+    prices = np.asarray(prices, dtype=float)
+    capital = float(prices.sum() * trading_size)
+    return {
+        "count": len(prices),
+        "capital": capital,
+        "average_price": capital / (trading_size * len(prices)),
+        "max_drawdown_price": float(prices.min()),  # 价格跌到最下面一格的时候全部成交.
+        "loss_at_bottom": float((prices - prices.min()).sum() * trading_size),
+    }
+
+
+class GridSimulator(object):
+    """
+    用1分钟K线的最高价和最低价模拟候选网格的成交次数和收益.
+    """
+
+    def __init__(self, high: np.ndarray, low: np.ndarray, close: np.ndarray):
+        """"""
+        self.high: np.ndarray = np.asarray(high, dtype=float)
+        self.low: np.ndarray = np.asarray(low, dtype=float)
+        self.close: np.ndarray = np.asarray(close, dtype=float)
+        self.size: int = len(self.low)
+
+        # 稀疏表: low_table[k][i]是low[i: i + 2^k]的最小值, high_table一样.
+        self.low_table: List[np.ndarray] = [self.low]
+        self.high_table: List[np.ndarray] = [self.high]
+        k = 1
+        while 2 ** k <= self.size:
+            half = 2 ** (k - 1)
+            self.low_table.append(np.minimum(self.low_table[-1][:-half], self.low_table[-1][half:]))
+            self.high_table.append(np.maximum(self.high_table[-1][:-half], self.high_table[-1][half:]))
+            k += 1
+
+    def find_first_low(self, start: np.ndarray, price: np.ndarray) -> np.ndarray:
+        """
+        从start开始第一根最低价<=price的K线的下标, 没有就是self.size.
+        """
+        return self.find_first(self.low_table, start, price, lambda values, price: values > price)
+
+    def find_first_high(self, start: np.ndarray, price: np.ndarray) -> np.ndarray:
+        """
+        从start开始第一根最高价>=price的K线的下标, 没有就是self.size.
+        """
+        return self.find_first(self.high_table, start, price, lambda values, price: values < price)
+
+    def find_first(self, table: List[np.ndarray], start: np.ndarray, price: np.ndarray, not_reached) -> np.ndarray:
+        """
+        从大到小, 2^k根K线都没有到价格就跳过这2^k根K线.
+        """
+        pos = np.asarray(start, dtype=np.int64).copy()
+        for k in range(len(table) - 1, -1, -1):
+            length = 2 ** k
+            values = table[k][np.minimum(pos, len(table[k]) - 1)]
+            skip = (pos + length <= self.size) & not_reached(values, price)
+            pos += skip * length
+        return pos
+
+    def simulate(self, grids: Sequence[np.ndarray], trading_size: float = 1.0, fee_rate: float = 0.001) -> pd.DataFrame:
+        """
+        模拟每一个候选网格, 每一行是一个网格:
+        count: 格数, capital: 全部成交需要的资金, average_price: 平均买入价,
+        buy_fills: 买入成交的次数, round_trips: 买入又卖出的次数, realized_pnl: 已经卖出的收益(扣了手续费),
+        holding: 最后还拿着的格数, unrealized_pnl: 最后还拿着的按最后的收盘价算的盈亏, total_pnl, total_return.
+        """
+        grid_index = np.concatenate([np.full(len(prices), i) for i, prices in enumerate(grids)])
+        buy_price = np.concatenate([np.asarray(prices, dtype=float) for prices in grids])
+        sell_price = np.concatenate([get_sell_prices(np.asarray(prices, dtype=float)) for prices in grids])
+
+        count = len(buy_price)
+        buy_fills = np.zeros(count, dtype=np.int64)
+        round_trips = np.zeros(count, dtype=np.int64)
+        holding = np.zeros(count, dtype=bool)
+
+        # 所有还没有结束的格子一起往后找下一次买入和卖出, 循环的次数是成交最多的那一格的次数.
+        active = np.arange(count)
+        pos = np.zeros(count, dtype=np.int64)
+        while len(active):
+            buy_pos = self.find_first_low(pos, buy_price[active])
+            bought = buy_pos < self.size
+            active, buy_pos = active[bought], buy_pos[bought]
+            buy_fills[active] += 1
+
+            sell_pos = self.find_first_high(buy_pos + 1, sell_price[active])
+            sold = sell_pos < self.size
+            holding[active[~sold]] = True
+
+            active = active[sold]
+            round_trips[active] += 1
+            pos = sell_pos[sold] + 1
+
+        profit = (sell_price - buy_price) * trading_size - (sell_price + buy_price) * trading_size * fee_rate
+        realized = round_trips * profit
+        last_price = self.close[-1] if self.size else 0.0
+        unrealized = np.where(holding, (last_price - buy_price * (1 + fee_rate)) * trading_size, 0.0)
+
+        grid_count = len(grids)
+        capital = np.bincount(grid_index, weights=buy_price * trading_size, minlength=grid_count)
+        levels = np.bincount(grid_index, minlength=grid_count)
+
+        df = pd.DataFrame({
+            "count": levels,
+            "capital": capital,
+            "average_price": capital / (levels * trading_size),
+            "buy_fills": np.bincount(grid_index, weights=buy_fills, minlength=grid_count).astype(np.int64),
+            "round_trips": np.bincount(grid_index, weights=round_trips, minlength=grid_count).astype(np.int64),
+            "realized_pnl": np.bincount(grid_index, weights=realized, minlength=grid_count),
+            "holding": np.bincount(grid_index, weights=holding, minlength=grid_count).astype(np.int64),
+            "unrealized_pnl": np.bincount(grid_index, weights=unrealized, minlength=grid_count),
+        })
+        df["total_pnl"] = df["realized_pnl"] + df["unrealized_pnl"]
+        df["total_return"] = df["total_pnl"] / df["capital"]
+        return df
+
+
+def load_bar_arrays(symbol: str, start: datetime, end: datetime) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    从数据库加载1分钟K线的最高价、最低价和收盘价.
+    """
+    from howtrader.trader.constant import Exchange, Interval
+    from howtrader.trader.database import database_manager
+
+    bars = database_manager.load_bar_data(symbol, Exchange.BINANCE, Interval.MINUTE, start, end)
+    high = np.array([bar.high_price for bar in bars], dtype=float)
+    low = np.array([bar.low_price for bar in bars], dtype=float)
+    close = np.array([bar.close_price for bar in bars], dtype=float)
+    return high, low, close
 
-    price3 = np.arange(580,500,  -10)
 
-    prices = list(price1) + list(price2) + list(price3)
+if __name__ == '__main__':
 
-    p = np.array(prices)
-    print(len(p), p.mean())
\ No newline at end of file
+    # 660到620每3块一格, 620到580每5块一格, 580到500每10块一格.
+    prices = piecewise_grid([(660, 620, 3), (620, 580, 5), (580, 500, 10)])
+    print(len(prices), prices.mean())
+    print(design_grid(prices, trading_size=0.1))
+
+    high, low, close = load_bar_arrays("bnbusdt", datetime(2021, 5, 1), datetime(2021, 8, 1))
+
+    # 候选网格: 不同的上下边界和格子的间隔.
+    candidates = []
+    names = []
+    for upper in np.arange(300, 700, 20):
+        for lower in np.arange(150, 400, 25):
+            if lower >= upper * 0.8:
+                continue
+            for step in [2, 3, 5, 10]:
+                candidates.append(arithmetic_grid(upper, lower, step))
+                names.append(f"arithmetic {upper}-{lower} step {step}")
+            for ratio in [0.005, 0.01, 0.02]:
+                candidates.append(geometric_grid(upper, lower, ratio))
+                names.append(f"geometric {upper}-{lower} ratio {ratio}")
+
+    simulator = GridSimulator(high, low, close)
+    result = simulator.simulate(candidates, trading_size=0.1, fee_rate=0.00075)
+    result.index = names
+    print(result.sort_values("total_return", ascending=False).head(20))
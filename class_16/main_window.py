@@ -4,9 +4,9 @@ from howtrader.trader.engine import MainEngine
 from howtrader.trader.ui import MainWindow, create_qapp
 
 from howtrader.gateway.binance import BinanceGateway  #现货
-from howtrader.gateway.binances import BinancesGateway  # 合约
+from batch_order_engine import BatchBinancesGateway  # 合约, 支持批量下单和批量撤单
 
-from howtrader.app.cta_strategy import CtaStrategyApp  # CTA策略
+from tick_conflation import ConflatingCtaStrategyApp  # 支持tick合并的CTA策略
 from howtrader.app.data_manager import DataManagerApp  # 数据管理, csv_data
 from howtrader.app.data_recorder import DataRecorderApp  # 录行情数据
 from howtrader.app.algo_trading import AlgoTradingApp  # 算法交易
@@ -25,8 +25,8 @@ def main():
     main_engine = MainEngine(event_engine)
 
     main_engine.add_gateway(BinanceGateway)
-    main_engine.add_gateway(BinancesGateway)
-    main_engine.add_app(CtaStrategyApp)
+    main_engine.add_gateway(BatchBinancesGateway)
+    main_engine.add_app(ConflatingCtaStrategyApp)
     main_engine.add_app(CtaBacktesterApp)
     main_engine.add_app(DataManagerApp)
     main_engine.add_app(AlgoTradingApp)
@@ -0,0 +1,144 @@
+"""
+    共享的账户资金缓存.
+
+    以前策略要自己注册 EVENT_ACCOUNT + "BINANCE.USDT" 这样的事件, 每个资产一个处理函数, 每次账户推送事件引擎都要分发给所有注册的函数,
+    有的策略只是打印一下, 有的策略干脆自己维护一个假的资金(my_balance)。
+
+    现在所有的策略共用一个缓存, 缓存只注册一次EVENT_ACCOUNT:
+    1. 按vt_accountid(比如"BINANCE.USDT", 合约是"BINANCES.USDT")保存最新的资金, 查询balance, available, frozen都是O(1).
+    2. 每个资产有一个版本号, 资金变化的时候加一, 策略可以保存版本号, 判断资金有没有变化.
+    3. 策略只订阅自己关心的资产, 资金有变化的时候才回调, 没有变化的重复推送不会回调.
+
+    使用方法:
+
+    self.account_cache = AccountCache.get_cache(self.cta_engine.event_engine)
+    self.account_cache.get_available("BINANCE.USDT")
+    self.account_cache.get_version("BINANCE.USDT")
+    self.subscription = self.account_cache.subscribe("BINANCE.USDT", self.on_account)  # on_account(account: AccountData)
+    self.subscription.cancel()  # 取消订阅
+"""
+
+import traceback
+from typing import Callable, Dict, List, Optional
+
+from howtrader.event import Event, EventEngine
+from howtrader.trader.event import EVENT_ACCOUNT
+from howtrader.trader.object import AccountData
+
+
+class AccountSubscription(object):
+    """
+    缓存返回的订阅, 可以调用cancel取消.
+    """
+    __slots__ = ("callback", "cancelled")
+
+    def __init__(self, callback: Callable[[AccountData], None]):
+        """"""
+        self.callback: Callable[[AccountData], None] = callback
+        self.cancelled: bool = False
+
+    def cancel(self) -> None:
+        """
+        取消订阅, 下一次推送的时候从列表里面删掉.
+        """
+        self.cancelled = True
+
+
+class AccountCache(object):
+    """
+    按资产缓存账户资金, 按资产分发更新.
+    """
+
+    _caches: Dict[EventEngine, "AccountCache"] = {}
+
+    @classmethod
+    def get_cache(cls, event_engine: EventEngine) -> "AccountCache":
+        """
+        获取事件引擎共享的账户缓存, 第一次调用的时候创建并注册EVENT_ACCOUNT.
+        """
+        cache = cls._caches.get(event_engine, None)
+
+        if not cache:
+            cache = AccountCache()
+            event_engine.register(EVENT_ACCOUNT, cache.process_account_event)
+            cls._caches[event_engine] = cache
+
+        return cache
+
+    def __init__(self):
+        """"""
+        self.accounts: Dict[str, AccountData] = {}  # vt_accountid: account
+        self.versions: Dict[str, int] = {}  # vt_accountid: 资金变化的次数
+        self.subscriptions: Dict[str, List[AccountSubscription]] = {}  # vt_accountid: 订阅列表
+
+    def get_account(self, vt_accountid: str) -> Optional[AccountData]:
+        """"""
+        return self.accounts.get(vt_accountid, None)
+
+    def get_balance(self, vt_accountid: str) -> float:
+        """
+        总的资金, 没有收到推送的时候是0.
+        """
+        account = self.accounts.get(vt_accountid, None)
+        return account.balance if account else 0.0
+
+    def get_available(self, vt_accountid: str) -> float:
+        """
+        可用的资金.
+        """
+        account = self.accounts.get(vt_accountid, None)
+        return account.available if account else 0.0
+
+    def get_frozen(self, vt_accountid: str) -> float:
+        """
+        挂单冻结的资金.
+        """
+        account = self.accounts.get(vt_accountid, None)
+        return account.frozen if account else 0.0
+
+    def get_version(self, vt_accountid: str) -> int:
+        """
+        资产的版本号, 没有收到推送的时候是0.
+        """
+        return self.versions.get(vt_accountid, 0)
+
+    def subscribe(self, vt_accountid: str, callback: Callable[[AccountData], None]) -> AccountSubscription:
+        """
+        订阅一个资产, 资金变化的时候回调callback. 已经有缓存的时候马上回调一次.
+        """
+        subscription = AccountSubscription(callback)
+        self.subscriptions.setdefault(vt_accountid, []).append(subscription)
+
+        account = self.accounts.get(vt_accountid, None)
+        if account:
+            callback(account)
+
+        return subscription
+
+    def process_account_event(self, event: Event) -> None:
+        """
+        更新缓存, 资金有变化的时候只回调订阅了这个资产的策略.
+        """
+        account: AccountData = event.data
+        vt_accountid = account.vt_accountid
+
+        previous = self.accounts.get(vt_accountid, None)
+        self.accounts[vt_accountid] = account
+
+        if previous and previous.balance == account.balance and previous.frozen == account.frozen:
+            return
+
+        self.versions[vt_accountid] = self.versions.get(vt_accountid, 0) + 1
+
+        subscriptions = self.subscriptions.get(vt_accountid, None)
+        if not subscriptions:
+            return
+
+        if any(subscription.cancelled for subscription in subscriptions):
+            subscriptions[:] = [subscription for subscription in subscriptions if not subscription.cancelled]
+
+        for subscription in subscriptions:
+            try:
+                subscription.callback(account)
+            except Exception:
+                print(f"账户资金回调出错: {subscription.callback}\n{traceback.format_exc()}")
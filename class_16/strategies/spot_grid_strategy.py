@@ -8,13 +8,19 @@ from howtrader.app.cta_strategy import (
 )
 
 from howtrader.app.cta_strategy.engine import CtaEngine
-from howtrader.trader.event import EVENT_TIMER, EVENT_ACCOUNT
-from howtrader.event import Event
-from howtrader.trader.object import Status
-from typing import Union
+from howtrader.trader.object import Direction, Offset, Status, AccountData
+from typing import Dict, List, Tuple, Union
+import numpy as np
+import time
+
+from strategies.timer_scheduler import TimerScheduler, ScheduledTimer
+from strategies.order_book import MyOrderBook
+from strategies.batch_order import send_orders
+from strategies.account_cache import AccountCache
 
 
 TIMER_WAITING_INTERVAL = 30
+TOP_UP_TIMEOUT = 5  # 梯子模式完全成交之后多少秒还没有收到成交推送, 就在定时器里面补单.
 
 class SpotGridStrategy(CtaTemplate):
     """
@@ -28,27 +34,31 @@ class SpotGridStrategy(CtaTemplate):
     grid_step = 2.0  # 网格间隙.  价格*手续费*5  0.001 * 4
     trading_size = 0.5  # 每次下单的头寸.  # 数量乘以价格>= 10USDT
     max_size = 100.0  # 最大单边的数量.
+    ladder_levels = 0  # 梯子模式每边挂单的层数, 0表示原来的模式, 只在最近的成交价上下各挂一个单.
+
+    latest_tick_only = True  # 只需要最新的tick, 需要使用tick_conflation.py里面的引擎，普通的引擎会忽略这个设置.
 
-    parameters = ["grid_step", "trading_size", "max_size"]
+    parameters = ["grid_step", "trading_size", "max_size", "ladder_levels"]
 
     def __init__(self, cta_engine: CtaEngine, strategy_name, vt_symbol, setting):
         """"""
         super().__init__(cta_engine, strategy_name, vt_symbol, setting)
 
-        self.buy_orders = []  # 所有的buy orders.
-        self.sell_orders = []  # 所有的sell orders.
+        self.order_book = MyOrderBook(self)  # 所有的buy orders和sell orders, 角色分别是"buy"和"sell".
 
-        self.timer_interval = 0
+        self.timers: List[ScheduledTimer] = []  # 注册的定时任务.
 
         self.last_filled_order: Union[OrderData, None] = None  # 联合类型, 或者叫可选类型，二选一那种.
+        # 梯子模式完全成交、等成交推送更新仓位之后再补单的订单. vt_orderid: (订单, 角色, 完全成交的时间)
+        self.pending_top_ups: Dict[str, Tuple[OrderData, str, float]] = {}
         self.tick: Union[TickData, None] = None  #
 
         print("交易的交易对:", vt_symbol)
 
-        # 订阅的资产信息. BINANCE.资产名, 或者BINANCES.资产名
-        self.cta_engine.event_engine.register(EVENT_ACCOUNT + "BINANCE.USDT", self.process_account_event)
-        self.cta_engine.event_engine.register(EVENT_ACCOUNT + "BINANCE.BNB", self.process_account_event)
-        self.cta_engine.event_engine.register(EVENT_ACCOUNT + "BINANCE.ETH", self.process_account_event)
+        # 订阅的资产信息. BINANCE.资产名, 或者BINANCES.资产名. 只有这几个资产的资金变化的时候才会回调.
+        self.account_cache = AccountCache.get_cache(self.cta_engine.event_engine)
+        for vt_accountid in ["BINANCE.USDT", "BINANCE.BNB", "BINANCE.ETH"]:
+            self.account_cache.subscribe(vt_accountid, self.on_account)
 
     def on_init(self):
         """
@@ -63,49 +73,131 @@ class SpotGridStrategy(CtaTemplate):
         self.write_log("策略启动")
 
         # 定时器.
-        self.cta_engine.event_engine.register(EVENT_TIMER, self.process_timer_event)
+        scheduler = TimerScheduler.get_scheduler(self.cta_engine.event_engine)
+        self.timers.append(scheduler.schedule_every(TIMER_WAITING_INTERVAL, self.check_grid_orders))
 
     def on_stop(self):
         """
         Callback when strategy is stopped.
         """
         self.write_log("策略停止")
-        self.cta_engine.event_engine.unregister(EVENT_TIMER, self.process_timer_event)
 
-    def process_timer_event(self, event: Event):
+        for timer in self.timers:
+            timer.cancel()
+        self.timers.clear()
+        self.pending_top_ups.clear()
 
+    def check_grid_orders(self):
+        """
+        每TIMER_WAITING_INTERVAL秒检查一次网格的订单.
+        """
         if self.tick is None:
             return
 
-        self.timer_interval += 1
-        if self.timer_interval >= TIMER_WAITING_INTERVAL:
+        # 过了几秒还没有收到成交推送的, 定时器里面补单.
+        now = time.time()
+        for order, role, filled_time in list(self.pending_top_ups.values()):
+            if now - filled_time >= TOP_UP_TIMEOUT:
+                self.pending_top_ups.pop(order.vt_orderid)
+                self.top_up_ladder(order, role)
+
+        # 如果你想比较高频可以把定时器给关了。
 
-            self.timer_interval = 0
-            # 如果你想比较高频可以把定时器给关了。
+        if self.order_book.count("buy") == 0 and self.order_book.count("sell") == 0:
 
-            if len(self.buy_orders) == 0 and len(self.sell_orders) == 0:
+            if abs(self.pos) > self.max_size * self.trading_size:
+                # 限制下单的数量.
+                return
 
-                if abs(self.pos) > self.max_size * self.trading_size:
-                    # 限制下单的数量.
-                    return
+            if self.ladder_levels > 0:
+                self.place_ladder_orders()
+                return
 
-                buy_price = self.tick.bid_price_1 - self.grid_step / 2
-                sell_price = self.tick.ask_price_1 + self.grid_step / 2
+            buy_price = self.tick.bid_price_1 - self.grid_step / 2
+            sell_price = self.tick.ask_price_1 + self.grid_step / 2
 
-                buy_orders_ids = self.buy(buy_price, self.trading_size)  # 列表.
-                sell_orders_ids = self.sell(sell_price, self.trading_size)
+            buy_orders_ids, sell_orders_ids = send_orders(self, [
+                (Direction.LONG, Offset.OPEN, buy_price, self.trading_size),
+                (Direction.SHORT, Offset.CLOSE, sell_price, self.trading_size)
+            ])
 
-                self.buy_orders.extend(buy_orders_ids)
-                self.sell_orders.extend(sell_orders_ids)
+            self.order_book.add_orders(buy_orders_ids, "buy")
+            self.order_book.add_orders(sell_orders_ids, "sell")
 
-                print(f"开启网格交易，双边下单：BUY: {buy_orders_ids}@{buy_price}, SELL: {sell_orders_ids}@{sell_price}")
+            print(f"开启网格交易，双边下单：BUY: {buy_orders_ids}@{buy_price}, SELL: {sell_orders_ids}@{sell_price}")
+
+        elif self.order_book.count("buy") == 0 or self.order_book.count("sell") == 0:
+            # 网格两边的数量不对等.
+            self.order_book.cancel_all()
+
+    def place_ladder_orders(self):
+        """
+        梯子模式: 以盘口的中间价为中心, 一次算出上下各ladder_levels层的价格, 然后批量下单.
+        中间价的那一层是空的, 某一层成交之后只需要在它旁边空出来的那一层补一个反向的订单.
+        """
+        anchor = (self.tick.bid_price_1 + self.tick.ask_price_1) / 2
+        step = self.get_step() * self.grid_step
+        levels = np.arange(1, self.ladder_levels + 1)
 
-            elif len(self.buy_orders) == 0 or len(self.sell_orders) == 0:
-                # 网格两边的数量不对等.
-                self.cancel_all()
+        # 买单不能超过最大的持仓限制, 现货的卖单不能超过手上的币, 没有币的时候不挂卖单.
+        max_pos = self.max_size * self.trading_size
+        buy_count = max(int(round((max_pos - self.pos) / self.trading_size, 8)), 0)
+        sell_count = max(int(round(self.pos / self.trading_size, 8)), 0)
+
+        buy_prices = anchor - levels[:buy_count] * step
+        sell_prices = anchor + levels[:sell_count] * step
+
+        orders = [(Direction.LONG, Offset.OPEN, float(price), self.trading_size) for price in buy_prices]
+        orders += [(Direction.SHORT, Offset.CLOSE, float(price), self.trading_size) for price in sell_prices]
+        results = send_orders(self, orders)
+
+        for vt_orderids in results[:len(buy_prices)]:
+            self.order_book.add_orders(vt_orderids, "buy")
+
+        for vt_orderids in results[len(buy_prices):]:
+            self.order_book.add_orders(vt_orderids, "sell")
+
+        print(f"开启梯子网格, 中间价: {anchor}, BUY: {buy_prices.tolist()}, SELL: {sell_prices.tolist()}")
+
+    def top_up_ladder(self, order: OrderData, role: str):
+        """
+        梯子模式下某一层成交了, 只在它空出来的那一层补一个反向的订单, 其他层的订单不动.
+        补卖单的时候所有卖单加起来不能超过手上的币, 补买单的时候不能超过最大的持仓限制, 超过了这一层就空着.
+        """
+        step = self.get_step() * self.grid_step
 
-    def process_account_event(self, event:Event):
-        print("收到的账户资金的信息:", event.data)
+        if role == "buy":
+            if round(self.pos - (self.order_book.count("sell") + 1) * self.trading_size, 8) < 0:
+                print(f"梯子网格buy成交: {order.price}, 手上的币不够, 不补卖单")
+                return
+
+            price = order.price + step
+            if self.tick:
+                price = max(self.tick.ask_price_1 * (1 + 0.0001), price)
+
+            vt_orderids = send_orders(self, [(Direction.SHORT, Offset.CLOSE, price, self.trading_size)])[0]
+            self.order_book.add_orders(vt_orderids, "sell")
+
+        elif role == "sell":
+            max_pos = self.max_size * self.trading_size
+            if round(self.pos + (self.order_book.count("buy") + 1) * self.trading_size - max_pos, 8) > 0:
+                print(f"梯子网格sell成交: {order.price}, 仓位达到最大值, 不补买单")
+                return
+
+            price = order.price - step
+            if self.tick:
+                price = min(self.tick.bid_price_1 * (1 - 0.0001), price)
+
+            vt_orderids = send_orders(self, [(Direction.LONG, Offset.OPEN, price, self.trading_size)])[0]
+            self.order_book.add_orders(vt_orderids, "buy")
+
+        else:
+            return
+
+        print(f"梯子网格{role}成交: {order.price}, 补单: {vt_orderids}@{price}")
+
+    def on_account(self, account: AccountData):
+        print("收到的账户资金的信息:", account)
 
     def on_tick(self, tick: TickData):
         """
@@ -123,22 +215,21 @@ class SpotGridStrategy(CtaTemplate):
         """
         Callback of new order data update.
         """
+        self.order_book.on_order(order)  # 撤单成功之后下替换的订单, 要在处理订单之前调用.
 
         if order.status == Status.ALLTRADED:
 
-            if order.vt_orderid in self.buy_orders:
-                self.buy_orders.remove(order.vt_orderid)
-
-            if order.vt_orderid in self.sell_orders:
-                self.sell_orders.remove(order.vt_orderid)
-
-            self.cancel_all()
-            print(f"订单买卖单完全成交, 先撤销所有订单")
+            role = self.order_book.remove_order(order.vt_orderid)
 
             self.last_filled_order = order
 
+            if self.ladder_levels > 0:
+                # 成交推送在订单推送之后, 这时候self.pos还没有加上这一笔, 等on_trade更新仓位之后再补单.
+                if role in ("buy", "sell"):
+                    self.pending_top_ups[order.vt_orderid] = (order, role, time.time())
+
             # tick 存在且仓位数量还没有达到设置的最大值.
-            if self.tick and abs(self.pos) < self.max_size * self.trading_size:
+            elif self.tick and abs(self.pos) < self.max_size * self.trading_size:
                 step = self.get_step()
 
                 buy_price = order.price - step * self.grid_step
@@ -147,21 +238,19 @@ class SpotGridStrategy(CtaTemplate):
                 buy_price = min(self.tick.bid_price_1 * (1 - 0.0001), buy_price)  # marker
                 sell_price = max(self.tick.ask_price_1 * (1 + 0.0001), sell_price)
 
-                buy_ids = self.buy(buy_price, self.trading_size)
-                sell_ids = self.sell(sell_price, self.trading_size)
-
-                self.buy_orders.extend(buy_ids)
-                self.sell_orders.extend(sell_ids)
+                # 成交的一边下新的订单, 另一边还没成交的订单直接改单, 不需要撤单再下单.
+                buy_ids = self.order_book.requote_order("buy", Direction.LONG, Offset.OPEN, buy_price, self.trading_size)
+                sell_ids = self.order_book.requote_order("sell", Direction.SHORT, Offset.CLOSE, sell_price, self.trading_size)
 
                 print(
                     f"订单完全成交, 分别下双边网格: BUY: {buy_ids}@{buy_price}, SELL: {sell_ids}@{sell_price}")
 
-        if not order.is_active():
-            if order.vt_orderid in self.buy_orders:
-                self.buy_orders.remove(order.vt_orderid)
+            else:
+                self.order_book.cancel_all()
+                print(f"订单买卖单完全成交, 仓位达到最大值, 撤销所有订单")
 
-            elif order.vt_orderid in self.sell_orders:
-                self.sell_orders.remove(order.vt_orderid)
+        if not order.is_active():
+            self.order_book.remove_order(order.vt_orderid)
 
         self.put_event()
 
@@ -169,6 +258,11 @@ class SpotGridStrategy(CtaTemplate):
         """
         Callback of new trade data update.
         """
+        pending = self.pending_top_ups.pop(trade.vt_orderid, None)
+        if pending:
+            order, role, _ = pending
+            self.top_up_ladder(order, role)
+
         self.put_event()
 
     def on_stop_order(self, stop_order: StopOrder):
@@ -0,0 +1,183 @@
+"""
+    共享的定时任务调度器(分层时间轮).
+
+    以前每个策略都要注册EVENT_TIMER, 然后自己维护 timer_count, cancel_order_interval 这些计数器, 每秒钟每个策略的每个计数器都要加一次。
+    现在所有的策略共用一个调度器, 调度器只注册一次EVENT_TIMER, 策略注册"每N秒执行一次"或者"在某个时间执行一次"的回调,
+    每秒钟只会执行到期的回调。
+
+    时间轮的原理: 一共4层, 每层64个槽, 第一层每个槽是1秒, 第二层每个槽是64秒, 依次类推。
+    定时任务根据到期时间放到对应的槽里面, 每秒钟只需要处理第一层的一个槽, 第一层转完一圈的时候, 再把上一层对应槽的任务放下来。
+
+    使用方法:
+
+    self.scheduler = TimerScheduler.get_scheduler(self.cta_engine.event_engine)
+    self.timer = self.scheduler.schedule_every(5, self.check_orders)  # 每5秒执行一次
+    self.scheduler.schedule_once(60, self.reset)  # 60秒后执行一次
+    self.timer.cancel()  # 取消
+"""
+
+import math
+import traceback
+from datetime import datetime
+from typing import Callable, Dict, List, Tuple
+
+from howtrader.event import Event, EventEngine
+from howtrader.trader.event import EVENT_TIMER
+
+WHEEL_BITS = 6
+WHEEL_SIZE = 1 << WHEEL_BITS  # 每层64个槽.
+WHEEL_MASK = WHEEL_SIZE - 1
+WHEEL_LEVELS = 4  # 4层可以表示 64 ** 4 秒, 大概194天.
+
+
+class ScheduledTimer(object):
+    """
+    调度器返回的定时任务, 可以调用cancel取消.
+    """
+    __slots__ = ("callback", "interval", "expire", "cancelled")
+
+    def __init__(self, callback: Callable[[], None], interval: int, expire: int):
+        """"""
+        self.callback: Callable[[], None] = callback
+        self.interval: int = interval  # 重复执行的间隔秒数, 0表示只执行一次.
+        self.expire: int = expire  # 在第几次定时器事件的时候执行.
+        self.cancelled: bool = False
+
+    def cancel(self) -> None:
+        """
+        取消定时任务, 会在到期的时候直接丢掉.
+        """
+        self.cancelled = True
+
+
+class TimerScheduler(object):
+    """
+    分层时间轮的定时任务调度器, 每秒钟推进一格.
+    """
+
+    _schedulers: Dict[Tuple[EventEngine, bool], "TimerScheduler"] = {}
+
+    @classmethod
+    def get_scheduler(cls, event_engine: EventEngine, fast_lane: bool = False) -> "TimerScheduler":
+        """
+        获取事件引擎共享的调度器, 第一次调用的时候创建并注册EVENT_TIMER.
+        fast_lane为True的时候, 调度器会注册到快速通道的线程(如果事件引擎支持), 回调跟策略的tick在同一个线程.
+        """
+        key = (event_engine, fast_lane)
+        scheduler = cls._schedulers.get(key, None)
+
+        if not scheduler:
+            scheduler = TimerScheduler()
+
+            register = event_engine.register
+            if fast_lane:
+                register = getattr(event_engine, "register_fast", event_engine.register)
+            register(EVENT_TIMER, scheduler.process_timer_event)
+
+            cls._schedulers[key] = scheduler
+
+        return scheduler
+
+    def __init__(self):
+        """"""
+        self.current_tick: int = 0  # 下一个要处理的定时器事件的序号.
+        self.wheels: List[List[List[ScheduledTimer]]] = [
+            [[] for _ in range(WHEEL_SIZE)] for _ in range(WHEEL_LEVELS)
+        ]
+        self.overflow: List[ScheduledTimer] = []  # 超过时间轮范围的任务.
+
+    def schedule_every(self, interval: int, callback: Callable[[], None]) -> ScheduledTimer:
+        """
+        每interval秒执行一次callback.
+        """
+        interval = max(int(interval), 1)
+        timer = ScheduledTimer(callback, interval, self.current_tick + interval - 1)
+        self.add_timer(timer)
+        return timer
+
+    def schedule_once(self, delay: float, callback: Callable[[], None]) -> ScheduledTimer:
+        """
+        delay秒之后执行一次callback.
+        """
+        delay = max(math.ceil(delay), 1)
+        timer = ScheduledTimer(callback, 0, self.current_tick + delay - 1)
+        self.add_timer(timer)
+        return timer
+
+    def schedule_at(self, dt: datetime, callback: Callable[[], None]) -> ScheduledTimer:
+        """
+        在dt这个时间执行一次callback, 精度是1秒.
+        """
+        delay = (dt - datetime.now(dt.tzinfo)).total_seconds()
+        return self.schedule_once(delay, callback)
+
+    def add_timer(self, timer: ScheduledTimer) -> None:
+        """
+        根据到期时间把任务放到对应层的槽里面.
+        """
+        expire = timer.expire
+        ticks = expire - self.current_tick
+
+        if ticks < 0:
+            # 已经过期的任务, 下一次定时器事件就执行.
+            self.wheels[0][self.current_tick & WHEEL_MASK].append(timer)
+            return
+
+        for level in range(WHEEL_LEVELS):
+            if ticks < (1 << (WHEEL_BITS * (level + 1))):
+                index = (expire >> (WHEEL_BITS * level)) & WHEEL_MASK
+                self.wheels[level][index].append(timer)
+                return
+
+        self.overflow.append(timer)
+
+    def cascade(self, level: int) -> int:
+        """
+        把level层当前槽的任务重新放到下面的层里面, 返回当前槽的序号.
+        """
+        index = (self.current_tick >> (WHEEL_BITS * level)) & WHEEL_MASK
+
+        timers = self.wheels[level][index]
+        self.wheels[level][index] = []
+
+        for timer in timers:
+            if not timer.cancelled:
+                self.add_timer(timer)
+
+        return index
+
+    def process_timer_event(self, event: Event) -> None:
+        """
+        每秒钟推进一格, 执行到期的任务.
+        """
+        index = self.current_tick & WHEEL_MASK
+
+        if index == 0:
+            level = 1
+            while level < WHEEL_LEVELS and self.cascade(level) == 0:
+                level += 1
+
+            if level == WHEEL_LEVELS:
+                # 时间轮转完了一整圈, 重新放超出范围的任务.
+                timers = self.overflow
+                self.overflow = []
+                for timer in timers:
+                    if not timer.cancelled:
+                        self.add_timer(timer)
+
+        timers = self.wheels[0][index]
+        self.wheels[0][index] = []
+        self.current_tick += 1
+
+        for timer in timers:
+            if timer.cancelled:
+                continue
+
+            try:
+                timer.callback()
+            except Exception:
+                print(f"定时任务执行出错: {timer.callback}\n{traceback.format_exc()}")
+
+            if timer.interval and not timer.cancelled:
+                timer.expire += timer.interval
+                self.add_timer(timer)
@@ -0,0 +1,117 @@
+"""
+    策略级别的tick合并(conflation).
+
+    像SpotGridStrategy这样的策略, on_tick里面只是保存 self.tick = tick, 真正的逻辑在1秒的定时器里面,
+    但是每一个盘口的更新都会推送给它。订阅的交易对多的时候，大量的CPU都浪费在推送旧的tick上面。
+
+    策略可以声明自己要哪种tick:
+    1. latest_tick_only = False (默认): 每个tick都推送, 跟原来的CtaEngine一样.
+    2. latest_tick_only = True: 只推送每个vt_symbol最新的tick, 还没来得及推送的旧tick直接丢弃.
+
+    做法: 收到tick的时候只记录每个vt_symbol最新的tick, 如果该vt_symbol还没有待推送的tick, 就往事件队列里面放一个
+    EVENT_CONFLATED_TICK事件。等队列处理到这个事件的时候，期间收到的tick都已经被最新的tick覆盖了, 策略只会收到一次最新的tick。
+    所有的处理都在事件引擎的线程里面，不需要加锁。
+
+    如果一个交易对只有latest_tick_only的策略, 也没有本地停止单, 已经有待推送的tick的时候, 新的tick只是覆盖一下就返回,
+    不再做停止单检查和遍历策略这些每个tick的处理.
+"""
+
+from typing import Dict, Set
+
+from howtrader.event import Event, EventEngine
+from howtrader.trader.engine import MainEngine
+from howtrader.trader.object import TickData
+from howtrader.app.cta_strategy import CtaStrategyApp, CtaTemplate
+
+from batch_order_engine import BatchCtaEngine
+
+EVENT_CONFLATED_TICK = "eConflatedTick."
+
+
+def is_latest_tick_only(strategy: CtaTemplate) -> bool:
+    """
+    策略是否只要最新的tick, 策略类里面设置 latest_tick_only = True.
+    """
+    return getattr(strategy, "latest_tick_only", False)
+
+
+class ConflatingCtaEngine(BatchCtaEngine):
+    """
+    支持tick合并的CTA引擎, 批量下单和批量撤单来自BatchCtaEngine.
+    """
+
+    def __init__(self, main_engine: MainEngine, event_engine: EventEngine):
+        """"""
+        super().__init__(main_engine, event_engine)
+
+        self.latest_ticks: Dict[str, TickData] = {}  # vt_symbol: 待推送的最新tick
+        self.dropped_tick_count: int = 0  # 丢弃的旧tick数量, 用来观察合并的效果.
+        self.conflated_only_symbols: Set[str] = set()  # 只有latest_tick_only策略的vt_symbol, 有待推送的tick时可以直接覆盖.
+
+    def register_event(self) -> None:
+        """"""
+        super().register_event()
+        self.event_engine.register(EVENT_CONFLATED_TICK, self.process_conflated_tick_event)
+
+    def process_tick_event(self, event: Event) -> None:
+        """
+        每个tick都要的策略直接推送, 只要最新tick的策略先记录下来, 等队列处理到EVENT_CONFLATED_TICK的时候再推送.
+        """
+        tick = event.data
+
+        # 快速路径: 只有合并的策略而且没有停止单, 待推送的tick还没处理, 直接换成最新的tick.
+        if tick.vt_symbol in self.latest_ticks and tick.vt_symbol in self.conflated_only_symbols and not self.stop_orders:
+            self.latest_ticks[tick.vt_symbol] = tick
+            self.dropped_tick_count += 1
+            return
+
+        strategies = self.symbol_strategy_map[tick.vt_symbol]
+        if not strategies:
+            return
+
+        self.check_stop_order(tick)
+
+        conflate = False
+        per_tick = False
+        for strategy in strategies:
+            if not strategy.inited:
+                continue
+
+            if is_latest_tick_only(strategy):
+                conflate = True
+            else:
+                per_tick = True
+                self.call_strategy_func(strategy, strategy.on_tick, tick)
+
+        if not conflate:
+            self.conflated_only_symbols.discard(tick.vt_symbol)
+            return
+
+        if per_tick:
+            self.conflated_only_symbols.discard(tick.vt_symbol)
+        else:
+            self.conflated_only_symbols.add(tick.vt_symbol)
+
+        if tick.vt_symbol in self.latest_ticks:
+            self.dropped_tick_count += 1
+        else:
+            self.event_engine.put(Event(EVENT_CONFLATED_TICK, tick.vt_symbol))
+
+        self.latest_ticks[tick.vt_symbol] = tick
+
+    def process_conflated_tick_event(self, event: Event) -> None:
+        """"""
+        tick = self.latest_ticks.pop(event.data, None)
+        if not tick:
+            return
+
+        for strategy in self.symbol_strategy_map[tick.vt_symbol]:
+            if strategy.inited and is_latest_tick_only(strategy):
+                self.call_strategy_func(strategy, strategy.on_tick, tick)
+
+
+class ConflatingCtaStrategyApp(CtaStrategyApp):
+    """
+    使用ConflatingCtaEngine的CTA策略模块, 界面跟CtaStrategyApp一样.
+    """
+    engine_class = ConflatingCtaEngine
@@ -0,0 +1,63 @@
+from time import sleep
+from logging import INFO
+
+from howtrader.event import EventEngine
+from howtrader.trader.setting import SETTINGS
+from howtrader.trader.engine import MainEngine
+
+from howtrader.gateway.binance import BinanceGateway  # 现货接口
+
+from multi_grid_engine import MultiGridEngine
+
+SETTINGS["log.active"] = True
+SETTINGS["log.level"] = INFO
+SETTINGS["log.console"] = True
+
+# 现货的api
+binance_setting = {
+    "key": "",
+    "secret": "",
+    "session_number": 3,
+    "proxy_host": "",
+    "proxy_port": 0,
+}
+
+# 每个交易对的网格参数, 没有设置的参数使用multi_grid_engine.py里面的DEFAULT_SETTING.
+grid_settings = {
+    "btcusdt.BINANCE": {"grid_step": 20.0, "profit_step": 20.0, "trading_size": 0.001},
+    "ethusdt.BINANCE": {"grid_step": 2.0, "profit_step": 2.0, "trading_size": 0.01},
+    "bnbusdt.BINANCE": {"grid_step": 0.5, "profit_step": 0.5, "trading_size": 0.1},
+}
+
+
+def run():
+    """
+    一个进程跑所有交易对的网格, 不需要界面.
+    """
+    SETTINGS["log.file"] = True
+
+    event_engine = EventEngine()
+    main_engine = MainEngine(event_engine)
+    main_engine.add_gateway(BinanceGateway)
+    grid_engine: MultiGridEngine = main_engine.add_engine(MultiGridEngine)
+    main_engine.write_log("主引擎创建成功")
+
+    main_engine.connect(binance_setting, "BINANCE")  # 连接现货的
+    main_engine.write_log("连接接口成功")
+
+    sleep(10)
+
+    for vt_symbol, setting in grid_settings.items():
+        grid_engine.add_grid(vt_symbol, setting)
+
+    grid_engine.start()
+
+    while True:
+        sleep(60)
+
+        for vt_symbol in grid_settings:
+            main_engine.write_log(f"{vt_symbol}: {grid_engine.get_grid_data(vt_symbol)}")
+
+
+if __name__ == "__main__":
+    run()
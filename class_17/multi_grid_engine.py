@@ -0,0 +1,415 @@
+"""
+    多交易对的网格引擎: 一个进程跑很多个网格.
+
+    用SpotProfitGridStrategy跑200个交易对, 就有200个策略实例, 每个策略都有自己的tick回调、定时器和订单列表,
+    每秒钟每个策略都要单独检查一次。
+
+    MultiGridEngine 把所有网格的状态放到numpy的数组里面(每一列是一个状态, 每一行是一个网格):
+    最近的成交价、仓位、均价、网格间隙、各种订单的数量和参数限制等等。
+    1. 收到tick只是更新这个交易对的买一卖一价格.
+    2. 订单成交之后先记下来, 往事件队列里面放一个EVENT_GRID_PASS事件, 期间成交的所有网格在一次计算里面重新挂单.
+    3. 定时器每秒钟一次, 用数组的运算同时判断所有网格是否需要补单、止盈、止损, 只有需要下单的网格才会循环处理.
+    4. 仓位和均价用strategies/grid_position.py里面的MyGridPositionCalculator计算, 每个网格的成交记录和检查点
+       用GridPositionHistory保存(文件名是 MultiGrid_交易对), 重启的时候恢复仓位, 不会把手上的仓位当成0.
+
+    交易逻辑跟SpotProfitGridStrategy一样, 使用方法参考 main_multi_grid.py.
+"""
+
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from howtrader.event import Event, EventEngine
+from howtrader.trader.engine import BaseEngine, MainEngine
+from howtrader.trader.event import EVENT_TICK, EVENT_ORDER, EVENT_TIMER
+from howtrader.trader.constant import Direction, Offset, OrderType, Status
+from howtrader.trader.object import OrderRequest, SubscribeRequest, TickData, OrderData, ContractData
+from howtrader.trader.utility import round_to
+
+from strategies.grid_position import MyGridPositionCalculator, GridPositionHistory
+
+APP_NAME = "MultiGrid"
+
+EVENT_GRID_PASS = "eGridPass."
+
+NORMAL_TIMER_INTERVAL = 5
+PROFIT_TIMER_INTERVAL = 5
+STOP_TIMER_INTERVAL = 60
+
+# 每个网格的参数和默认值, 跟SpotProfitGridStrategy一样.
+DEFAULT_SETTING = {
+    "grid_step": 2.0,  # 网格间隙.
+    "profit_step": 2.0,  # 获利的间隔.
+    "trading_size": 1.0,  # 每次下单的头寸.
+    "max_pos": 100,  # 最大的头寸数.
+    "profit_orders_counts": 5,  # 出现单边吃单太多的时候会考虑止盈.
+    "trailing_stop_multiplier": 2.0,
+    "stop_minutes": 360.0,  # 止损之后休息的时间.
+}
+
+# 订单的角色, 对应order_counts的列.
+ROLES = ("long", "short", "profit", "stop")
+ROLE_INDEX = {role: index for index, role in enumerate(ROLES)}
+
+
+class MultiGridEngine(BaseEngine):
+    """
+    用数组保存所有网格状态的多交易对网格引擎.
+    """
+
+    def __init__(self, main_engine: MainEngine, event_engine: EventEngine):
+        """"""
+        super().__init__(main_engine, event_engine, APP_NAME)
+
+        self.active: bool = False
+        self.vt_symbols: List[str] = []
+        self.symbol_index: Dict[str, int] = {}  # vt_symbol: 网格在数组里面的行号
+        self.settings: List[dict] = []
+        self.contracts: List[Optional[ContractData]] = []
+
+        self.order_grids: Dict[str, Tuple[int, str]] = {}  # vt_orderid: (行号, 角色)
+        self.grid_orders: List[Dict[str, str]] = []  # 每个网格的 {vt_orderid: 角色}
+
+        self.timer_count: int = 0
+        self.pass_pending: bool = False
+
+        self.calculators: List[MyGridPositionCalculator] = []  # 每个网格的仓位计算.
+        self.histories: List[GridPositionHistory] = []  # 每个网格的成交记录.
+
+    def add_grid(self, vt_symbol: str, setting: dict) -> None:
+        """
+        添加一个网格, 需要在start之前调用, setting里面没有的参数用DEFAULT_SETTING.
+        """
+        if self.active:
+            self.write_log(f"网格引擎已经启动, 不能再添加网格: {vt_symbol}")
+            return
+
+        if vt_symbol in self.symbol_index:
+            self.write_log(f"网格已经存在: {vt_symbol}")
+            return
+
+        grid_setting = dict(DEFAULT_SETTING)
+        grid_setting.update(setting)
+
+        self.symbol_index[vt_symbol] = len(self.vt_symbols)
+        self.vt_symbols.append(vt_symbol)
+        self.settings.append(grid_setting)
+
+    def init_columns(self) -> None:
+        """
+        根据添加的网格创建状态数组.
+        """
+        count = len(self.vt_symbols)
+
+        # 参数.
+        for name in DEFAULT_SETTING:
+            setattr(self, name, np.array([setting[name] for setting in self.settings], dtype=float))
+
+        # 状态.
+        self.bid_price: np.ndarray = np.full(count, np.nan)
+        self.ask_price: np.ndarray = np.full(count, np.nan)
+        self.last_fill_price: np.ndarray = np.full(count, np.nan)  # 最近成交的网格订单价格, 没有成交是nan.
+        self.pos: np.ndarray = np.zeros(count)
+        self.avg_price: np.ndarray = np.zeros(count)
+        self.stop_until: np.ndarray = np.zeros(count)  # 止损之后暂停到这个时间戳.
+        self.pending_fills: np.ndarray = np.zeros(count, dtype=bool)  # 网格订单成交了, 等待重新挂单.
+        self.ready: np.ndarray = np.zeros(count, dtype=bool)  # 找到合约了才能下单.
+        self.order_counts: np.ndarray = np.zeros((count, len(ROLES)), dtype=int)
+
+        self.contracts = [None] * count
+        self.grid_orders = [{} for _ in range(count)]
+
+        # 从检查点和之后的成交记录恢复每个网格的仓位和均价.
+        self.calculators = [MyGridPositionCalculator(grid_step=setting["grid_step"]) for setting in self.settings]
+        self.histories = [GridPositionHistory(f"{APP_NAME}_{vt_symbol}") for vt_symbol in self.vt_symbols]
+        for index, (calculator, history) in enumerate(zip(self.calculators, self.histories)):
+            history.load(calculator)
+            self.pos[index] = calculator.pos
+            self.avg_price[index] = calculator.avg_price
+
+    def start(self) -> None:
+        """"""
+        if self.active:
+            return
+
+        self.init_columns()
+
+        for index in range(len(self.vt_symbols)):
+            self.load_contract(index)
+
+        self.event_engine.register(EVENT_TICK, self.process_tick_event)
+        self.event_engine.register(EVENT_ORDER, self.process_order_event)
+        self.event_engine.register(EVENT_TIMER, self.process_timer_event)
+        self.event_engine.register(EVENT_GRID_PASS, self.process_grid_pass_event)
+
+        self.active = True
+        self.write_log(f"网格引擎启动, 网格数量: {len(self.vt_symbols)}")
+
+    def stop(self) -> None:
+        """"""
+        if not self.active:
+            return
+
+        self.active = False
+
+        self.event_engine.unregister(EVENT_TICK, self.process_tick_event)
+        self.event_engine.unregister(EVENT_ORDER, self.process_order_event)
+        self.event_engine.unregister(EVENT_TIMER, self.process_timer_event)
+        self.event_engine.unregister(EVENT_GRID_PASS, self.process_grid_pass_event)
+
+        for index in range(len(self.vt_symbols)):
+            self.cancel_grid_orders(index)
+            self.histories[index].save_checkpoint(self.calculators[index])
+
+    def close(self) -> None:
+        """"""
+        self.stop()
+
+    def load_contract(self, index: int) -> None:
+        """
+        获取合约信息并订阅行情, 接口还没有推送合约的时候, 定时器里面再重新获取.
+        """
+        contract = self.main_engine.get_contract(self.vt_symbols[index])
+        if not contract:
+            return
+
+        self.contracts[index] = contract
+        self.ready[index] = True
+
+        req = SubscribeRequest(symbol=contract.symbol, exchange=contract.exchange)
+        self.main_engine.subscribe(req, contract.gateway_name)
+
+    def process_tick_event(self, event: Event) -> None:
+        """
+        只更新买一卖一的价格, 计算放到定时器里面.
+        """
+        tick: TickData = event.data
+
+        index = self.symbol_index.get(tick.vt_symbol, None)
+        if index is None:
+            return
+
+        if tick.bid_price_1 > 0 and tick.ask_price_1 > 0:
+            self.bid_price[index] = tick.bid_price_1
+            self.ask_price[index] = tick.ask_price_1
+
+    def process_order_event(self, event: Event) -> None:
+        """"""
+        order: OrderData = event.data
+
+        item = self.order_grids.get(order.vt_orderid, None)
+        if not item:
+            return
+
+        index, role = item
+
+        if order.status == Status.ALLTRADED:
+            self.remove_order(order.vt_orderid)
+            self.update_position(index, order)
+
+            flat = abs(self.pos[index]) < self.trading_size[index]
+
+            if role in ("long", "short"):
+                # 撤单和重新挂单放到EVENT_GRID_PASS里面, 同一批成交的网格一起计算.
+                self.last_fill_price[index] = order.price
+                self.pending_fills[index] = True
+                self.request_pass()
+
+            elif role == "profit" and flat:
+                self.cancel_grid_orders(index)
+                self.write_log(f"{order.vt_symbol}止盈单子成交,且仓位为零, 先撤销所有订单，然后重新开始")
+
+            elif role == "stop" and flat:
+                self.stop_until[index] = time.time() + self.stop_minutes[index] * 60
+                self.cancel_grid_orders(index)
+                self.write_log(f"{order.vt_symbol}止损单子成交，且仓位为零, 先撤销所有订单，休息{self.stop_minutes[index]}分钟")
+
+        if not order.is_active():
+            self.remove_order(order.vt_orderid)
+
+    def process_timer_event(self, event: Event) -> None:
+        """"""
+        self.timer_count += 1
+
+        for index in np.flatnonzero(~self.ready):
+            self.load_contract(index)
+
+        self.run_pass(
+            check_grid=self.timer_count % NORMAL_TIMER_INTERVAL == 0,
+            check_profit=self.timer_count % PROFIT_TIMER_INTERVAL == 0,
+            check_stop=self.timer_count % STOP_TIMER_INTERVAL == 0
+        )
+
+    def request_pass(self) -> None:
+        """
+        如果队列里面还没有EVENT_GRID_PASS事件就放一个.
+        """
+        if not self.pass_pending:
+            self.pass_pending = True
+            self.event_engine.put(Event(EVENT_GRID_PASS))
+
+    def process_grid_pass_event(self, event: Event) -> None:
+        """"""
+        self.pass_pending = False
+        self.run_pass(check_grid=False, check_profit=False, check_stop=False)
+
+    def run_pass(self, check_grid: bool, check_profit: bool, check_stop: bool) -> None:
+        """
+        一次计算所有网格的条件, 然后只对需要撤单或者下单的网格发送请求.
+        """
+        if not self.vt_symbols:
+            return
+
+        bid = self.bid_price
+        ask = self.ask_price
+        pos = self.pos
+        abs_pos = np.abs(pos)
+        size = self.trading_size
+        step = self.grid_step
+
+        has_tick = self.ready & ~np.isnan(bid)
+        flat = abs_pos < size
+        long_count = self.order_counts[:, ROLE_INDEX["long"]]
+        short_count = self.order_counts[:, ROLE_INDEX["short"]]
+        profit_count = self.order_counts[:, ROLE_INDEX["profit"]]
+
+        cancel_mask = np.zeros(len(self.vt_symbols), dtype=bool)
+        orders: List[Tuple[np.ndarray, str, Direction, Offset, np.ndarray, np.ndarray]] = []
+
+        # 1. 网格订单成交了: 先撤销所有订单, 仓位没有达到最大值就在成交价上下重新挂单.
+        fills = self.pending_fills & has_tick
+        self.pending_fills[fills] = False
+        cancel_mask |= fills
+
+        requote = fills & ~flat & (abs_pos < self.max_pos * size)
+        buy_price = np.minimum(bid * (1 - 0.0001), self.last_fill_price - step)
+        sell_price = np.maximum(ask * (1 + 0.0001), self.last_fill_price + step)
+        orders.append((requote, "long", Direction.LONG, Offset.OPEN, buy_price, size))
+        orders.append((requote, "short", Direction.SHORT, Offset.CLOSE, sell_price, size))
+
+        # 2. 检查网格的双边订单.
+        if check_grid:
+            idle = has_tick & ~fills
+            no_orders = (long_count == 0) & (short_count == 0)
+            one_side = ~no_orders & ((long_count == 0) | (short_count == 0))
+
+            # 仓位为零且没有订单, 没有在止损之后的休息时间内, 就在盘口上下挂单.
+            start = idle & flat & no_orders & (self.stop_until <= time.time())
+            orders.append((start, "long", Direction.LONG, Offset.OPEN, bid - step / 2, size))
+            orders.append((start, "short", Direction.SHORT, Offset.CLOSE, bid + step / 2, size))
+
+            # 仓位为零且单边网格没有订单, 先撤掉所有订单.
+            cancel_mask |= idle & flat & one_side
+
+            # 仓位不为零, 有一边没有订单, 根据上个成交价挂双边订单.
+            refill = idle & ~flat & ((long_count == 0) | (short_count == 0))
+            price = np.where(np.isnan(self.last_fill_price), bid, self.last_fill_price)
+            orders.append((refill, "long", Direction.LONG, Offset.OPEN, np.minimum(bid, price - step), size))
+            orders.append((refill, "short", Direction.SHORT, Offset.CLOSE, np.maximum(ask, price + step), size))
+
+        # 3. 单边成交的订单太多, 挂止盈单.
+        if check_profit:
+            profit = has_tick & (abs_pos >= self.profit_orders_counts * size) & (profit_count == 0)
+
+            long_profit_price = np.maximum(ask * (1 + 0.0001), self.avg_price + self.profit_step)
+            short_profit_price = np.minimum(bid * (1 - 0.0001), self.avg_price - self.profit_step)
+            orders.append((profit & (pos > 0), "profit", Direction.SHORT, Offset.CLOSE, long_profit_price, abs_pos))
+            orders.append((profit & (pos < 0), "profit", Direction.LONG, Offset.OPEN, short_profit_price, abs_pos))
+
+        # 4. 撤销旧的止损单, 仓位达到最大值且价格偏离太多就止损.
+        if check_stop:
+            for index in np.flatnonzero(self.order_counts[:, ROLE_INDEX["stop"]] > 0):
+                self.cancel_grid_orders(index, ("stop",))
+
+            full = has_tick & (abs_pos >= self.max_pos * size)
+            has_fill = ~np.isnan(self.last_fill_price)
+            trailing = self.trailing_stop_multiplier * step
+
+            long_stop = np.where(has_fill, bid < self.last_fill_price - trailing, bid < self.avg_price - self.max_pos * step)
+            short_stop = np.where(has_fill, ask > self.last_fill_price + trailing, ask > self.avg_price + self.max_pos * step)
+            orders.append((full & (pos > 0) & long_stop, "stop", Direction.SHORT, Offset.CLOSE, bid, abs_pos))
+            orders.append((full & (pos < 0) & short_stop, "stop", Direction.LONG, Offset.OPEN, ask, abs_pos))
+
+        for index in np.flatnonzero(cancel_mask):
+            self.cancel_grid_orders(index)
+
+        for mask, role, direction, offset, prices, volumes in orders:
+            for index in np.flatnonzero(mask):
+                self.send_order(index, role, direction, offset, float(prices[index]), float(volumes[index]))
+
+    def update_position(self, index: int, order: OrderData) -> None:
+        """
+        用这个网格的MyGridPositionCalculator计算完全成交之后的仓位和均价, 同时追加成交记录.
+        """
+        calculator = self.calculators[index]
+        if calculator.update_position(order):
+            self.histories[index].record(order, calculator)
+
+        self.pos[index] = calculator.pos
+        self.avg_price[index] = calculator.avg_price
+
+    def send_order(self, index: int, role: str, direction: Direction, offset: Offset, price: float, volume: float) -> str:
+        """"""
+        contract = self.contracts[index]
+
+        req = OrderRequest(
+            symbol=contract.symbol,
+            exchange=contract.exchange,
+            direction=direction,
+            offset=offset,
+            type=OrderType.LIMIT,
+            price=round_to(price, contract.pricetick),
+            volume=round_to(volume, contract.min_volume)
+        )
+
+        vt_orderid = self.main_engine.send_order(req, contract.gateway_name)
+        if not vt_orderid:
+            return ""
+
+        self.order_grids[vt_orderid] = (index, role)
+        self.grid_orders[index][vt_orderid] = role
+        self.order_counts[index, ROLE_INDEX[role]] += 1
+
+        return vt_orderid
+
+    def remove_order(self, vt_orderid: str) -> None:
+        """"""
+        item = self.order_grids.pop(vt_orderid, None)
+        if not item:
+            return
+
+        index, role = item
+        self.grid_orders[index].pop(vt_orderid, None)
+        self.order_counts[index, ROLE_INDEX[role]] -= 1
+
+    def cancel_grid_orders(self, index: int, roles: Tuple[str, ...] = ROLES) -> None:
+        """
+        撤销网格的订单, 订单等撤单成功的推送后再删除.
+        """
+        for vt_orderid, role in list(self.grid_orders[index].items()):
+            if role not in roles:
+                continue
+
+            order = self.main_engine.get_order(vt_orderid)
+            if order and order.is_active():
+                self.main_engine.cancel_order(order.create_cancel_request(), order.gateway_name)
+
+    def get_grid_data(self, vt_symbol: str) -> dict:
+        """
+        某个网格当前的状态, 用来打印或者监控.
+        """
+        index = self.symbol_index[vt_symbol]
+
+        data = {name: self.settings[index][name] for name in DEFAULT_SETTING}
+        data.update({
+            "pos": float(self.pos[index]),
+            "avg_price": float(self.avg_price[index]),
+            "last_fill_price": float(self.last_fill_price[index]),
+        })
+        data.update({f"{role}_orders": int(self.order_counts[index, ROLE_INDEX[role]]) for role in ROLES})
+        return data
+
+    def write_log(self, msg: str) -> None:
+        """"""
+        self.main_engine.write_log(msg, source=APP_NAME)
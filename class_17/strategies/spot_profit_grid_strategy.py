@@ -7,12 +7,13 @@ from howtrader.app.cta_strategy import (
     OrderData
 )
 
-from howtrader.app.cta_strategy.engine import CtaEngine
-from howtrader.trader.event import EVENT_TIMER
-from howtrader.event import Event
+from howtrader.app.cta_strategy.engine import CtaEngine, EngineType
 from howtrader.trader.object import Status
-from howtrader.trader.object import GridPositionCalculator
-from typing import Union
+from typing import List, Union
+
+from strategies.timer_scheduler import TimerScheduler, ScheduledTimer
+from strategies.order_book import MyOrderBook
+from strategies.grid_position import MyGridPositionCalculator, GridPositionHistory
 
 NORMAL_TIMER_INTERVAL = 5
 PROFIT_TIMER_INTERVAL = 5
@@ -50,19 +51,15 @@ class SpotProfitGridStrategy(CtaTemplate):
         """"""
         super().__init__(cta_engine, strategy_name, vt_symbol, setting)
 
-        self.position_calculator = GridPositionCalculator(grid_step=self.grid_step)  # 计算仓位用的对象
+        self.position_calculator = MyGridPositionCalculator(grid_step=self.grid_step)  # 计算仓位用的对象
         self.current_pos = self.position_calculator.pos
+        self.position_history: GridPositionHistory = None
         self.avg_price = self.position_calculator.avg_price
 
-        self.normal_timer_interval = 0
-        self.profit_order_interval = 0
-        self.stop_order_interval = 0
-        self.stop_strategy_interval = 0
+        self.timers: List[ScheduledTimer] = []  # 注册的定时任务.
+        self.stop_reset_timer: ScheduledTimer = None  # 止损之后重新开始的定时任务, 同一时间只有一个.
 
-        self.long_orders = []  # 所有的long orders.
-        self.short_orders = []  # 所有的short orders.
-        self.profit_orders = []  # profit orders.
-        self.stop_orders = []  # stop orders.
+        self.order_book = MyOrderBook(self)  # 订单的角色: "long", "short", "profit", "stop"
 
         self.trigger_stop_loss = False  # 是否触发止损。
 
@@ -81,10 +78,20 @@ class SpotProfitGridStrategy(CtaTemplate):
         Callback when strategy is started.
         """
         self.write_log("策略启动")
-        self.cta_engine.event_engine.register(EVENT_TIMER, self.process_timer_event)
 
-        self.position_calculator = GridPositionCalculator(
-            grid_step=self.grid_step)  # 计算仓位用的对象 
+        scheduler = TimerScheduler.get_scheduler(self.cta_engine.event_engine)
+        self.timers = [
+            scheduler.schedule_every(NORMAL_TIMER_INTERVAL, self.check_grid_orders),
+            scheduler.schedule_every(PROFIT_TIMER_INTERVAL, self.check_profit_orders),
+            scheduler.schedule_every(STOP_TIMER_INTERVAL, self.check_stop_orders)
+        ]
+
+        # 从检查点和之后的成交记录恢复仓位, 重启不会丢失手上的仓位.
+        self.position_calculator = MyGridPositionCalculator(grid_step=self.grid_step)  # 计算仓位用的对象
+        # 回测的strategy_name都是类名, 不读写成交记录, 不然所有的回测共用一个文件.
+        if self.cta_engine.engine_type == EngineType.LIVE:
+            self.position_history = GridPositionHistory(self.strategy_name)
+            self.position_history.load(self.position_calculator)
         self.avg_price = self.position_calculator.avg_price
         self.current_pos = self.position_calculator.pos
 
@@ -93,125 +100,145 @@ class SpotProfitGridStrategy(CtaTemplate):
         Callback when strategy is stopped.
         """
         self.write_log("策略停止")
-        self.cta_engine.event_engine.unregister(EVENT_TIMER, self.process_timer_event)
 
-    def process_timer_event(self, event: Event):
+        for timer in self.timers:
+            timer.cancel()
+        self.timers.clear()
+
+        if self.stop_reset_timer:
+            self.stop_reset_timer.cancel()
+            self.stop_reset_timer = None
+
+        if self.position_history:
+            self.position_history.save_checkpoint(self.position_calculator)
 
+    def check_grid_orders(self):
+        """
+        每NORMAL_TIMER_INTERVAL秒检查一次网格的双边订单.
+        """
         if self.tick is None:
             return
 
-        if self.trigger_stop_loss:
-            self.stop_strategy_interval += 1  # 如果触发了止损，然后就会开始计时.
+        # 仓位为零的时候
+        if abs(self.position_calculator.pos) < self.trading_size:
+            if self.order_book.count("long") == 0 and self.order_book.count("short") == 0:
+                if self.trigger_stop_loss:
+                    # 如果触发了止损就需要休息一段时间, 休息结束由reset_stop_loss重置.
+                    return
 
-        self.normal_timer_interval += 1
+                buy_price = self.tick.bid_price_1 - self.grid_step / 2
+                sell_price = self.tick.bid_price_1 + self.grid_step / 2
+                long_ids = self.buy(buy_price, self.trading_size)
+                short_ids = self.sell(sell_price, self.trading_size) # 现货。 ETH/BUSD,  BTCBUSD
 
-        if self.normal_timer_interval >= NORMAL_TIMER_INTERVAL:
-            self.normal_timer_interval = 0
+                self.order_book.add_orders(long_ids, "long")
+                self.order_book.add_orders(short_ids, "short")
 
-            # 仓位为零的时候
-            if abs(self.position_calculator.pos) < self.trading_size:
-                if len(self.long_orders) == 0 and len(self.short_orders) == 0:
-                    if self.trigger_stop_loss:
-                        # 如果触发了止损就需要休息一段时间.
-                        if self.stop_order_interval < self.stop_minutes * 60:
-                            return
-                        else:
-                            self.stop_order_interval = 0
-                            self.trigger_stop_loss = False
+                print(
+                    f"开启网格交易，双边下单：LONG: {long_ids}: {buy_price}, SHORT: {short_ids}:{sell_price}")
 
-                    buy_price = self.tick.bid_price_1 - self.grid_step / 2
-                    sell_price = self.tick.bid_price_1 + self.grid_step / 2
-                    long_ids = self.buy(buy_price, self.trading_size)
-                    short_ids = self.sell(sell_price, self.trading_size) # 现货。 ETH/BUSD,  BTCBUSD
+            elif self.order_book.count("long") == 0 or self.order_book.count("short") == 0:
+                print(f"仓位为零且单边网格没有订单, 先撤掉所有订单")
+                self.cancel_all()
 
-                    self.long_orders.extend(long_ids)
-                    self.short_orders.extend(short_ids)
+        elif abs(self.position_calculator.pos) >= self.trading_size:
 
-                    print(
-                        f"开启网格交易，双边下单：LONG: { self.long_orders}: {buy_price}, SHORT: { self.short_orders}:{sell_price}")
+            if self.order_book.count("long") > 0 and self.order_book.count("short") > 0:
+                return
 
-                elif len(self.long_orders) == 0 or len(self.short_orders) == 0:
-                    print(f"仓位为零且单边网格没有订单, 先撤掉所有订单")
-                    self.cancel_all()
+            if self.last_filled_order:
+                price = self.last_filled_order.price
+            else:
+                price = self.tick.bid_price_1
 
-            elif abs(self.position_calculator.pos) >= self.trading_size:
+            buy_step = self.get_step()
+            sell_step = self.get_step()
 
-                if len(self.long_orders) > 0 and len(self.short_orders) > 0:
-                    return
+            buy_price = price - buy_step * self.grid_step
+            sell_price = price + sell_step * self.grid_step
 
-                if self.last_filled_order:
-                    price = self.last_filled_order.price
-                else:
-                    price = self.tick.bid_price_1
+            buy_price = min(self.tick.bid_price_1, buy_price)
+            sell_price = max(self.tick.ask_price_1, sell_price)
+            long_ids = self.buy(buy_price, self.trading_size)
+            short_ids = self.sell(sell_price, self.trading_size)
 
-                buy_step = self.get_step()
-                sell_step = self.get_step()
+            self.order_book.add_orders(long_ids, "long")
+            self.order_book.add_orders(short_ids, "short")
+            print(f"仓位不为零, 根据上个订单下双边网格.LONG:{long_ids}:{buy_price}, SHORT: {short_ids}:{sell_price}")
 
-                buy_price = price - buy_step * self.grid_step
-                sell_price = price + sell_step * self.grid_step
+    def check_profit_orders(self):
+        """
+        每PROFIT_TIMER_INTERVAL秒检查一次是否需要下止盈单.
+        """
+        if self.tick is None:
+            return
 
-                buy_price = min(self.tick.bid_price_1, buy_price)
-                sell_price = max(self.tick.ask_price_1, sell_price)
-                long_ids = self.buy(buy_price, self.trading_size)
-                short_ids = self.sell(sell_price, self.trading_size)
+        if abs(self.position_calculator.pos) >= self.profit_orders_counts * self.trading_size and self.order_book.count("profit") == 0:
+            print(f"单边网格出现超过{self.profit_orders_counts}个订单以上,头寸为:{self.position_calculator.pos}, 考虑设置止盈的情况")
+
+            if self.position_calculator.pos > 0:
+                price = max(self.tick.ask_price_1 * (1 + 0.0001),
+                            self.position_calculator.avg_price + self.profit_step)
+                order_ids = self.sell(price, abs(self.position_calculator.pos))
+                self.order_book.add_orders(order_ids, "profit")
+                print(f"多头止盈情况: {self.position_calculator.pos}@{price}")
+            elif self.position_calculator.pos < 0:
+                price = min(self.tick.bid_price_1 * (1 - 0.0001),
+                            self.position_calculator.avg_price - self.profit_step)
+                order_ids = self.buy(price, abs(self.position_calculator.pos))
+                self.order_book.add_orders(order_ids, "profit")
+                print(f"空头止盈情况: {self.position_calculator.pos}@{price}")
+
+    def check_stop_orders(self):
+        """
+        每STOP_TIMER_INTERVAL秒撤销旧的止损单, 然后检查是否需要止损.
+        """
+        if self.tick is None:
+            return
 
-                self.long_orders.extend(long_ids)
-                self.short_orders.extend(short_ids)
-                print(f"仓位不为零, 根据上个订单下双边网格.LONG:{long_ids}:{buy_price}, SHORT: {short_ids}:{sell_price}")
+        self.order_book.cancel_orders("stop")
 
-        self.profit_order_interval += 1
+        # 如果仓位达到最大值的时候.
+        if abs(self.position_calculator.pos) >= self.max_pos * self.trading_size:
 
-        if self.profit_order_interval >= PROFIT_TIMER_INTERVAL:
-            self.profit_order_interval = 0
+            if self.last_filled_order:
+                if self.position_calculator.pos > 0:
+                    if self.tick.bid_price_1 < self.last_filled_order.price - self.trailing_stop_multiplier * self.grid_step:
+                        vt_ids = self.sell(self.tick.bid_price_1, abs(self.position_calculator.pos))
+                        self.order_book.add_orders(vt_ids, "stop")
 
-            if abs(self.position_calculator.pos) >= self.profit_orders_counts * self.trading_size and len(
-                    self.profit_orders) == 0:
-                print(f"单边网格出现超过{self.profit_orders_counts}个订单以上,头寸为:{self.position_calculator.pos}, 考虑设置止盈的情况")
+                elif self.position_calculator.pos < 0:
+                    if self.tick.ask_price_1 > self.last_filled_order.price + self.trailing_stop_multiplier * self.grid_step:
+                        vt_ids = self.buy(self.tick.ask_price_1, abs(self.position_calculator.pos))
+                        self.order_book.add_orders(vt_ids, "stop")
 
+            else:
                 if self.position_calculator.pos > 0:
-                    price = max(self.tick.ask_price_1 * (1 + 0.0001),
-                                self.position_calculator.avg_price + self.profit_step)
-                    order_ids = self.sell(price, abs(self.position_calculator.pos))
-                    self.profit_orders.extend(order_ids)
-                    print(f"多头止盈情况: {self.position_calculator.pos}@{price}")
+                    if self.tick.bid_price_1 < self.position_calculator.avg_price - self.max_pos * self.grid_step:
+                        vt_ids = self.sell(self.tick.bid_price_1, abs(self.position_calculator.pos))
+                        self.order_book.add_orders(vt_ids, "stop")
+
                 elif self.position_calculator.pos < 0:
-                    price = min(self.tick.bid_price_1 * (1 - 0.0001),
-                                self.position_calculator.avg_price - self.profit_step)
-                    order_ids = self.buy(price, abs(self.position_calculator.pos))
-                    self.profit_orders.extend(order_ids)
-                    print(f"空头止盈情况: {self.position_calculator.pos}@{price}")
-
-        self.stop_order_interval += 1
-        if self.stop_order_interval >= STOP_TIMER_INTERVAL:
-            self.stop_order_interval = 0
-
-            for vt_id in self.stop_orders:
-                self.cancel_order(vt_id)
-
-            # 如果仓位达到最大值的时候.
-            if abs(self.position_calculator.pos) >= self.max_pos * self.trading_size:
-
-                if self.last_filled_order:
-                    if self.position_calculator.pos > 0:
-                        if self.tick.bid_price_1 < self.last_filled_order.price - self.trailing_stop_multiplier * self.grid_step:
-                            vt_ids = self.sell(self.tick.bid_price_1, abs(self.position_calculator.pos))
-                            self.stop_orders.extend(vt_ids)
-
-                    elif self.position_calculator.pos < 0:
-                        if self.tick.ask_price_1 > self.last_filled_order.price + self.trailing_stop_multiplier * self.grid_step:
-                            vt_ids = self.buy(self.tick.ask_price_1, abs(self.position_calculator.pos))
-                            self.stop_orders.extend(vt_ids)
-
-                else:
-                    if self.position_calculator.pos > 0:
-                        if self.tick.bid_price_1 < self.position_calculator.avg_price - self.max_pos * self.grid_step:
-                            vt_ids = self.sell(self.tick.bid_price_1, abs(self.position_calculator.pos))
-                            self.stop_orders.extend(vt_ids)
-
-                    elif self.position_calculator.pos < 0:
-                        if self.tick.ask_price_1 > self.position_calculator.avg_price + self.max_pos * self.grid_step:
-                            vt_ids = self.buy(self.tick.ask_price_1, abs(self.position_calculator.pos))
-                            self.stop_orders.extend(vt_ids)
+                    if self.tick.ask_price_1 > self.position_calculator.avg_price + self.max_pos * self.grid_step:
+                        vt_ids = self.buy(self.tick.ask_price_1, abs(self.position_calculator.pos))
+                        self.order_book.add_orders(vt_ids, "stop")
+
+    def schedule_stop_reset(self):
+        """
+        止损后休息stop_minutes分钟. 之前的定时任务先取消, 否则它会提前到期, 让这一次的休息提前结束.
+        """
+        if self.stop_reset_timer:
+            self.stop_reset_timer.cancel()
+
+        scheduler = TimerScheduler.get_scheduler(self.cta_engine.event_engine)
+        self.stop_reset_timer = scheduler.schedule_once(self.stop_minutes * 60, self.reset_stop_loss)
+
+    def reset_stop_loss(self):
+        """
+        止损后休息stop_minutes分钟, 然后重新开始.
+        """
+        self.trigger_stop_loss = False
+        self.stop_reset_timer = None
 
     def on_tick(self, tick: TickData):
         """
@@ -229,20 +256,16 @@ class SpotProfitGridStrategy(CtaTemplate):
         """
         Callback of new order data update.
         """
-        self.position_calculator.update_position(order)
+        if self.position_calculator.update_position(order) and self.position_history:
+            self.position_history.record(order, self.position_calculator)
 
         self.current_pos = self.position_calculator.pos
         self.avg_price = self.position_calculator.avg_price
 
         if order.status == Status.ALLTRADED:
-            if order.vt_orderid in (self.long_orders + self.short_orders):
-
-                if order.vt_orderid in self.long_orders:
-                    self.long_orders.remove(order.vt_orderid)
-
-                if order.vt_orderid in self.short_orders:
-                    self.short_orders.remove(order.vt_orderid)
+            role = self.order_book.remove_order(order.vt_orderid)
 
+            if role in ("long", "short"):
                 self.cancel_all()
                 print(f"订单买卖单完全成交, 先撤销所有订单")
 
@@ -267,38 +290,27 @@ class SpotProfitGridStrategy(CtaTemplate):
                     long_ids = self.buy(buy_price, self.trading_size)
                     short_ids = self.sell(sell_price, self.trading_size)
 
-                    self.long_orders.extend(long_ids)
-                    self.short_orders.extend(short_ids)
+                    self.order_book.add_orders(long_ids, "long")
+                    self.order_book.add_orders(short_ids, "short")
 
                     print(
-                        f"订单完全成交, 分别下双边网格: LONG: {self.long_orders}:{buy_price}, SHORT: {self.short_orders}:{sell_price}")
+                        f"订单完全成交, 分别下双边网格: LONG: {long_ids}:{buy_price}, SHORT: {short_ids}:{sell_price}")
 
-            elif order.vt_orderid in self.profit_orders:
-                self.profit_orders.remove(order.vt_orderid)
+            elif role == "profit":
                 if abs(self.position_calculator.pos) < self.trading_size:
                     self.cancel_all()
                     print(f"止盈单子成交,且仓位为零, 先撤销所有订单，然后重新开始")
 
-            elif order.vt_orderid in self.stop_orders:
-                self.stop_orders.remove(order.vt_orderid)
+            elif role == "stop":
                 if abs(self.position_calculator.pos) < self.trading_size:
                     self.trigger_stop_loss = True
                     self.cancel_all()
+                    self.schedule_stop_reset()
 
                     print("止损单子成交，且仓位为零, 先撤销所有订单，然后重新开始")
 
         if not order.is_active():
-            if order.vt_orderid in self.long_orders:
-                self.long_orders.remove(order.vt_orderid)
-
-            elif order.vt_orderid in self.short_orders:
-                self.short_orders.remove(order.vt_orderid)
-
-            elif order.vt_orderid in self.profit_orders:
-                self.profit_orders.remove(order.vt_orderid)
-
-            elif order.vt_orderid in self.stop_orders:
-                self.stop_orders.remove(order.vt_orderid)
+            self.order_book.remove_order(order.vt_orderid)
 
         self.put_event()
 
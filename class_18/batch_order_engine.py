@@ -0,0 +1,402 @@
+"""
+    批量下单、批量撤单和改单.
+
+    网格策略每次成交之后都要撤单, 然后同时挂一个买单和一个卖单, 每个订单都是一次REST请求。
+    币安合约有批量下单和批量撤单的接口(/fapi/v1/batchOrders), 一次请求最多下5个订单, 或者撤销同一个交易对的10个订单,
+    这样网格重新挂单只需要一次请求。
+
+    1. BatchBinancesGateway 在BinancesGateway的基础上增加了 send_orders 和 cancel_orders.
+    2. BatchCtaEngine 增加了 send_orders 和 cancel_orders, cancel_all也改成批量撤单。
+       如果接口不支持批量(比如现货的BinanceGateway), 就一个一个的发送, 跟原来一样。
+    3. 改单(modify_order): 币安合约有改单的接口(PUT /fapi/v1/order), 订单id不变, 只减少数量的时候不会失去排队的位置,
+       网格重新挂单只需要一个请求。接口不支持改单的时候返回空字符串, 由策略的 MyOrderBook.requote_order 先撤单,
+       收到撤单成功的推送之后再下新的订单(数量减去撤单之前又成交的部分), 旧的订单在撤单之前成交了仓位也不会多一倍。
+    4. 策略里面通过 strategies/batch_order.py 里面的 send_orders, cancel_orders 和 modify_order 调用, 回测的时候也是一个一个的发送。
+
+    使用方法参考 main_window.py.
+"""
+
+import json
+from collections import defaultdict
+from decimal import Decimal
+from typing import Dict, Iterable, List, Tuple
+
+from howtrader.event import EventEngine
+from howtrader.trader.constant import Direction, Offset, OrderType, Status
+from howtrader.trader.object import OrderRequest, CancelRequest, OrderData
+from howtrader.trader.utility import round_to
+from howtrader.gateway.binances import BinancesGateway
+from howtrader.gateway.binances.binances_gateway import BinancesRestApi, Security
+from howtrader.app.cta_strategy import CtaStrategyApp, CtaTemplate
+from howtrader.app.cta_strategy.base import STOPORDER_PREFIX
+from howtrader.app.cta_strategy.engine import CtaEngine
+
+MAX_BATCH_ORDERS = 5  # 批量下单每次最多5个订单.
+MAX_BATCH_CANCELS = 10  # 批量撤单每次最多10个订单.
+
+# (方向, 开平, 价格, 数量)
+OrderItem = Tuple[Direction, Offset, float, float]
+
+DIRECTION_VT2BATCH = {
+    Direction.LONG: "BUY",
+    Direction.SHORT: "SELL"
+}
+
+# 批量接口支持的订单类型: (type, timeInForce)
+ORDERTYPE_VT2BATCH = {
+    OrderType.LIMIT: ("LIMIT", "GTC"),
+    OrderType.MARKET: ("MARKET", ""),
+    OrderType.FAK: ("LIMIT", "IOC"),
+    OrderType.FOK: ("LIMIT", "FOK"),
+}
+
+
+def format_number(value: float) -> str:
+    """
+    批量接口的参数是字符串, 避免出现1e-05这样的科学计数法.
+    """
+    return format(Decimal(str(value)).normalize(), "f")
+
+
+class BatchBinancesRestApi(BinancesRestApi):
+    """
+    支持批量下单和批量撤单的币安合约REST接口.
+    """
+
+    def batch_path(self) -> str:
+        """"""
+        if self.usdt_base:
+            return "/fapi/v1/batchOrders"
+        return "/dapi/v1/batchOrders"
+
+    def send_orders(self, reqs: List[OrderRequest]) -> List[str]:
+        """
+        批量下单, 返回的vt_orderid跟reqs的顺序一样.
+        批量接口不支持的订单类型(比如STOP)就一个一个的发送.
+        """
+        vt_orderids = []
+        batch: List[Tuple[OrderData, dict]] = []
+
+        for req in reqs:
+            if req.type not in ORDERTYPE_VT2BATCH:
+                vt_orderids.append(self.send_order(req))
+                continue
+
+            # 跟send_order一样的规则生成订单id.
+            orderid = "x-cLbi5uMH" + str(self.connect_time + self._new_order_id())
+            order = req.create_order_data(orderid, self.gateway_name)
+            self.gateway.on_order(order)
+            vt_orderids.append(order.vt_orderid)
+
+            order_type, time_condition = ORDERTYPE_VT2BATCH[req.type]
+            params = {
+                "symbol": req.symbol,
+                "side": DIRECTION_VT2BATCH[req.direction],
+                "type": order_type,
+                "quantity": format_number(req.volume),
+                "newClientOrderId": orderid,
+                "newOrderRespType": "ACK"
+            }
+
+            if req.type != OrderType.MARKET:
+                params["price"] = format_number(req.price)
+
+            if time_condition:
+                params["timeInForce"] = time_condition
+
+            if req.offset == Offset.CLOSE:
+                params["reduceOnly"] = "true"
+
+            batch.append((order, params))
+
+        for i in range(0, len(batch), MAX_BATCH_ORDERS):
+            orders = [order for order, _ in batch[i:i + MAX_BATCH_ORDERS]]
+            params_list = [params for _, params in batch[i:i + MAX_BATCH_ORDERS]]
+
+            self.add_request(
+                method="POST",
+                path=self.batch_path(),
+                callback=self.on_send_orders,
+                data={"security": Security.SIGNED},
+                params={"batchOrders": json.dumps(params_list, separators=(",", ":"))},
+                extra=orders,
+                on_error=self.on_send_orders_error,
+                on_failed=self.on_send_orders_failed
+            )
+
+        return vt_orderids
+
+    def cancel_orders(self, reqs: List[CancelRequest]) -> None:
+        """
+        批量撤单, 币安要求同一个交易对的订单才能一起撤.
+        """
+        symbol_reqs: Dict[str, List[CancelRequest]] = defaultdict(list)
+        for req in reqs:
+            symbol_reqs[req.symbol].append(req)
+
+        for symbol, symbol_req_list in symbol_reqs.items():
+            for i in range(0, len(symbol_req_list), MAX_BATCH_CANCELS):
+                orderids = [req.orderid for req in symbol_req_list[i:i + MAX_BATCH_CANCELS]]
+
+                self.add_request(
+                    method="DELETE",
+                    path=self.batch_path(),
+                    callback=self.on_cancel_orders,
+                    data={"security": Security.SIGNED},
+                    params={
+                        "symbol": symbol,
+                        "origClientOrderIdList": json.dumps(orderids, separators=(",", ":"))
+                    },
+                    extra=orderids,
+                    on_failed=self.on_cancel_orders_failed
+                )
+
+    def modify_order(self, order: OrderData, price: float, volume: float) -> None:
+        """
+        改单, 订单id不变. 币安的quantity是订单的总数量, 所以要加上已经成交的数量.
+        改单的结果通过websocket的订单推送更新.
+        """
+        params = {
+            "symbol": order.symbol,
+            "side": DIRECTION_VT2BATCH[order.direction],
+            "origClientOrderId": order.orderid,
+            "quantity": format_number(order.traded + volume),
+            "price": format_number(price)
+        }
+
+        self.add_request(
+            method="PUT",
+            path="/fapi/v1/order" if self.usdt_base else "/dapi/v1/order",
+            callback=self.on_modify_order,
+            data={"security": Security.SIGNED},
+            params=params,
+            extra=order,
+            on_failed=self.on_modify_order_failed
+        )
+
+    def reject_orders(self, orders: List[OrderData]) -> None:
+        """"""
+        for order in orders:
+            order.status = Status.REJECTED
+            self.gateway.on_order(order)
+
+    def on_send_orders(self, data: list, request) -> None:
+        """
+        返回的结果跟下单的顺序一样, 失败的订单是 {"code": -xxxx, "msg": "xxxx"}.
+        """
+        for order, result in zip(request.extra, data):
+            if "code" in result and "orderId" not in result:
+                self.reject_orders([order])
+                self.gateway.write_log(f"批量委托失败{order.vt_orderid}, 代码: {result['code']}, 信息: {result.get('msg', '')}")
+
+    def on_send_orders_failed(self, status_code: int, request) -> None:
+        """"""
+        self.reject_orders(request.extra)
+
+        msg = f"批量委托失败，状态码：{status_code}，信息：{request.response.text}"
+        self.gateway.write_log(msg)
+
+    def on_send_orders_error(self, exception_type: type, exception_value: Exception, tb, request) -> None:
+        """"""
+        self.reject_orders(request.extra)
+
+        if not issubclass(exception_type, ConnectionError):
+            self.on_error(exception_type, exception_value, tb, request)
+
+    def on_cancel_orders(self, data: list, request) -> None:
+        """"""
+        for orderid, result in zip(request.extra, data):
+            if "code" in result and "orderId" not in result:
+                self.gateway.write_log(f"批量撤单失败{orderid}, 代码: {result['code']}, 信息: {result.get('msg', '')}")
+
+    def on_cancel_orders_failed(self, status_code: int, request) -> None:
+        """"""
+        msg = f"批量撤单失败{request.extra}，状态码：{status_code}，信息：{request.response.text}"
+        self.gateway.write_log(msg)
+
+    def on_modify_order(self, data: dict, request) -> None:
+        """"""
+        pass
+
+    def on_modify_order_failed(self, status_code: int, request) -> None:
+        """
+        改单失败订单还是原来的价格和数量, 策略下一次检查的时候会重新改单.
+        """
+        order = request.extra
+        msg = f"改单失败{order.vt_orderid}，状态码：{status_code}，信息：{request.response.text}"
+        self.gateway.write_log(msg)
+
+
+class BatchBinancesGateway(BinancesGateway):
+    """
+    支持批量下单和批量撤单的币安合约接口, gateway_name跟BinancesGateway一样.
+    """
+
+    def __init__(self, event_engine: EventEngine):
+        """"""
+        super().__init__(event_engine)
+        self.rest_api = BatchBinancesRestApi(self)
+
+    def send_orders(self, reqs: List[OrderRequest]) -> List[str]:
+        """"""
+        return self.rest_api.send_orders(reqs)
+
+    def cancel_orders(self, reqs: List[CancelRequest]) -> None:
+        """"""
+        self.rest_api.cancel_orders(reqs)
+
+    def modify_order(self, order: OrderData, price: float, volume: float) -> None:
+        """"""
+        self.rest_api.modify_order(order, price, volume)
+
+
+class BatchCtaEngine(CtaEngine):
+    """
+    支持批量下单和批量撤单的CTA引擎.
+    """
+
+    def send_orders(self, strategy: CtaTemplate, orders: List[OrderItem]) -> List[List[str]]:
+        """
+        批量发送限价单, 返回每个订单的vt_orderids, 跟buy/sell/short/cover的返回值一样是列表.
+        """
+        results: List[List[str]] = [[] for _ in orders]
+
+        contract = self.main_engine.get_contract(strategy.vt_symbol)
+        if not contract:
+            self.write_log(f"批量委托失败，找不到合约：{strategy.vt_symbol}", strategy)
+            return results
+
+        reqs: List[OrderRequest] = []
+        indexes: List[int] = []  # 每个req对应的是第几个订单.
+
+        for i, (direction, offset, price, volume) in enumerate(orders):
+            original_req = OrderRequest(
+                symbol=contract.symbol,
+                exchange=contract.exchange,
+                direction=direction,
+                offset=offset,
+                type=OrderType.LIMIT,
+                price=round_to(price, contract.pricetick),
+                volume=round_to(volume, contract.min_volume)
+            )
+
+            for req in self.offset_converter.convert_order_request(original_req, False):
+                reqs.append(req)
+                indexes.append(i)
+
+        vt_orderids = self.send_server_orders(reqs, contract.gateway_name)
+
+        for i, req, vt_orderid in zip(indexes, reqs, vt_orderids):
+            if not vt_orderid:
+                continue
+
+            results[i].append(vt_orderid)
+
+            self.offset_converter.update_order_request(req, vt_orderid)
+            self.orderid_strategy_map[vt_orderid] = strategy
+            self.strategy_orderid_map[strategy.strategy_name].add(vt_orderid)
+
+        return results
+
+    def send_server_orders(self, reqs: List[OrderRequest], gateway_name: str) -> List[str]:
+        """
+        接口支持批量就一次发送, 否则一个一个的发送. 发送失败的vt_orderid是空字符串.
+        """
+        gateway = self.main_engine.get_gateway(gateway_name)
+        if not hasattr(gateway, "send_orders"):
+            return [self.main_engine.send_order(req, gateway_name) for req in reqs]
+
+        # 批量下单不经过main_engine.send_order, 风控检查要自己做.
+        vt_orderids = [""] * len(reqs)
+        checked_indexes = [i for i, req in enumerate(reqs) if self.check_risk(req, gateway_name)]
+
+        batch_orderids = gateway.send_orders([reqs[i] for i in checked_indexes])
+        for i, vt_orderid in zip(checked_indexes, batch_orderids):
+            vt_orderids[i] = vt_orderid
+
+        return vt_orderids
+
+    def check_risk(self, req: OrderRequest, gateway_name: str) -> bool:
+        """"""
+        risk_engine = self.main_engine.get_engine("RiskManager")
+        if not risk_engine:
+            return True
+
+        return risk_engine.check_risk(req, gateway_name)
+
+    def cancel_orders(self, strategy: CtaTemplate, vt_orderids: Iterable[str]) -> None:
+        """
+        批量撤单, 本地停止单直接撤销, 服务器的订单按接口分组批量撤销.
+        """
+        gateway_reqs: Dict[str, List[CancelRequest]] = defaultdict(list)
+
+        for vt_orderid in vt_orderids:
+            if vt_orderid.startswith(STOPORDER_PREFIX):
+                self.cancel_local_stop_order(strategy, vt_orderid)
+                continue
+
+            order = self.main_engine.get_order(vt_orderid)
+            if not order:
+                self.write_log(f"撤单失败，找不到委托{vt_orderid}", strategy)
+                continue
+
+            gateway_reqs[order.gateway_name].append(order.create_cancel_request())
+
+        for gateway_name, reqs in gateway_reqs.items():
+            gateway = self.main_engine.get_gateway(gateway_name)
+
+            if hasattr(gateway, "cancel_orders"):
+                gateway.cancel_orders(reqs)
+            else:
+                for req in reqs:
+                    self.main_engine.cancel_order(req, gateway_name)
+
+    def modify_order(self, strategy: CtaTemplate, vt_orderid: str, direction: Direction, offset: Offset,
+                     price: float, volume: float) -> str:
+        """
+        改单, 成功返回vt_orderid(不变), 失败返回空字符串.
+        接口支持改单, 而且是同方向的限价单, 就用交易所的改单接口; 否则不做任何操作, 返回空字符串,
+        由策略的 MyOrderBook.requote_order 撤单, 等撤单成功之后再下单, 避免旧的订单和新的订单都成交.
+        """
+        order = self.main_engine.get_order(vt_orderid)
+        if not order or not order.is_active():
+            self.write_log(f"改单失败，委托{vt_orderid}不存在或者已经结束", strategy)
+            return ""
+
+        contract = self.main_engine.get_contract(strategy.vt_symbol)
+        if not contract:
+            self.write_log(f"改单失败，找不到合约：{strategy.vt_symbol}", strategy)
+            return ""
+
+        price = round_to(price, contract.pricetick)
+        volume = round_to(volume, contract.min_volume)
+
+        gateway = self.main_engine.get_gateway(order.gateway_name)
+        if (
+            hasattr(gateway, "modify_order")
+            and order.type == OrderType.LIMIT
+            and order.direction == direction
+            and order.offset == offset
+        ):
+            if price != order.price or volume != order.volume - order.traded:
+                gateway.modify_order(order, price, volume)
+            return vt_orderid
+
+        return ""
+
+    def cancel_all(self, strategy: CtaTemplate) -> None:
+        """
+        撤销策略所有的订单, 一次请求撤销.
+        """
+        vt_orderids = self.strategy_orderid_map[strategy.strategy_name]
+        if not vt_orderids:
+            return
+
+        self.cancel_orders(strategy, list(vt_orderids))
+
+
+class BatchCtaStrategyApp(CtaStrategyApp):
+    """
+    使用BatchCtaEngine的CTA策略模块, 界面跟CtaStrategyApp一样.
+    """
+    engine_class = BatchCtaEngine
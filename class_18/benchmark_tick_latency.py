@@ -0,0 +1,98 @@
+"""
+    tick到下单的延迟测试: 普通的EventEngine 对比 FastLaneEventEngine.
+
+    模拟行情剧烈的时候，通用队列里面有大量的日志、账户、持仓的推送，
+    然后统计tick从put到策略回调(策略在回调里面下单)的时间。
+
+    运行: python benchmark_tick_latency.py
+"""
+
+import time
+from datetime import datetime
+from threading import Thread
+from typing import Dict, List
+
+from howtrader.event import Event, EventEngine
+from howtrader.trader.event import EVENT_TICK, EVENT_LOG, EVENT_ACCOUNT, EVENT_POSITION
+from howtrader.trader.object import TickData
+from howtrader.trader.constant import Exchange
+
+from fast_lane import FastLaneEventEngine
+
+TICK_COUNT = 2000  # 测试多少个tick.
+TICK_INTERVAL = 0.001  # tick的推送间隔, 秒.
+NOISE_PER_TICK = 20  # 每个tick之间插入多少个其他的事件.
+NOISE_HANDLER_COST = 0.00005  # 其他事件的处理耗时, 秒.
+
+
+def noise_handler(event: Event):
+    """
+    模拟日志、账户、持仓事件的处理耗时.
+    """
+    end = time.perf_counter() + NOISE_HANDLER_COST
+    while time.perf_counter() < end:
+        pass
+
+
+def run_benchmark(event_engine: EventEngine, fast_lane: bool) -> List[float]:
+    """
+    返回每个tick的延迟, 单位是微秒.
+    """
+    send_times: Dict[int, float] = {}
+    latencies: List[float] = []
+
+    def on_tick(event: Event):
+        # 策略收到tick, 这里就是下单的时刻.
+        latencies.append((time.perf_counter() - send_times[id(event.data)]) * 1000_000)
+
+    if fast_lane:
+        event_engine.register_fast(EVENT_TICK, on_tick)
+        event_engine.add_fast_symbol("BTCUSDT.BINANCE")
+    else:
+        event_engine.register(EVENT_TICK, on_tick)
+
+    for event_type in [EVENT_LOG, EVENT_ACCOUNT, EVENT_POSITION]:
+        event_engine.register(event_type, noise_handler)
+
+    ticks = [
+        TickData(symbol="BTCUSDT", exchange=Exchange.BINANCE, datetime=datetime.now(), gateway_name="BINANCES")
+        for _ in range(TICK_COUNT)
+    ]
+
+    def push_market_data():
+        noise_types = [EVENT_LOG, EVENT_ACCOUNT, EVENT_POSITION]
+        for tick in ticks:
+            for i in range(NOISE_PER_TICK):
+                event_engine.put(Event(noise_types[i % 3]))
+
+            send_times[id(tick)] = time.perf_counter()
+            event_engine.put(Event(EVENT_TICK, tick))
+            time.sleep(TICK_INTERVAL)
+
+    event_engine.start()
+    pusher = Thread(target=push_market_data)
+    pusher.start()
+    pusher.join()
+
+    # 等待所有的tick处理完成.
+    while len(latencies) < TICK_COUNT:
+        time.sleep(0.1)
+
+    event_engine.stop()
+    return latencies
+
+
+def print_result(name: str, latencies: List[float]):
+    latencies = sorted(latencies)
+    count = len(latencies)
+    print(
+        f"{name}: mean: {sum(latencies) / count:.1f}us, "
+        f"p50: {latencies[count // 2]:.1f}us, "
+        f"p99: {latencies[int(count * 0.99)]:.1f}us, "
+        f"max: {latencies[-1]:.1f}us"
+    )
+
+
+if __name__ == '__main__':
+    print_result("EventEngine", run_benchmark(EventEngine(), fast_lane=False))
+    print_result("FastLaneEventEngine", run_benchmark(FastLaneEventEngine(), fast_lane=True))
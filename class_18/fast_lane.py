@@ -0,0 +1,208 @@
+"""
+    tick的快速通道(fast lane).
+
+    默认情况下行情、订单、定时器、日志、账户、持仓的事件都在EventEngine的同一个队列里面排队处理,
+    行情剧烈的时候, 账户和日志的推送会排在tick前面, 高频策略的反应时间就会变慢。
+
+    快速通道的做法:
+    1. FastLaneEventEngine 多开一个线程和队列, 订阅了快速通道的vt_symbol, 它的tick、订单和成交事件会直接放到快速队列里面,
+       不需要在通用队列里面排队。(通用队列还是会收到这些事件，给界面、数据记录等其他模块使用)
+    2. FastLaneCtaEngine 把设置了 fast_lane = True 的策略的 on_tick, on_order, on_trade 放到快速线程里面回调,
+       通用线程里面就跳过这些策略, 避免重复推送。
+    3. 策略的定时器也可以通过 register_fast 注册到快速线程，这样策略所有的回调都在同一个线程，不需要加锁。
+
+    使用方法参考 main_window.py, 策略里面设置 fast_lane = True 即可。
+"""
+
+from collections import defaultdict
+from queue import Queue, Empty
+from threading import Thread
+from typing import Callable, Dict, List, Set
+
+from howtrader.event import Event, EventEngine
+from howtrader.trader.engine import MainEngine
+from howtrader.trader.event import EVENT_TICK, EVENT_ORDER, EVENT_TRADE, EVENT_TIMER
+from howtrader.app.cta_strategy import CtaStrategyApp, CtaTemplate
+
+from batch_order_engine import BatchCtaEngine
+
+HandlerType = Callable[[Event], None]
+
+# 这些事件的data都有vt_symbol属性, 根据vt_symbol来判断是否走快速通道.
+FAST_LANE_EVENTS = {EVENT_TICK, EVENT_ORDER, EVENT_TRADE}
+
+
+class FastLaneEventEngine(EventEngine):
+    """
+    带有快速通道的事件引擎.
+    """
+
+    def __init__(self, interval: int = 1):
+        """"""
+        super().__init__(interval)
+
+        self._fast_queue: Queue = Queue()
+        self._fast_thread: Thread = Thread(target=self._run_fast_lane)
+        self._fast_handlers: Dict[str, List[HandlerType]] = defaultdict(list)
+        self._fast_symbols: Set[str] = set()
+
+    def _run_fast_lane(self) -> None:
+        """
+        快速通道的线程, 只处理订阅了快速通道的事件.
+        """
+        while self._active:
+            try:
+                event = self._fast_queue.get(block=True, timeout=1)
+                for handler in self._fast_handlers.get(event.type, []):
+                    handler(event)
+            except Empty:
+                pass
+
+    def start(self) -> None:
+        """"""
+        super().start()
+        self._fast_thread.start()
+
+    def stop(self) -> None:
+        """"""
+        super().stop()
+        self._fast_thread.join()
+
+    def put(self, event: Event) -> None:
+        """
+        订阅了快速通道的事件会同时放到快速队列里面.
+        """
+        if event.type in self._fast_handlers:
+            if event.type == EVENT_TIMER:
+                self._fast_queue.put(event)
+
+            elif event.type in FAST_LANE_EVENTS and event.data.vt_symbol in self._fast_symbols:
+                self._fast_queue.put(event)
+
+        super().put(event)
+
+    def register_fast(self, type: str, handler: HandlerType) -> None:
+        """
+        注册快速通道的回调函数, 回调会在快速通道的线程里面执行.
+        """
+        handler_list = self._fast_handlers[type]
+        if handler not in handler_list:
+            handler_list.append(handler)
+
+    def unregister_fast(self, type: str, handler: HandlerType) -> None:
+        """"""
+        handler_list = self._fast_handlers[type]
+
+        if handler in handler_list:
+            handler_list.remove(handler)
+
+        if not handler_list:
+            self._fast_handlers.pop(type)
+
+    def add_fast_symbol(self, vt_symbol: str) -> None:
+        """
+        vt_symbol的tick、订单和成交事件走快速通道.
+        """
+        self._fast_symbols.add(vt_symbol)
+
+
+def is_fast_lane(strategy: CtaTemplate) -> bool:
+    """
+    策略是否开启了快速通道, 策略类里面设置 fast_lane = True.
+    """
+    return getattr(strategy, "fast_lane", False)
+
+
+class FastLaneCtaEngine(BatchCtaEngine):
+    """
+    支持快速通道的CTA引擎, 需要配合FastLaneEventEngine使用.
+    如果事件引擎是普通的EventEngine, 就跟原来的CtaEngine一样. 批量下单和批量撤单来自BatchCtaEngine.
+    """
+
+    def __init__(self, main_engine: MainEngine, event_engine: EventEngine):
+        """"""
+        super().__init__(main_engine, event_engine)
+        self.fast_lane_enabled: bool = isinstance(event_engine, FastLaneEventEngine)
+
+    def register_event(self) -> None:
+        """"""
+        super().register_event()
+
+        if self.fast_lane_enabled:
+            self.event_engine.register_fast(EVENT_TICK, self.process_fast_tick_event)
+            self.event_engine.register_fast(EVENT_ORDER, self.process_fast_order_event)
+            self.event_engine.register_fast(EVENT_TRADE, self.process_fast_trade_event)
+
+    def add_strategy(self, class_name: str, strategy_name: str, vt_symbol: str, setting: dict) -> None:
+        """"""
+        super().add_strategy(class_name, strategy_name, vt_symbol, setting)
+
+        strategy = self.strategies.get(strategy_name)
+        if self.fast_lane_enabled and strategy and is_fast_lane(strategy):
+            self.event_engine.add_fast_symbol(vt_symbol)
+            self.write_log(f"{strategy_name}开启快速通道: {vt_symbol}")
+
+    def is_fast_strategy(self, strategy: CtaTemplate) -> bool:
+        """"""
+        return self.fast_lane_enabled and strategy is not None and is_fast_lane(strategy)
+
+    def process_tick_event(self, event: Event) -> None:
+        """
+        通用线程里面的tick, 跳过快速通道的策略.
+        """
+        tick = event.data
+
+        strategies = self.symbol_strategy_map[tick.vt_symbol]
+        if not strategies:
+            return
+
+        self.check_stop_order(tick)
+
+        for strategy in strategies:
+            if strategy.inited and not self.is_fast_strategy(strategy):
+                self.call_strategy_func(strategy, strategy.on_tick, tick)
+
+    def process_order_event(self, event: Event) -> None:
+        """"""
+        strategy = self.orderid_strategy_map.get(event.data.vt_orderid, None)
+        if self.is_fast_strategy(strategy):
+            return
+
+        super().process_order_event(event)
+
+    def process_trade_event(self, event: Event) -> None:
+        """"""
+        strategy = self.orderid_strategy_map.get(event.data.vt_orderid, None)
+        if self.is_fast_strategy(strategy):
+            return
+
+        super().process_trade_event(event)
+
+    def process_fast_tick_event(self, event: Event) -> None:
+        """
+        快速通道线程里面的tick, 只推送给快速通道的策略.
+        """
+        tick = event.data
+
+        for strategy in self.symbol_strategy_map[tick.vt_symbol]:
+            if strategy.inited and self.is_fast_strategy(strategy):
+                self.call_strategy_func(strategy, strategy.on_tick, tick)
+
+    def process_fast_order_event(self, event: Event) -> None:
+        """"""
+        strategy = self.orderid_strategy_map.get(event.data.vt_orderid, None)
+        if self.is_fast_strategy(strategy):
+            super().process_order_event(event)
+
+    def process_fast_trade_event(self, event: Event) -> None:
+        """"""
+        strategy = self.orderid_strategy_map.get(event.data.vt_orderid, None)
+        if self.is_fast_strategy(strategy):
+            super().process_trade_event(event)
+
+
+class FastLaneCtaStrategyApp(CtaStrategyApp):
+    """
+    使用FastLaneCtaEngine的CTA策略模块, 界面跟CtaStrategyApp一样.
+    """
+    engine_class = FastLaneCtaEngine
@@ -1,12 +1,10 @@
-from howtrader.event import EventEngine
-
 from howtrader.trader.engine import MainEngine
 from howtrader.trader.ui import MainWindow, create_qapp
 
 from howtrader.gateway.binance import BinanceGateway  #现货
-from howtrader.gateway.binances import BinancesGateway  # 合约
+from batch_order_engine import BatchBinancesGateway  # 合约, 支持批量下单和批量撤单
 
-from howtrader.app.cta_strategy import CtaStrategyApp  # CTA策略
+from fast_lane import FastLaneEventEngine, FastLaneCtaStrategyApp  # 带tick快速通道的CTA策略
 from howtrader.app.data_manager import DataManagerApp  # 数据管理, csv_data
 from howtrader.app.data_recorder import DataRecorderApp  # 录行情数据
 from howtrader.app.algo_trading import AlgoTradingApp  # 算法交易
@@ -20,13 +18,13 @@ def main():
 
     qapp = create_qapp()
 
-    event_engine = EventEngine()
+    event_engine = FastLaneEventEngine()
 
     main_engine = MainEngine(event_engine)
 
     main_engine.add_gateway(BinanceGateway)
-    main_engine.add_gateway(BinancesGateway)
-    main_engine.add_app(CtaStrategyApp)
+    main_engine.add_gateway(BatchBinancesGateway)
+    main_engine.add_app(FastLaneCtaStrategyApp)
     main_engine.add_app(CtaBacktesterApp)
     main_engine.add_app(DataManagerApp)
     main_engine.add_app(AlgoTradingApp)
@@ -0,0 +1,73 @@
+"""
+    策略里面的批量下单、批量撤单和改单.
+
+    引擎支持批量(batch_order_engine.py里面的BatchCtaEngine)的时候一次请求发送, 否则一个一个的发送,
+    所以策略在回测和普通的CtaEngine里面也可以直接使用。
+
+    使用方法:
+
+    long_ids, short_ids = send_orders(self, [
+        (Direction.LONG, Offset.OPEN, buy_price, self.trading_size),
+        (Direction.SHORT, Offset.OPEN, sell_price, self.trading_size)
+    ])
+    cancel_orders(self, vt_orderids)
+    if not modify_order(self, vt_orderid, Direction.LONG, Offset.OPEN, new_price, self.trading_size):
+        ...  # 不能改单, 用 MyOrderBook.requote_order 撤单之后再下单
+
+    buy: (LONG, OPEN), sell: (SHORT, CLOSE), short: (SHORT, OPEN), cover: (LONG, CLOSE).
+"""
+
+from typing import Iterable, List, Tuple
+
+from howtrader.app.cta_strategy import CtaTemplate
+from howtrader.trader.constant import Direction, Offset
+
+# (方向, 开平, 价格, 数量)
+OrderItem = Tuple[Direction, Offset, float, float]
+
+
+def send_orders(strategy: CtaTemplate, orders: List[OrderItem]) -> List[List[str]]:
+    """
+    批量发送限价单, 返回每个订单的vt_orderids列表, 顺序跟orders一样.
+    """
+    if not strategy.trading:
+        return [[] for _ in orders]
+
+    engine_send_orders = getattr(strategy.cta_engine, "send_orders", None)
+    if engine_send_orders:
+        return engine_send_orders(strategy, orders)
+
+    return [strategy.send_order(direction, offset, price, volume) for direction, offset, price, volume in orders]
+
+
+def cancel_orders(strategy: CtaTemplate, vt_orderids: Iterable[str]) -> None:
+    """
+    批量撤单.
+    """
+    if not strategy.trading:
+        return
+
+    engine_cancel_orders = getattr(strategy.cta_engine, "cancel_orders", None)
+    if engine_cancel_orders:
+        engine_cancel_orders(strategy, list(vt_orderids))
+        return
+
+    for vt_orderid in vt_orderids:
+        strategy.cancel_order(vt_orderid)
+
+
+def modify_order(strategy: CtaTemplate, vt_orderid: str, direction: Direction, offset: Offset,
+                 price: float, volume: float) -> str:
+    """
+    改单, 把订单改到新的价格和数量(volume是剩余要成交的数量), 订单id不变, 成功返回vt_orderid.
+    引擎和接口不支持改单(现货、回测)或者订单已经结束返回空字符串, 订单不会有任何变化.
+    这里不会撤单再马上下单: 旧的订单在撤单之前成交的话两个订单都会成交, 需要撤单再下单用 MyOrderBook.requote_order.
+    """
+    if not strategy.trading:
+        return ""
+
+    engine_modify_order = getattr(strategy.cta_engine, "modify_order", None)
+    if engine_modify_order:
+        return engine_modify_order(strategy, vt_orderid, direction, offset, price, volume)
+
+    return ""
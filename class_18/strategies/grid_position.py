@@ -0,0 +1,169 @@
+"""
+    可以从成交记录恢复的网格仓位计算.
+
+    以前策略在on_start里面重新创建 GridPositionCalculator(grid_step=...), 重启之后pos和avg_price都是0,
+    策略就忘记了自己手上实际的仓位。
+
+    1. MyGridPositionCalculator 的计算方法跟howtrader的GridPositionCalculator一样:
+       加仓的时候计算加权均价, 减仓的时候把超过一个网格间隙的盈利算到均价里面, 反手或者重新开仓的时候均价就是成交价。
+       另外增加了replay, 可以用numpy一次算完一批成交记录。
+    2. GridPositionHistory 把每一个完全成交的订单用二进制追加到文件里面(每条记录4个float64),
+       同时定期保存检查点(仓位、均价和已经计算过的记录数量)。重启的时候从检查点开始, 把之后的成交记录一次读出来重新计算,
+       一天的成交记录也只需要几毫秒。
+
+    使用方法:
+
+    self.position_calculator = MyGridPositionCalculator(grid_step=self.grid_step)
+    if self.cta_engine.engine_type == EngineType.LIVE:  # 只在实盘保存, 回测的strategy_name都是类名
+        self.position_history = GridPositionHistory(self.strategy_name)
+        self.position_history.load(self.position_calculator)  # on_start里面恢复仓位
+
+    # on_order里面
+    if self.position_calculator.update_position(order) and self.position_history:
+        self.position_history.record(order, self.position_calculator)
+"""
+
+import os
+from typing import Tuple
+
+import numpy as np
+
+from howtrader.trader.constant import Direction, Status
+from howtrader.trader.object import OrderData
+from howtrader.trader.utility import get_file_path, load_json, save_json
+
+POSITION_EPSILON = 1e-9  # 小于这个数量就认为仓位是0, 避免浮点数的误差.
+CHECKPOINT_INTERVAL = 100  # 每记录多少条成交保存一次检查点.
+
+
+class MyGridPositionCalculator(object):
+    """
+    网格策略的仓位和均价计算.
+    """
+
+    def __init__(self, grid_step: float = 1.0):
+        """"""
+        self.pos: float = 0.0
+        self.avg_price: float = 0.0
+        self.grid_step: float = grid_step
+
+    def update_position(self, order: OrderData) -> bool:
+        """
+        订单完全成交的时候更新仓位, 返回是否更新了.
+        """
+        if order.status != Status.ALLTRADED:
+            return False
+
+        direction = 1.0 if order.direction == Direction.LONG else -1.0
+        self.replay(np.array([direction]), np.array([order.price]), np.array([order.volume]))
+        return True
+
+    def replay(self, directions: np.ndarray, prices: np.ndarray, volumes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        一次计算一批成交(directions: 买是1, 卖是-1), 返回每一笔成交之后的仓位和均价.
+
+        用成本 cost = avg_price * abs(pos) 来计算:
+        1. 开仓或者反手: cost = price * abs(pos).
+        2. 加仓: cost += price * volume.
+        3. 多头减仓: cost -= volume * (price - grid_step), 空头减仓: cost -= volume * (price + grid_step).
+        每一段连续持仓里面cost只是累加, 所以可以用cumsum一次算完.
+        """
+        if len(directions) == 0:
+            return np.array([]), np.array([])
+
+        pos = self.pos + np.cumsum(directions * volumes)
+        pos[np.abs(pos) < POSITION_EPSILON] = 0.0
+
+        previous_pos = np.concatenate(([self.pos], pos[:-1]))
+        opening = (previous_pos == 0) | (previous_pos * pos < 0)
+        adding = ~opening & (np.abs(pos) > np.abs(previous_pos))
+        reducing = ~opening & ~adding
+
+        delta = np.zeros(len(pos))
+        delta[adding] = (prices * volumes)[adding]
+
+        long_reducing = reducing & (previous_pos > 0)
+        short_reducing = reducing & (previous_pos < 0)
+        delta[long_reducing] = -(volumes * (prices - self.grid_step))[long_reducing]
+        delta[short_reducing] = -(volumes * (prices + self.grid_step))[short_reducing]
+
+        # 每一段从最近的开仓位置开始累加.
+        cum_delta = np.cumsum(delta)
+        start = np.maximum.accumulate(np.where(opening, np.arange(len(pos)), -1))
+        start_cost = np.where(opening, prices * np.abs(pos), 0.0)
+
+        cost = np.where(
+            start >= 0,
+            start_cost[start] + cum_delta - cum_delta[start],
+            self.avg_price * abs(self.pos) + cum_delta
+        )
+
+        abs_pos = np.abs(pos)
+        avg_price = np.divide(cost, abs_pos, out=np.zeros(len(pos)), where=abs_pos > 0)
+
+        self.pos = float(pos[-1])
+        self.avg_price = float(avg_price[-1])
+
+        return pos, avg_price
+
+
+class GridPositionHistory(object):
+    """
+    保存网格策略的成交记录和检查点, 重启的时候恢复仓位.
+    """
+
+    def __init__(self, strategy_name: str):
+        """"""
+        self.history_path: str = str(get_file_path(f"grid_history_{strategy_name}.bin"))
+        self.checkpoint_filename: str = f"grid_checkpoint_{strategy_name}.json"
+
+        self.record_count: int = 0  # 文件里面的成交记录数量.
+        self.checkpoint_count: int = 0  # 检查点已经计算过的记录数量.
+
+    def load(self, calculator: MyGridPositionCalculator) -> None:
+        """
+        从检查点恢复仓位和均价, 然后把检查点之后的成交记录一次重新计算.
+        """
+        checkpoint = load_json(self.checkpoint_filename)
+        calculator.pos = checkpoint.get("pos", 0.0)
+        calculator.avg_price = checkpoint.get("avg_price", 0.0)
+        self.checkpoint_count = checkpoint.get("count", 0)
+
+        records = np.zeros((0, 4))
+        if os.path.exists(self.history_path):
+            data = np.fromfile(self.history_path, dtype=np.float64)
+            records = data[:len(data) // 4 * 4].reshape(-1, 4)  # 丢掉写了一半的记录.
+
+        self.record_count = len(records)
+
+        # records的列: 时间戳, 方向, 价格, 数量.
+        new_records = records[self.checkpoint_count:]
+        calculator.replay(new_records[:, 1], new_records[:, 2], new_records[:, 3])
+
+        self.save_checkpoint(calculator)
+
+    def record(self, order: OrderData, calculator: MyGridPositionCalculator) -> None:
+        """
+        追加一条完全成交的订单, 每CHECKPOINT_INTERVAL条保存一次检查点.
+        """
+        direction = 1.0 if order.direction == Direction.LONG else -1.0
+        timestamp = order.datetime.timestamp() if order.datetime else 0.0
+
+        with open(self.history_path, "ab") as f:
+            np.array([timestamp, direction, order.price, order.volume], dtype=np.float64).tofile(f)
+
+        self.record_count += 1
+
+        if self.record_count - self.checkpoint_count >= CHECKPOINT_INTERVAL:
+            self.save_checkpoint(calculator)
+
+    def save_checkpoint(self, calculator: MyGridPositionCalculator) -> None:
+        """
+        保存当前的仓位、均价和已经计算过的记录数量.
+        """
+        self.checkpoint_count = self.record_count
+        save_json(self.checkpoint_filename, {
+            "pos": calculator.pos,
+            "avg_price": calculator.avg_price,
+            "count": self.checkpoint_count
+        })
@@ -7,11 +7,18 @@ from howtrader.app.cta_strategy import (
     OrderData
 )
 
-from howtrader.app.cta_strategy.engine import CtaEngine
-from howtrader.trader.event import EVENT_TIMER
-from howtrader.event import Event
-from howtrader.trader.object import Direction, Status
-from howtrader.trader.object import GridPositionCalculator
+from howtrader.app.cta_strategy.engine import CtaEngine, EngineType
+from howtrader.trader.object import Direction, Offset, Status
+from typing import List
+
+from strategies.timer_scheduler import TimerScheduler, ScheduledTimer
+from strategies.order_book import MyOrderBook
+from strategies.grid_position import MyGridPositionCalculator, GridPositionHistory
+from strategies.batch_order import send_orders
+
+NORMAL_TIMER_INTERVAL = 15
+PROFIT_TIMER_INTERVAL = 1
+STOP_TIMER_INTERVAL = 60
 
 
 class HighFrequencyStrategy(CtaTemplate):
@@ -30,6 +37,8 @@ class HighFrequencyStrategy(CtaTemplate):
     max_pos = 15.0  # 最大的持仓数量.
     stop_mins = 15.0  # 出现亏损是，暂停多长时间.
 
+    fast_lane = True  # tick和订单走快速通道, 需要使用fast_lane.py里面的引擎，普通的引擎会忽略这个设置.
+
     # 2 --  600 ， 698 696， 。。。。。 500  # 550 - 26 * 2 = 500
 
     # 变量.
@@ -43,21 +52,18 @@ class HighFrequencyStrategy(CtaTemplate):
         """"""
         super().__init__(cta_engine, strategy_name, vt_symbol, setting)
 
-        self.position = GridPositionCalculator(grid_step=self.grid_step)
+        self.position = MyGridPositionCalculator(grid_step=self.grid_step)
         self.avg_price = self.position.avg_price
         self.current_pos = self.position.pos
+        self.position_history: GridPositionHistory = None
 
         # orders
-        self.long_orders = []
-        self.short_orders = []
-
-        self.stop_orders = []
-        self.profit_orders = []
+        self.order_book = MyOrderBook(self)  # 订单的角色: "long", "short", "stop", "profit"
 
-        self.timer_count = 0
-        self.stop_loss_interval = 0
+        self.scheduler: TimerScheduler = None
+        self.timers: List[ScheduledTimer] = []  # 注册的定时任务.
+        self.stop_reset_timer: ScheduledTimer = None  # 止损之后重新开始的定时任务, 同一时间只有一个.
         self.trigger_stop_loss = False
-        self.cancel_order_interval = 0
 
         self.tick: TickData = None
         self.last_filled_order: OrderData = None
@@ -73,77 +79,129 @@ class HighFrequencyStrategy(CtaTemplate):
         Callback when strategy is started.
         """
         self.write_log("策略启动")
-        self.cta_engine.event_engine.register(EVENT_TIMER, self.process_timer_event)
+
+        # fast_lane为True的时候, 定时任务和tick在同一个线程回调.
+        self.scheduler = TimerScheduler.get_scheduler(self.cta_engine.event_engine, fast_lane=self.fast_lane)
+        self.timers = [
+            self.scheduler.schedule_every(PROFIT_TIMER_INTERVAL, self.check_profit_orders),
+            self.scheduler.schedule_every(NORMAL_TIMER_INTERVAL, self.check_grid_orders),
+            self.scheduler.schedule_every(STOP_TIMER_INTERVAL, self.check_stop_orders)
+        ]
+
+        # 从检查点和之后的成交记录恢复仓位, 重启不会丢失手上的仓位.
+        self.position = MyGridPositionCalculator(grid_step=self.grid_step)
+        # 回测的strategy_name都是类名, 不读写成交记录, 不然所有的回测共用一个文件.
+        if self.cta_engine.engine_type == EngineType.LIVE:
+            self.position_history = GridPositionHistory(self.strategy_name)
+            self.position_history.load(self.position)
+        self.avg_price = self.position.avg_price
+        self.current_pos = self.position.pos
 
     def on_stop(self):
         """
         Callback when strategy is stopped.
         """
         self.write_log("策略停止")
-        self.cta_engine.event_engine.unregister(EVENT_TIMER, self.process_timer_event)
 
-    def process_timer_event(self, event: Event):
+        for timer in self.timers:
+            timer.cancel()
+        self.timers.clear()
 
-        self.timer_count += 1
+        if self.stop_reset_timer:
+            self.stop_reset_timer.cancel()
+            self.stop_reset_timer = None
 
-        if self.timer_count >= 60:
-            self.timer_count = 0
+        if self.position_history:
+            self.position_history.save_checkpoint(self.position)
 
-            # 撤销止损单子.
-            for vt_id in self.stop_orders:
-                self.cancel_order(vt_id)
+    def check_stop_orders(self):
+        """
+        每STOP_TIMER_INTERVAL秒把没有成交的止损单改到最新的盘口价格, 止损条件不满足了就撤单.
+        """
+        if self.order_book.count("stop") == 0 or not self.tick:
+            return
 
-        if self.trigger_stop_loss:
-            self.stop_loss_interval += 1
+        if abs(self.position.pos) >= (self.max_pos * self.trading_size):
+            if self.position.pos > 0:
+                stop_price = self.position.avg_price - self.stop_multiplier * self.grid_step
+                if self.tick.ask_price_1 < stop_price:
+                    vt_ids = self.order_book.requote_order("stop", Direction.SHORT, Offset.CLOSE, self.tick.ask_price_1, abs(self.position.pos))
+                    print(f"多头止损单改单: {vt_ids}@{self.tick.ask_price_1}")
+                    return
 
-        # 止盈的条件, 可以放到tick里面，也可以放到定时器这里.
+            elif self.position.pos < 0:
+                stop_price = self.position.avg_price + self.stop_multiplier * self.grid_step
+                if self.tick.bid_price_1 > stop_price:
+                    vt_ids = self.order_book.requote_order("stop", Direction.LONG, Offset.CLOSE, self.tick.bid_price_1, abs(self.position.pos))
+                    print(f"空头止损单改单: {vt_ids}@{self.tick.bid_price_1}")
+                    return
+
+        self.order_book.cancel_orders("stop")
+
+    def check_profit_orders(self):
+        """
+        止盈的条件, 可以放到tick里面，也可以放到定时器这里.
+        """
         if abs(self.position.pos) > 0 and self.tick:
 
-            if self.position.pos > 0 and len(self.profit_orders) == 0:
+            if self.position.pos > 0 and self.order_book.count("profit") == 0:
 
                 price = self.position.avg_price + self.grid_step
                 price = max(price, self.tick.ask_price_1 * (1 + 0.0001))
 
                 vts = self.sell(price, abs(self.position.pos))
-                self.profit_orders.extend(vts)
+                self.order_book.add_orders(vts, "profit")
                 print(f"多头重新下止盈单子: {vts}@{price}")
 
-            elif self.position.pos < 0 and len(self.profit_orders) == 0:
+            elif self.position.pos < 0 and self.order_book.count("profit") == 0:
 
                 price = self.position.avg_price - self.grid_step
                 price = min(price, self.tick.bid_price_1 * (1 - 0.0001))
 
                 vts = self.cover(price, abs(self.position.pos))
-                self.profit_orders.extend(vts)
+                self.order_book.add_orders(vts, "profit")
                 print(f"空头重新下止盈单子: {vts}@{price}")
 
-        self.cancel_order_interval += 1
-
-        if self.cancel_order_interval >= 15:
+    def check_grid_orders(self):
+        """
+        每NORMAL_TIMER_INTERVAL秒检查一次网格的订单.
+        """
+        if abs(self.position.pos) < self.trading_size and (self.order_book.count("long") == 0 or self.order_book.count("short") == 0):
+            self.order_book.cancel_all()
+            print("当前没有仓位，多空单子不对等，需要重新开始. 先撤销所有订单.")
 
-            self.cancel_order_interval = 0
+        elif 0 < abs(self.position.pos) < (self.max_pos * self.trading_size):
+            if self.position.pos > 0 and self.order_book.count("long") == 0 and self.last_filled_order:
 
-            if abs(self.position.pos) < self.trading_size and (len(self.long_orders) == 0 or len(self.short_orders) == 0):
-                self.cancel_all()
-                print("当前没有仓位，多空单子不对等，需要重新开始. 先撤销所有订单.")
+                step = self.get_step()
+                price = self.last_filled_order.price - self.grid_step * step
+                price = min(price, self.tick.bid_price_1 * (1 - 0.0001))
+                ids = self.buy(price, self.trading_size)
+                self.order_book.add_orders(ids, "long")
 
-            elif 0 < abs(self.position.pos) < (self.max_pos * self.trading_size):
-                if self.position.pos > 0 and len(self.long_orders) == 0 and self.last_filled_order:
+            elif self.position.pos < 0 and self.order_book.count("short") == 0 and self.last_filled_order:
 
-                    step = self.get_step()
-                    price = self.last_filled_order.price - self.grid_step * step
-                    price = min(price, self.tick.bid_price_1 * (1 - 0.0001))
-                    ids = self.buy(price, self.trading_size)
-                    self.long_orders.extend(ids)
+                step = self.get_step()
+                price = self.last_filled_order.price + self.grid_step * step
+                price = max(price, self.tick.ask_price_1 * (1 + 0.0001))
 
-                elif self.position.pos < 0 and len(self.short_orders) == 0 and self.last_filled_order:
+                ids = self.short(price, self.trading_size)  #short sell
+                self.order_book.add_orders(ids, "short")
 
-                    step = self.get_step()
-                    price = self.last_filled_order.price + self.grid_step * step
-                    price = max(price, self.tick.ask_price_1 * (1 + 0.0001))
+    def schedule_stop_reset(self):
+        """
+        止损后休息stop_mins分钟. 之前的定时任务先取消, 否则它会提前到期, 让这一次的休息提前结束.
+        """
+        if self.stop_reset_timer:
+            self.stop_reset_timer.cancel()
+        self.stop_reset_timer = self.scheduler.schedule_once(self.stop_mins * 60, self.reset_stop_loss)
 
-                    ids = self.short(price, self.trading_size)  #short sell
-                    self.short_orders.extend(ids)
+    def reset_stop_loss(self):
+        """
+        止损后休息stop_mins分钟, 然后重新开始.
+        """
+        self.trigger_stop_loss = False
+        self.stop_reset_timer = None
 
     def on_tick(self, tick: TickData):
         """
@@ -161,42 +219,42 @@ class HighFrequencyStrategy(CtaTemplate):
 
         if abs(self.position.pos) < self.trading_size:  # 仓位为零的情况.
 
-            if len(self.long_orders) == 0 and len(self.short_orders) == 0:
+            if self.order_book.count("long") == 0 and self.order_book.count("short") == 0:
 
                 if self.trigger_stop_loss:
-                    # 记录设置过的止损条件.
-                    if self.stop_loss_interval < self.stop_mins * 60:  # 休息15分钟.
-                        return
-                    else:
-                        self.trigger_stop_loss = False
-                        self.stop_loss_interval = 0
+                    # 记录设置过的止损条件, 休息stop_mins分钟后由reset_stop_loss重置.
+                    return
 
                 buy_price = tick.bid_price_1 - self.grid_step / 2
                 sell_price = tick.bid_price_1 + self.grid_step / 2
 
-                long_ids = self.buy(buy_price, self.trading_size)
-                short_ids = self.short(sell_price, self.trading_size)
+                long_ids, short_ids = send_orders(self, [
+                    (Direction.LONG, Offset.OPEN, buy_price, self.trading_size),
+                    (Direction.SHORT, Offset.OPEN, sell_price, self.trading_size)
+                ])
 
-                self.long_orders.extend(long_ids)
-                self.short_orders.extend(short_ids)
+                self.order_book.add_orders(long_ids, "long")
+                self.order_book.add_orders(short_ids, "short")
 
                 print(f"开始新的一轮状态: long_orders: {long_ids}@{buy_price}, short_orders:{short_ids}@{sell_price}")
 
-        if abs(self.position.pos) >= (self.max_pos * self.trading_size) and len(self.stop_orders) == 0:
+        if abs(self.position.pos) >= (self.max_pos * self.trading_size) and self.order_book.count("stop") == 0:
 
             if self.position.pos > 0 and tick.ask_price_1 < self.position.avg_price - self.stop_multiplier * self.grid_step:
                 vt_ids = self.sell(tick.ask_price_1, abs(self.position.pos))
                 stop_price = self.position.avg_price - self.stop_multiplier * self.grid_step
-                self.stop_orders.extend(vt_ids)
+                self.order_book.add_orders(vt_ids, "stop")
                 self.trigger_stop_loss = True
+                self.schedule_stop_reset()
                 print(f"下多头止损单: stop_price: {stop_price}stop@{tick.ask_price_1}")
 
             elif self.position.pos < 0 and tick.bid_price_1 > self.position.avg_price + self.stop_multiplier * self.grid_step:
 
                 stop_price = self.position.avg_price + self.stop_multiplier * self.grid_step
                 vt_ids = self.cover(tick.bid_price_1, abs(self.position.pos))
-                self.stop_orders.extend(vt_ids)
+                self.order_book.add_orders(vt_ids, "stop")
                 self.trigger_stop_loss = True
+                self.schedule_stop_reset()
                 print(f"下空头止损单: stop_price: {stop_price}stop@{tick.bid_price_1}")
 
     def on_bar(self, bar: BarData):
@@ -231,17 +289,20 @@ class HighFrequencyStrategy(CtaTemplate):
         """
         Callback of new order data update.
         """
-        self.position.update_position(order)
+        self.order_book.on_order(order)  # 撤单成功之后下替换的订单, 要在处理订单之前调用.
+        if self.position.update_position(order) and self.position_history:
+            self.position_history.record(order, self.position)
         self.current_pos = self.position.pos
         self.avg_price = self.position.avg_price
 
-        if order.vt_orderid in self.long_orders:
+        role = self.order_book.get_role(order.vt_orderid)
+
+        if role == "long":
             if order.status == Status.ALLTRADED:
-                self.long_orders.remove(order.vt_orderid)
+                self.order_book.remove_order(order.vt_orderid)
 
                 print("多头成交，撤销空头订单和止盈订单")
-                for vt_id in (self.short_orders + self.profit_orders):
-                    self.cancel_order(vt_id)
+                self.order_book.cancel_orders("short", "profit")
 
                 self.last_filled_order = order
 
@@ -254,19 +315,18 @@ class HighFrequencyStrategy(CtaTemplate):
                         price = order.price - self.grid_step * step
                         price = min(price, self.tick.bid_price_1 * (1 - 0.0001))
                         ids = self.buy(price, self.trading_size)
-                        self.long_orders.extend(ids)
+                        self.order_book.add_orders(ids, "long")
                         print(f"多头仓位继续下多头订单: {ids}@{price}")
 
             elif order.status in [Status.REJECTED, Status.CANCELLED]:
-                self.long_orders.remove(order.vt_orderid)
+                self.order_book.remove_order(order.vt_orderid)
 
-        elif order.vt_orderid in self.short_orders:
+        elif role == "short":
             if order.status == Status.ALLTRADED:
-                self.short_orders.remove(order.vt_orderid)
+                self.order_book.remove_order(order.vt_orderid)
 
                 print("空头成交，撤销多头订单和止盈订单")
-                for vt_id in (self.long_orders + self.profit_orders):
-                    self.cancel_order(vt_id)
+                self.order_book.cancel_orders("long", "profit")
 
                 self.last_filled_order = order
 
@@ -280,20 +340,16 @@ class HighFrequencyStrategy(CtaTemplate):
                         price = max(price, self.tick.ask_price_1 * (1 + 0.0001))
 
                         ids = self.short(price, self.trading_size)
-                        self.short_orders.extend(ids)
+                        self.order_book.add_orders(ids, "short")
 
                         print(f"空头仓位继续下空头订单: {ids}@{price}")
 
             elif order.status in [Status.REJECTED, Status.CANCELLED]:
-                self.short_orders.remove(order.vt_orderid)  # remove orderid
-
-        elif order.vt_orderid in self.stop_orders:
-            if not order.is_active():
-                self.stop_orders.remove(order.vt_orderid)
+                self.order_book.remove_order(order.vt_orderid)  # remove orderid
 
-        elif order.vt_orderid in self.profit_orders:
+        elif role in ("stop", "profit"):
             if not order.is_active():
-                self.profit_orders.remove(order.vt_orderid)
+                self.order_book.remove_order(order.vt_orderid)
 
         self.put_event()
 
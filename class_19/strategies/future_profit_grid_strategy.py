@@ -7,11 +7,14 @@ from howtrader.app.cta_strategy import (
     OrderData
 )
 
-from howtrader.app.cta_strategy.engine import CtaEngine
-from howtrader.trader.event import EVENT_TIMER
-from howtrader.event import Event
-from howtrader.trader.object import Status, Direction
-from howtrader.trader.object import GridPositionCalculator
+from howtrader.app.cta_strategy.engine import CtaEngine, EngineType
+from howtrader.trader.object import Status, Direction, Offset
+from typing import List
+
+from strategies.timer_scheduler import TimerScheduler, ScheduledTimer
+from strategies.order_book import MyOrderBook
+from strategies.grid_position import MyGridPositionCalculator, GridPositionHistory
+from strategies.batch_order import send_orders
 
 NORMAL_TIMER = 5
 PROFIT_TIMER_INTERVAL = 5
@@ -51,19 +54,15 @@ class FutureProfitGridStrategy(CtaTemplate):
         """"""
         super().__init__(cta_engine, strategy_name, vt_symbol, setting)
 
-        self.position_calculator = GridPositionCalculator(grid_step=self.grid_step)  # 计算仓位用的对象
+        self.position_calculator = MyGridPositionCalculator(grid_step=self.grid_step)  # 计算仓位用的对象
         self.current_pos = self.position_calculator.pos
+        self.position_history: GridPositionHistory = None
         self.avg_price = self.position_calculator.avg_price
 
-        self.normal_timer_interval = 0
-        self.profit_order_interval = 0
-        self.stop_order_interval = 0
-        self.stop_strategy_interval = 0
+        self.timers: List[ScheduledTimer] = []  # 注册的定时任务.
+        self.stop_reset_timer: ScheduledTimer = None  # 止损之后重新开始的定时任务, 同一时间只有一个.
 
-        self.long_orders = []  # 所有的long orders.
-        self.short_orders = []  # 所有的short orders.
-        self.profit_orders = []  # profit orders.
-        self.stop_orders = []  # stop orders.
+        self.order_book = MyOrderBook(self)  # 订单的角色: "long", "short", "profit", "stop"
 
         self.trigger_stop_loss = False  # 是否触发止损。
 
@@ -82,9 +81,19 @@ class FutureProfitGridStrategy(CtaTemplate):
         Callback when strategy is started.
         """
         self.write_log("策略启动")
-        self.cta_engine.event_engine.register(EVENT_TIMER, self.process_timer_event)
-        self.position_calculator = GridPositionCalculator(
-            grid_step=self.grid_step)  # 计算仓位用的对象 
+
+        scheduler = TimerScheduler.get_scheduler(self.cta_engine.event_engine)
+        self.timers = [
+            scheduler.schedule_every(NORMAL_TIMER, self.check_grid_orders),
+            scheduler.schedule_every(PROFIT_TIMER_INTERVAL, self.check_profit_orders),
+            scheduler.schedule_every(STOP_TIMER_INTERVAL, self.check_stop_orders)
+        ]
+        # 从检查点和之后的成交记录恢复仓位, 重启不会丢失手上的仓位.
+        self.position_calculator = MyGridPositionCalculator(grid_step=self.grid_step)  # 计算仓位用的对象
+        # 回测的strategy_name都是类名, 不读写成交记录, 不然所有的回测共用一个文件.
+        if self.cta_engine.engine_type == EngineType.LIVE:
+            self.position_history = GridPositionHistory(self.strategy_name)
+            self.position_history.load(self.position_calculator)
         self.avg_price = self.position_calculator.avg_price
         self.current_pos = self.position_calculator.pos
 
@@ -93,125 +102,152 @@ class FutureProfitGridStrategy(CtaTemplate):
         Callback when strategy is stopped.
         """
         self.write_log("策略停止")
-        self.cta_engine.event_engine.unregister(EVENT_TIMER, self.process_timer_event)
 
-    def process_timer_event(self, event: Event):
+        for timer in self.timers:
+            timer.cancel()
+        self.timers.clear()
+
+        if self.stop_reset_timer:
+            self.stop_reset_timer.cancel()
+            self.stop_reset_timer = None
 
+        if self.position_history:
+            self.position_history.save_checkpoint(self.position_calculator)
+
+    def check_grid_orders(self):
+        """
+        每NORMAL_TIMER秒检查一次网格的双边订单.
+        """
         if self.tick is None:
             return
 
-        if self.trigger_stop_loss:
-            self.stop_strategy_interval += 1  # 如果触发了止损，然后就会开始计时.
+        # 仓位为零的时候
+        if abs(self.position_calculator.pos) < self.trading_size:
+            if self.order_book.count("long") == 0 and self.order_book.count("short") == 0:
+                if self.trigger_stop_loss:
+                    # 如果触发了止损就需要休息一段时间, 休息结束由reset_stop_loss重置.
+                    return
 
-        self.normal_timer_interval += 1
+                buy_price = self.tick.bid_price_1 - self.grid_step / 2
+                sell_price = self.tick.bid_price_1 + self.grid_step / 2
+                long_ids, short_ids = send_orders(self, [
+                    (Direction.LONG, Offset.OPEN, buy_price, self.trading_size),
+                    (Direction.SHORT, Offset.OPEN, sell_price, self.trading_size)
+                ])
 
-        if self.normal_timer_interval >= NORMAL_TIMER:
-            self.normal_timer_interval = 0
+                self.order_book.add_orders(long_ids, "long")
+                self.order_book.add_orders(short_ids, "short")
 
-            # 仓位为零的时候
-            if abs(self.position_calculator.pos) < self.trading_size:
-                if len(self.long_orders) == 0 and len(self.short_orders) == 0:
-                    if self.trigger_stop_loss:
-                        # 如果触发了止损就需要休息一段时间.
-                        if self.stop_order_interval < self.stop_minutes * 60:
-                            return
-                        else:
-                            self.stop_order_interval = 0
-                            self.trigger_stop_loss = False
+                print(
+                    f"开启网格交易，双边下单：LONG: {long_ids}: {buy_price}, SHORT: {short_ids}:{sell_price}")
 
-                    buy_price = self.tick.bid_price_1 - self.grid_step / 2
-                    sell_price = self.tick.bid_price_1 + self.grid_step / 2
-                    long_ids = self.buy(buy_price, self.trading_size)
-                    short_ids = self.short(sell_price, self.trading_size)
+            elif self.order_book.count("long") == 0 or self.order_book.count("short") == 0:
+                print(f"仓位为零且单边网格没有订单, 先撤掉所有订单")
+                self.order_book.cancel_all()
 
-                    self.long_orders.extend(long_ids)
-                    self.short_orders.extend(short_ids)
+        elif abs(self.position_calculator.pos) >= self.trading_size:
 
-                    print(
-                        f"开启网格交易，双边下单：LONG: { self.long_orders}: {buy_price}, SHORT: { self.short_orders}:{sell_price}")
+            if self.order_book.count("long") > 0 and self.order_book.count("short") > 0:
+                return
 
-                elif len(self.long_orders) == 0 or len(self.short_orders) == 0:
-                    print(f"仓位为零且单边网格没有订单, 先撤掉所有订单")
-                    self.cancel_all()
+            if self.last_filled_order:
+                price = self.last_filled_order.price
+            else:
+                price = self.tick.bid_price_1
 
-            elif abs(self.position_calculator.pos) >= self.trading_size:
+            buy_step = self.get_step()
+            sell_step = self.get_step()
 
-                if len(self.long_orders) > 0 and len(self.short_orders) > 0:
-                    return
+            buy_price = price - buy_step * self.grid_step
+            sell_price = price + sell_step * self.grid_step
 
-                if self.last_filled_order:
-                    price = self.last_filled_order.price
-                else:
-                    price = self.tick.bid_price_1
+            buy_price = min(self.tick.bid_price_1, buy_price)
+            sell_price = max(self.tick.ask_price_1, sell_price)
+            long_ids, short_ids = send_orders(self, [
+                (Direction.LONG, Offset.OPEN, buy_price, self.trading_size),
+                (Direction.SHORT, Offset.OPEN, sell_price, self.trading_size)
+            ])
 
-                buy_step = self.get_step()
-                sell_step = self.get_step()
+            self.order_book.add_orders(long_ids, "long")
+            self.order_book.add_orders(short_ids, "short")
+            print(f"仓位不为零, 根据上个订单下双边网格.LONG:{long_ids}:{buy_price}, SHORT: {short_ids}:{sell_price}")
 
-                buy_price = price - buy_step * self.grid_step
-                sell_price = price + sell_step * self.grid_step
-
-                buy_price = min(self.tick.bid_price_1, buy_price)
-                sell_price = max(self.tick.ask_price_1, sell_price)
-                long_ids = self.buy(buy_price, self.trading_size)
-                short_ids = self.short(sell_price, self.trading_size)
-
-                self.long_orders.extend(long_ids)
-                self.short_orders.extend(short_ids)
-                print(f"仓位不为零, 根据上个订单下双边网格.LONG:{long_ids}:{buy_price}, SHORT: {short_ids}:{sell_price}")
+    def check_profit_orders(self):
+        """
+        每PROFIT_TIMER_INTERVAL秒检查一次是否需要下止盈单.
+        """
+        if self.tick is None:
+            return
 
-        self.profit_order_interval += 1
+        if abs(self.position_calculator.pos) >= self.profit_orders_counts * self.trading_size and self.order_book.count("profit") == 0:
+            print(f"单边网格出现超过{self.profit_orders_counts}个订单以上,头寸为:{self.position_calculator.pos}, 考虑设置止盈的情况")
+
+            if self.position_calculator.pos > 0:
+                price = max(self.tick.ask_price_1 * (1 + 0.0001),
+                            self.position_calculator.avg_price + self.profit_step)
+                order_ids = self.short(price, abs(self.position_calculator.pos))
+                self.order_book.add_orders(order_ids, "profit")
+                print(f"多头止盈情况: {self.position_calculator.pos}@{price}")
+            elif self.position_calculator.pos < 0:
+                price = min(self.tick.bid_price_1 * (1 - 0.0001),
+                            self.position_calculator.avg_price - self.profit_step)
+                order_ids = self.buy(price, abs(self.position_calculator.pos))
+                self.order_book.add_orders(order_ids, "profit")
+                print(f"空头止盈情况: {self.position_calculator.pos}@{price}")
+
+    def check_stop_orders(self):
+        """
+        每STOP_TIMER_INTERVAL秒检查是否需要止损, 需要止损就把止损单改到最新的盘口价格(没有止损单就下单), 否则撤销止损单.
+        """
+        if self.tick is None:
+            return
 
-        if self.profit_order_interval >= PROFIT_TIMER_INTERVAL:
-            self.profit_order_interval = 0
+        stop_direction = None
+        stop_price = 0.0
 
-            if abs(self.position_calculator.pos) >= self.profit_orders_counts * self.trading_size and len(
-                    self.profit_orders) == 0:
-                print(f"单边网格出现超过{self.profit_orders_counts}个订单以上,头寸为:{self.position_calculator.pos}, 考虑设置止盈的情况")
+        # 如果仓位达到最大值的时候.
+        if abs(self.position_calculator.pos) >= self.max_pos * self.trading_size:
 
+            if self.last_filled_order:
                 if self.position_calculator.pos > 0:
-                    price = max(self.tick.ask_price_1 * (1 + 0.0001),
-                                self.position_calculator.avg_price + self.profit_step)
-                    order_ids = self.short(price, abs(self.position_calculator.pos))
-                    self.profit_orders.extend(order_ids)
-                    print(f"多头止盈情况: {self.position_calculator.pos}@{price}")
-                elif self.position_calculator.pos < 0:
-                    price = min(self.tick.bid_price_1 * (1 - 0.0001),
-                                self.position_calculator.avg_price - self.profit_step)
-                    order_ids = self.buy(price, abs(self.position_calculator.pos))
-                    self.profit_orders.extend(order_ids)
-                    print(f"空头止盈情况: {self.position_calculator.pos}@{price}")
+                    if self.tick.bid_price_1 < self.last_filled_order.price - self.trailing_stop_multiplier * self.grid_step:
+                        stop_direction, stop_price = Direction.SHORT, self.tick.bid_price_1
 
-        self.stop_order_interval += 1
-        if self.stop_order_interval >= STOP_TIMER_INTERVAL:
-            self.stop_order_interval = 0
+                elif self.position_calculator.pos < 0:
+                    if self.tick.ask_price_1 > self.last_filled_order.price + self.trailing_stop_multiplier * self.grid_step:
+                        stop_direction, stop_price = Direction.LONG, self.tick.ask_price_1
 
-            for vt_id in self.stop_orders:
-                self.cancel_order(vt_id)
+            else:
+                if self.position_calculator.pos > 0:
+                    if self.tick.bid_price_1 < self.position_calculator.avg_price - self.max_pos * self.grid_step:
+                        stop_direction, stop_price = Direction.SHORT, self.tick.bid_price_1
 
-            # 如果仓位达到最大值的时候.
-            if abs(self.position_calculator.pos) >= self.max_pos * self.trading_size:
+                elif self.position_calculator.pos < 0:
+                    if self.tick.ask_price_1 > self.position_calculator.avg_price + self.max_pos * self.grid_step:
+                        stop_direction, stop_price = Direction.LONG, self.tick.ask_price_1
 
-                if self.last_filled_order:
-                    if self.position_calculator.pos > 0:
-                        if self.tick.bid_price_1 < self.last_filled_order.price - self.trailing_stop_multiplier * self.grid_step:
-                            vt_ids = self.short(self.tick.bid_price_1, abs(self.position_calculator.pos))
-                            self.stop_orders.extend(vt_ids)
+        if stop_direction:
+            vt_ids = self.order_book.requote_order("stop", stop_direction, Offset.OPEN, stop_price, abs(self.position_calculator.pos))
+            print(f"止损单: {vt_ids}@{stop_price}")
+        else:
+            self.order_book.cancel_orders("stop")
 
-                    elif self.position_calculator.pos < 0:
-                        if self.tick.ask_price_1 > self.last_filled_order.price + self.trailing_stop_multiplier * self.grid_step:
-                            vt_ids = self.buy(self.tick.ask_price_1, abs(self.position_calculator.pos))
-                            self.stop_orders.extend(vt_ids)
+    def schedule_stop_reset(self):
+        """
+        止损后休息stop_minutes分钟. 之前的定时任务先取消, 否则它会提前到期, 让这一次的休息提前结束.
+        """
+        if self.stop_reset_timer:
+            self.stop_reset_timer.cancel()
 
-                else:
-                    if self.position_calculator.pos > 0:
-                        if self.tick.bid_price_1 < self.position_calculator.avg_price - self.max_pos * self.grid_step:
-                            vt_ids = self.short(self.tick.bid_price_1, abs(self.position_calculator.pos))
-                            self.stop_orders.extend(vt_ids)
+        scheduler = TimerScheduler.get_scheduler(self.cta_engine.event_engine)
+        self.stop_reset_timer = scheduler.schedule_once(self.stop_minutes * 60, self.reset_stop_loss)
 
-                    elif self.position_calculator.pos < 0:
-                        if self.tick.ask_price_1 > self.position_calculator.avg_price + self.max_pos * self.grid_step:
-                            vt_ids = self.buy(self.tick.ask_price_1, abs(self.position_calculator.pos))
-                            self.stop_orders.extend(vt_ids)
+    def reset_stop_loss(self):
+        """
+        止损后休息stop_minutes分钟, 然后重新开始.
+        """
+        self.trigger_stop_loss = False
+        self.stop_reset_timer = None
 
     def on_tick(self, tick: TickData):
         """
@@ -229,26 +265,24 @@ class FutureProfitGridStrategy(CtaTemplate):
         """
         Callback of new order data update.
         """
-        self.position_calculator.update_position(order)
+        self.order_book.on_order(order)  # 撤单成功之后下替换的订单, 要在处理订单之前调用.
+        if self.position_calculator.update_position(order) and self.position_history:
+            self.position_history.record(order, self.position_calculator)
 
         self.current_pos = self.position_calculator.pos
         self.avg_price = self.position_calculator.avg_price
 
         if order.status == Status.ALLTRADED:
-            if order.vt_orderid in (self.long_orders + self.short_orders):
-
-                if order.vt_orderid in self.long_orders:
-                    self.long_orders.remove(order.vt_orderid)
-
-                if order.vt_orderid in self.short_orders:
-                    self.short_orders.remove(order.vt_orderid)
+            role = self.order_book.remove_order(order.vt_orderid)
 
-                self.cancel_all()
-                print(f"订单买卖单完全成交, 先撤销所有订单")
+            if role in ("long", "short"):
+                self.order_book.cancel_orders("profit", "stop")
+                print(f"订单买卖单完全成交, 先撤销止盈止损订单")
 
                 self.last_filled_order = order
 
                 if abs(self.position_calculator.pos) < self.trading_size:
+                    self.order_book.cancel_orders("long", "short")
                     print("仓位为零， 需要重新开始.")
                     return
 
@@ -264,41 +298,31 @@ class FutureProfitGridStrategy(CtaTemplate):
                     buy_price = min(self.tick.bid_price_1 * (1 - 0.0001), buy_price)
                     sell_price = max(self.tick.ask_price_1 * (1 + 0.0001), sell_price)
 
-                    long_ids = self.buy(buy_price, self.trading_size)
-                    short_ids = self.short(sell_price, self.trading_size)
-
-                    self.long_orders.extend(long_ids)
-                    self.short_orders.extend(short_ids)
+                    # 成交的一边下新的订单, 另一边还没成交的订单直接改单, 不需要撤单再下单.
+                    long_ids = self.order_book.requote_order("long", Direction.LONG, Offset.OPEN, buy_price, self.trading_size)
+                    short_ids = self.order_book.requote_order("short", Direction.SHORT, Offset.OPEN, sell_price, self.trading_size)
 
                     print(
-                        f"订单完全成交, 分别下双边网格: LONG: {self.long_orders}:{buy_price}, SHORT: {self.short_orders}:{sell_price}")
+                        f"订单完全成交, 分别下双边网格: LONG: {long_ids}:{buy_price}, SHORT: {short_ids}:{sell_price}")
 
-            elif order.vt_orderid in self.profit_orders:
-                self.profit_orders.remove(order.vt_orderid)
+                else:
+                    self.order_book.cancel_orders("long", "short")
+
+            elif role == "profit":
                 if abs(self.position_calculator.pos) < self.trading_size:
-                    self.cancel_all()
+                    self.order_book.cancel_all()
                     print(f"止盈单子成交,且仓位为零, 先撤销所有订单，然后重新开始")
 
-            elif order.vt_orderid in self.stop_orders:
-                self.stop_orders.remove(order.vt_orderid)
+            elif role == "stop":
                 if abs(self.position_calculator.pos) < self.trading_size:
                     self.trigger_stop_loss = True
-                    self.cancel_all()
+                    self.order_book.cancel_all()
+                    self.schedule_stop_reset()
 
                     print("止损单子成交，且仓位为零, 先撤销所有订单，然后重新开始")
 
         if not order.is_active():
-            if order.vt_orderid in self.long_orders:
-                self.long_orders.remove(order.vt_orderid)
-
-            elif order.vt_orderid in self.short_orders:
-                self.short_orders.remove(order.vt_orderid)
-
-            elif order.vt_orderid in self.profit_orders:
-                self.profit_orders.remove(order.vt_orderid)
-
-            elif order.vt_orderid in self.stop_orders:
-                self.stop_orders.remove(order.vt_orderid)
+            self.order_book.remove_order(order.vt_orderid)
 
         self.put_event()
 
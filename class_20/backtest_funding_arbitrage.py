@@ -0,0 +1,34 @@
+from datetime import datetime
+
+import pandas as pd
+
+from funding_arbitrage_backtesting import FundingArbitrageBacktestingEngine
+from funding_rate_store import FundingRateStore
+
+pd.set_option('expand_frame_repr', False)
+
+if __name__ == '__main__':
+    # 先用 crawl_funding_rate.py 下载资金费率, 再用class_09的crawl_data.py下载现货和合约的1分钟K线.
+    store = FundingRateStore()
+
+    engine = FundingArbitrageBacktestingEngine()
+    engine.set_parameters(
+        symbols=store.symbols,  # 也可以只回测几个交易对, 如 ["BTCUSDT", "ETHUSDT"]
+        start=datetime(2021, 1, 1),
+        end=datetime(2021, 4, 1),
+        setting={
+            "initial_target_pos": 1,
+            "trade_max_usd_every_time": 1000,
+            "slippage_tolerance_pct": 0.03,
+            "open_spread_pct": 0.1,
+            "open_rate_pct": 0.03,
+            "close_spread_pct": 0.0,
+            "close_rate_pct": 0.0,
+        }
+    )
+
+    engine.load_data(store)
+    engine.run_backtesting()
+
+    df = engine.calculate_result()  # 按收益率排序的每个交易对的结果
+    print(df.head(20))
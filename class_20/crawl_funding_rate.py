@@ -0,0 +1,147 @@
+"""
+    下载币安U本位永续合约的资金费率历史, 保存到 funding_rate_store.py 的列式存储里面.
+
+    1. 从 exchangeInfo 获取所有USDT永续合约.
+    2. 每个交易对从已经保存的最后一次资金费率之后开始增量下载, 每次请求1000条, 一页一页往后翻.
+    3. 多个交易对用线程池同时下载, 下载完一起合并保存.
+
+    下载完之后可以直接查询, 比如最近7天资金费率之和最高的10个交易对:
+    store.top_symbols(days=7, n=10)
+"""
+
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import List
+
+import numpy as np
+import requests
+
+from funding_rate_store import FundingRateStore
+
+BINANCE_FUNDING_LIMIT = 1000
+EXCHANGE_INFO_URL = "https://fapi.binance.com/fapi/v1/exchangeInfo"
+FUNDING_RATE_URL = "https://fapi.binance.com/fapi/v1/fundingRate"
+
+MAX_WORKERS = 5  # 同时下载的交易对数量, 太多容易触发币安的频率限制.
+MAX_RETRIES = 5  # 同一页连续出错的最多重试次数, 超过就跳过这个交易对.
+RETRY_INTERVAL = 10  # 出错之后等待的秒数.
+
+# 可以重试的错误码: 未知错误、连接断开、频率限制、超时、服务器繁忙, 其他的错误(比如-1121交易对不存在)重试也没有用.
+RETRYABLE_ERROR_CODES = {-1000, -1001, -1003, -1007, -1008}
+
+proxies = None
+
+
+def get_usdt_perpetual_symbols() -> List[str]:
+    """
+    所有正在交易的USDT永续合约, 比如BTCUSDT.
+    """
+    data = requests.get(EXCHANGE_INFO_URL, timeout=10, proxies=proxies).json()
+    return [
+        d["symbol"] for d in data["symbols"]
+        if d.get("contractType") == "PERPETUAL" and d["quoteAsset"] == "USDT" and d["status"] == "TRADING"
+    ]
+
+
+def get_funding_rates(store: FundingRateStore, symbol: str, start_time: int) -> int:
+    """
+    从start_time(毫秒)开始一页一页下载一个交易对的资金费率, 返回下载的条数.
+    出错的时候最多重试MAX_RETRIES次, 不能重试的错误直接跳过这个交易对, 已经下载的数据会保留.
+    """
+    count = 0
+    retries = 0
+
+    while True:
+        params = {"symbol": symbol, "startTime": start_time, "limit": BINANCE_FUNDING_LIMIT}
+
+        try:
+            data = requests.get(FUNDING_RATE_URL, params=params, timeout=10, proxies=proxies).json()
+        except Exception:
+            print(f"{symbol}下载出错: {traceback.format_exc()}")
+            retries += 1
+            if retries > MAX_RETRIES:
+                print(f"{symbol}重试{MAX_RETRIES}次还是出错, 跳过")
+                break
+            time.sleep(RETRY_INTERVAL)
+            continue
+
+        if not isinstance(data, list):
+            # 返回错误信息, 比如触发了频率限制: {"code": -1003, "msg": "..."}
+            print(f"{symbol}下载出错: {data}")
+            code = data.get("code") if isinstance(data, dict) else None
+            retries += 1
+            if code not in RETRYABLE_ERROR_CODES or retries > MAX_RETRIES:
+                print(f"{symbol}不能重试或者重试次数太多, 跳过")
+                break
+            time.sleep(RETRY_INTERVAL)
+            continue
+
+        retries = 0
+
+        if not data:
+            break
+
+        """
+        [
+            {
+                "symbol": "BTCUSDT",
+                "fundingTime": 1598601600000,  // 资金费率的时间
+                "fundingRate": "0.00010000",   // 资金费率
+                "markPrice": "11384.42115760"  // 标记价格, 早期的数据没有
+            }
+        ]
+        """
+        store.append(
+            symbol,
+            np.array([d["fundingTime"] for d in data], dtype=np.int64),
+            np.array([float(d["fundingRate"]) for d in data]),
+            np.array([float(d.get("markPrice") or "nan") for d in data])
+        )
+        count += len(data)
+
+        if len(data) < BINANCE_FUNDING_LIMIT:
+            break
+
+        start_time = data[-1]["fundingTime"] + 1
+
+    return count
+
+
+def download_all(store: FundingRateStore, start_date: str = "2019-9-1") -> None:
+    """
+    下载所有USDT永续合约的资金费率, 已经下载过的交易对只下载新的数据.
+    """
+    default_start_time = int(datetime.strptime(start_date, '%Y-%m-%d').timestamp() * 1000)
+    symbols = get_usdt_perpetual_symbols()
+    print(f"永续合约数量: {len(symbols)}")
+
+    def download(symbol: str) -> None:
+        last_time = store.get_last_time(symbol)
+        start_time = last_time + 1 if last_time else default_start_time
+        count = get_funding_rates(store, symbol, start_time)
+        print(f"{symbol}: {count}")
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        list(executor.map(download, symbols))
+
+    store.save()
+
+
+if __name__ == '__main__':
+
+    # 如果你有代理你就设置，如果没有你就设置为 None 或者空的字符串 "",
+    proxy_host = ""  # 如果没有就设置为"", 如果有就设置为你的代理主机如：127.0.0.1
+    proxy_port = 0  # 设置你的代理端口号如: 1087, 没有你修改为0,但是要保证你能访问fapi.binance.com这个主机。
+
+    if proxy_host and proxy_port:
+        proxy = f'http://{proxy_host}:{proxy_port}'
+        proxies = {'http': proxy, 'https': proxy}
+
+    store = FundingRateStore()
+    download_all(store)
+
+    # 最近7天资金费率之和最高的10个交易对.
+    for symbol, total_rate in store.top_symbols(days=7, n=10):
+        print(f"{symbol}: {total_rate:.4%}")
@@ -0,0 +1,246 @@
+"""
+    资金费率套利(现货-永续合约)的回测.
+
+    class_22 里面套利软件的参数(initial_target_pos, trade_max_usd_every_time, slippage_tolerance_pct,
+    open_spread_pct, open_rate_pct, close_spread_pct, close_rate_pct)设置多少合适, 哪些币值得做, 需要先回测一下.
+
+    FundingArbitrageBacktestingEngine 同时回测几百个交易对:
+    1. 从数据库加载现货(btcusdt.BINANCE)和合约(BTCUSDT.BINANCE)的1分钟K线, 按时间对齐成 (交易对, 分钟) 的数组,
+       资金费率从 funding_rate_store.py 读取, 放到结算的那一分钟, 结算的分钟单独用 funding_settled 标记(资金费率可能正好是0).
+    2. 每一分钟用数组一次计算所有交易对: 价差和上一次的资金费率满足开仓条件的时候, 买现货、做空合约,
+       每分钟最多下 trade_max_usd_every_time 的单(拆单), 直到 initial_target_pos; 满足平仓条件的时候反过来平仓.
+    3. 成交价格按 slippage_tolerance_pct 的滑点计算, 现货和合约分别扣手续费, 资金费率结算的时候按合约的仓位收(付)资金费.
+    4. calculate_result 返回每个交易对的收益、资金费、手续费、最大回撤等, 按收益率排序.
+
+    用上一次已经结算的资金费率判断开平仓, 不会用到未来的数据.
+    使用方法参考 backtest_funding_arbitrage.py.
+"""
+
+from datetime import datetime, timedelta
+from typing import Dict, List, Union
+
+import numpy as np
+import pandas as pd
+
+from howtrader.trader.constant import Exchange, Interval
+from howtrader.trader.database import database_manager
+
+from funding_rate_store import FundingRateStore
+
+# 默认参数, 百分比的参数跟class_22的套利软件一样, 0.1表示0.1%.
+DEFAULT_SETTING = {
+    "initial_target_pos": 1.0,  # 每个交易对要对冲的币的数量, 也可以是 {"BTCUSDT": 1, "ETHUSDT": 20}.
+    "trade_max_usd_every_time": 1000,  # 每分钟最多下单多少USDT.
+    "slippage_tolerance_pct": 0.03,  # 成交的滑点.
+    "open_spread_pct": 0.1,  # 价差(合约/现货-1)大于多少开仓.
+    "open_rate_pct": 0.03,  # 资金费率大于多少开仓.
+    "close_spread_pct": 0.0,  # 价差小于多少平仓.
+    "close_rate_pct": 0.0,  # 资金费率小于多少平仓, 要同时满足价差和资金费率.
+    "spot_fee_pct": 0.075,  # 现货手续费.
+    "future_fee_pct": 0.04,  # 合约手续费.
+}
+
+
+class FundingArbitrageBacktestingEngine(object):
+    """
+    用数组同时回测多个交易对的现货-合约对冲.
+    """
+
+    def __init__(self):
+        """"""
+        self.symbols: List[str] = []
+        self.start: datetime = None
+        self.end: datetime = None
+        self.setting: dict = dict(DEFAULT_SETTING)
+
+        self.datetimes: pd.DatetimeIndex = None
+        self.spot_price: np.ndarray = None  # (交易对, 分钟)的现货收盘价, 没有数据是nan.
+        self.future_price: np.ndarray = None  # (交易对, 分钟)的合约收盘价.
+        self.funding_rate: np.ndarray = None  # (交易对, 分钟)的资金费率, 不是结算的时间是0.
+        self.funding_settled: np.ndarray = None  # (交易对, 分钟)是否结算资金费率, 结算的资金费率也可能是0.
+
+        self.result: Dict[str, np.ndarray] = {}
+
+    def set_parameters(self, symbols: List[str], start: datetime, end: datetime, setting: dict = None) -> None:
+        """
+        symbols是合约的交易对, 比如 ["BTCUSDT", "ETHUSDT"], 现货用小写的交易对.
+        """
+        self.symbols = [symbol.upper() for symbol in symbols]
+        self.start = start
+        self.end = end
+
+        if setting:
+            self.setting.update(setting)
+
+    def load_data(self, store: FundingRateStore = None) -> None:
+        """
+        从数据库加载K线, 按分钟对齐. 没有数据的分钟用前一分钟的价格, 上市之前是nan, 不会开仓.
+        """
+        store = store or FundingRateStore()
+
+        self.datetimes = pd.date_range(self.start, self.end - timedelta(minutes=1), freq="1min", tz="Asia/Shanghai")
+        start_time = self.datetimes[0].value // 10 ** 6
+        end_time = start_time + len(self.datetimes) * 60 * 1000 - 1
+        shape = (len(self.symbols), len(self.datetimes))
+        self.spot_price = np.full(shape, np.nan)
+        self.future_price = np.full(shape, np.nan)
+        self.funding_rate = np.zeros(shape)
+        self.funding_settled = np.zeros(shape, dtype=bool)
+
+        for row, symbol in enumerate(self.symbols):
+            self.spot_price[row] = self.load_close_price(symbol.lower())
+            self.future_price[row] = self.load_close_price(symbol)
+
+            times, rates = store.get_funding_rates(symbol, start_time, end_time)
+            funding_datetimes = pd.to_datetime(times, unit="ms", utc=True).floor("1min").tz_convert("Asia/Shanghai")
+            columns = self.datetimes.get_indexer(funding_datetimes)
+            valid = columns >= 0
+            self.funding_rate[row, columns[valid]] = rates[valid]
+            self.funding_settled[row, columns[valid]] = True
+
+            print(f"{symbol}加载完成, 资金费率: {valid.sum()}条")
+
+    def load_close_price(self, symbol: str) -> np.ndarray:
+        """"""
+        bars = database_manager.load_bar_data(symbol, Exchange.BINANCE, Interval.MINUTE, self.start, self.end)
+        if not bars:
+            return np.full(len(self.datetimes), np.nan)
+
+        close = pd.Series(
+            [bar.close_price for bar in bars],
+            index=pd.DatetimeIndex([bar.datetime for bar in bars]).tz_convert("Asia/Shanghai")
+        )
+        close = close[~close.index.duplicated(keep="last")]
+        return close.reindex(self.datetimes, method="ffill").values
+
+    def set_data(self, datetimes: pd.DatetimeIndex, spot_price: np.ndarray, future_price: np.ndarray,
+                 funding_rate: np.ndarray, funding_settled: np.ndarray = None) -> None:
+        """
+        不从数据库加载, 直接设置对齐好的 (交易对, 分钟) 数组.
+        funding_settled是结算资金费率的分钟, 不传的时候资金费率不是0的分钟算结算, 这样资金费率是0的结算就会漏掉.
+        """
+        self.datetimes = datetimes
+        self.spot_price = np.asarray(spot_price, dtype=float)
+        self.future_price = np.asarray(future_price, dtype=float)
+        self.funding_rate = np.asarray(funding_rate, dtype=float)
+        if funding_settled is None:
+            self.funding_settled = self.funding_rate != 0
+        else:
+            self.funding_settled = np.asarray(funding_settled, dtype=bool)
+
+    def get_target_pos(self) -> np.ndarray:
+        """"""
+        target: Union[float, dict] = self.setting["initial_target_pos"]
+        if isinstance(target, dict):
+            return np.array([target.get(symbol, 0.0) for symbol in self.symbols], dtype=float)
+        return np.full(len(self.symbols), float(target))
+
+    def run_backtesting(self) -> None:
+        """
+        按分钟回放, 每一分钟用数组同时处理所有交易对.
+        """
+        setting = self.setting
+        open_spread = setting["open_spread_pct"] / 100
+        open_rate = setting["open_rate_pct"] / 100
+        close_spread = setting["close_spread_pct"] / 100
+        close_rate = setting["close_rate_pct"] / 100
+        slippage = setting["slippage_tolerance_pct"] / 100
+        spot_fee = setting["spot_fee_pct"] / 100
+        future_fee = setting["future_fee_pct"] / 100
+        trade_max_usd = setting["trade_max_usd_every_time"]
+
+        target_pos = self.get_target_pos()
+        count = len(self.symbols)
+
+        pos = np.zeros(count)  # 现货的多仓, 也是合约的空仓.
+        cash = np.zeros(count)  # 买卖现货和合约的现金流, 加上仓位的市值就是收益.
+        funding = np.zeros(count)
+        fee = np.zeros(count)
+        slippage_cost = np.zeros(count)
+        trade_count = np.zeros(count, dtype=np.int64)
+        max_notional = np.zeros(count)
+        max_pnl = np.zeros(count)
+        max_drawdown = np.zeros(count)
+        last_rate = np.zeros(count)  # 上一次结算的资金费率.
+
+        for i in range(len(self.datetimes)):
+            spot = self.spot_price[:, i]
+            future = self.future_price[:, i]
+            valid = (spot > 0) & (future > 0)  # nan的比较也是False.
+
+            # 资金费率结算: 合约空仓收取 仓位 * 价格 * 资金费率, 资金费率为负的时候付出.
+            rate = self.funding_rate[:, i]
+            settled = self.funding_settled[:, i]
+            if settled.any():
+                income = np.where(settled & valid, pos * future * rate, 0.0)
+                funding += income
+                cash += income
+                last_rate = np.where(settled, rate, last_rate)
+
+            with np.errstate(divide="ignore", invalid="ignore"):
+                spread = future / spot - 1
+                slice_volume = np.where(valid, trade_max_usd / spot, 0.0)
+
+            # 开仓: 买入现货, 卖出合约; 平仓: 卖出现货, 买入合约. 正数是开仓, 负数是平仓.
+            can_open = valid & (spread >= open_spread) & (last_rate >= open_rate) & (pos < target_pos)
+            can_close = valid & (spread <= close_spread) & (last_rate <= close_rate) & (pos > 0)
+            volume = np.where(can_open, np.minimum(slice_volume, target_pos - pos), 0.0)
+            volume = np.where(can_close, -np.minimum(slice_volume, pos), volume)
+
+            traded = volume != 0
+            if traded.any():
+                spot = np.where(traded, spot, 0.0)
+                future = np.where(traded, future, 0.0)
+
+                notional = np.abs(volume) * (spot + future)
+                trade_fee = np.abs(volume) * (spot * spot_fee + future * future_fee)
+                cash += volume * (future - spot) - notional * slippage - trade_fee
+                fee += trade_fee
+                slippage_cost += notional * slippage
+                pos += volume
+                trade_count += traded
+                max_notional = np.maximum(max_notional, pos * spot)
+
+            # 收益 = 现金流 + 现货多仓的市值 - 合约空仓的市值, 价格没有数据的时候不更新回撤.
+            with np.errstate(invalid="ignore"):
+                pnl = cash + pos * (self.spot_price[:, i] - self.future_price[:, i])
+                max_pnl = np.where(valid, np.maximum(max_pnl, pnl), max_pnl)
+                max_drawdown = np.where(valid, np.maximum(max_drawdown, max_pnl - pnl), max_drawdown)
+
+        last_valid = self.get_last_valid_prices()
+        pnl = cash + pos * (last_valid[0] - last_valid[1])
+
+        self.result = {
+            "pnl": pnl,
+            "funding": funding,
+            "fee": fee,
+            "slippage": slippage_cost,
+            "trade_count": trade_count,
+            "pos": pos,
+            "max_notional": max_notional,
+            "max_drawdown": max_drawdown,
+        }
+
+    def get_last_valid_prices(self) -> np.ndarray:
+        """
+        每个交易对最后一个有数据的现货和合约价格, 形状是 (2, 交易对).
+        """
+        prices = np.zeros((2, len(self.symbols)))
+        for index, array in enumerate((self.spot_price, self.future_price)):
+            frame = pd.DataFrame(array.T).ffill()
+            prices[index] = np.nan_to_num(frame.iloc[-1].values) if len(frame) else 0
+        return prices
+
+    def calculate_result(self) -> pd.DataFrame:
+        """
+        每个交易对一行, 按收益率排序. 收益率 = 收益 / 最大的现货市值, 年化按回测的天数计算.
+        """
+        result = self.result
+        df = pd.DataFrame(result, index=self.symbols)
+
+        days = max((self.datetimes[-1] - self.datetimes[0]).total_seconds() / 86400, 1) if len(self.datetimes) else 1
+        with np.errstate(divide="ignore", invalid="ignore"):
+            df["return_pct"] = np.where(df["max_notional"] > 0, df["pnl"] / df["max_notional"] * 100, 0.0)
+        df["annual_return_pct"] = df["return_pct"] / days * 365
+
+        return df.sort_values("return_pct", ascending=False)
@@ -0,0 +1,194 @@
+"""
+    资金费率的列式存储.
+
+    所有交易对的资金费率放在同一组numpy数组里面, 每一列一个文件(symbol_id.npy, funding_time.npy, funding_rate.npy, mark_price.npy),
+    交易对的名称和每个交易对在数组里面的起止位置放在 index.json 里面:
+    1. 数据按(交易对, 时间)排序, 查一个交易对的历史只是数组切片, 不需要遍历.
+    2. 读取的时候用 mmap_mode="r", 文件再大也不会一次读到内存里面.
+    3. 跨交易对的统计(比如最近7天资金费率之和排名)用 np.bincount 一次算完.
+
+    使用方法:
+
+    store = FundingRateStore()  # 默认保存在 .howtrader/funding_rates 目录
+    store.append("BTCUSDT", funding_times, funding_rates, mark_prices)
+    store.save()
+    times, rates = store.get_funding_rates("BTCUSDT")
+    store.top_symbols(days=7, n=10)  # [("XXXUSDT", 0.0123), ...]
+"""
+
+import json
+import os
+from threading import Lock
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from howtrader.trader.utility import get_folder_path
+
+COLUMNS = ("symbol_id", "funding_time", "funding_rate", "mark_price")
+DTYPES = {"symbol_id": np.int32, "funding_time": np.int64, "funding_rate": np.float64, "mark_price": np.float64}
+
+
+class FundingRateStore(object):
+    """
+    按交易对索引的资金费率列式存储.
+    """
+
+    def __init__(self, path: str = ""):
+        """"""
+        self.path: str = path or str(get_folder_path("funding_rates"))
+        os.makedirs(self.path, exist_ok=True)
+
+        self.symbols: List[str] = []
+        self.symbol_ids: Dict[str, int] = {}
+        self.offsets: np.ndarray = np.zeros(1, dtype=np.int64)  # 第i个交易对的数据在 offsets[i]:offsets[i + 1].
+        self.columns: Dict[str, np.ndarray] = {name: np.zeros(0, dtype=DTYPES[name]) for name in COLUMNS}
+
+        self.pending: List[Tuple[int, np.ndarray, np.ndarray, np.ndarray]] = []  # 还没有合并的数据.
+        self.lock: Lock = Lock()
+
+        self.load()
+
+    def load(self) -> None:
+        """"""
+        index_path = os.path.join(self.path, "index.json")
+        if not os.path.exists(index_path):
+            return
+
+        with open(index_path, mode="r", encoding="UTF-8") as f:
+            index = json.load(f)
+
+        self.symbols = index["symbols"]
+        self.symbol_ids = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self.offsets = np.array(index["offsets"], dtype=np.int64)
+
+        for name in COLUMNS:
+            self.columns[name] = np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode="r")
+
+    def get_symbol_id(self, symbol: str) -> int:
+        """"""
+        symbol_id = self.symbol_ids.get(symbol, None)
+        if symbol_id is None:
+            symbol_id = len(self.symbols)
+            self.symbols.append(symbol)
+            self.symbol_ids[symbol] = symbol_id
+            self.offsets = np.append(self.offsets, self.offsets[-1])
+        return symbol_id
+
+    def get_last_time(self, symbol: str) -> int:
+        """
+        这个交易对已经保存的最后一次资金费率的时间(毫秒), 没有数据返回0. 用来增量下载.
+        """
+        symbol_id = self.symbol_ids.get(symbol, None)
+        if symbol_id is None:
+            return 0
+
+        start, end = self.offsets[symbol_id], self.offsets[symbol_id + 1]
+        if start == end:
+            return 0
+        return int(self.columns["funding_time"][end - 1])
+
+    def append(self, symbol: str, funding_times: np.ndarray, funding_rates: np.ndarray,
+               mark_prices: np.ndarray) -> None:
+        """
+        添加一个交易对的数据, 调用save的时候再合并排序, 可以在多个线程里面调用.
+        """
+        if len(funding_times) == 0:
+            return
+
+        with self.lock:
+            symbol_id = self.get_symbol_id(symbol)
+            self.pending.append((
+                symbol_id,
+                np.asarray(funding_times, dtype=np.int64),
+                np.asarray(funding_rates, dtype=np.float64),
+                np.asarray(mark_prices, dtype=np.float64)
+            ))
+
+    def save(self) -> None:
+        """
+        把新的数据合并进来, 按(交易对, 时间)排序去重, 然后重新生成索引并写到文件.
+        """
+        with self.lock:
+            pending, self.pending = self.pending, []
+
+        if not pending:
+            return
+
+        columns = {
+            "symbol_id": [np.asarray(self.columns["symbol_id"])] + [
+                np.full(len(times), symbol_id, dtype=np.int32) for symbol_id, times, _, _ in pending],
+            "funding_time": [np.asarray(self.columns["funding_time"])] + [times for _, times, _, _ in pending],
+            "funding_rate": [np.asarray(self.columns["funding_rate"])] + [rates for _, _, rates, _ in pending],
+            "mark_price": [np.asarray(self.columns["mark_price"])] + [prices for _, _, _, prices in pending],
+        }
+        merged = {name: np.concatenate(arrays).astype(DTYPES[name]) for name, arrays in columns.items()}
+        del columns
+
+        # 新数据在后面, 稳定排序之后同一个时间的最后一条就是最新的数据.
+        order = np.lexsort((merged["funding_time"], merged["symbol_id"]))
+        merged = {name: array[order] for name, array in merged.items()}
+
+        keep = np.ones(len(order), dtype=bool)
+        keep[:-1] = (merged["symbol_id"][1:] != merged["symbol_id"][:-1]) | \
+                    (merged["funding_time"][1:] != merged["funding_time"][:-1])
+        merged = {name: array[keep] for name, array in merged.items()}
+
+        counts = np.bincount(merged["symbol_id"], minlength=len(self.symbols))
+        self.offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        self.columns = merged  # 先释放mmap打开的旧文件, windows下面才能覆盖.
+
+        for name in COLUMNS:
+            np.save(os.path.join(self.path, f"{name}.npy"), merged[name])
+
+        with open(os.path.join(self.path, "index.json"), mode="w+", encoding="UTF-8") as f:
+            json.dump({"symbols": self.symbols, "offsets": self.offsets.tolist()}, f, indent=4)
+
+    def get_funding_rates(self, symbol: str, start_time: int = 0, end_time: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        返回一个交易对的资金费率时间(毫秒)和资金费率, 可以按时间范围过滤.
+        """
+        symbol_id = self.symbol_ids.get(symbol, None)
+        if symbol_id is None:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+
+        start, end = self.offsets[symbol_id], self.offsets[symbol_id + 1]
+        times = self.columns["funding_time"][start:end]
+        rates = self.columns["funding_rate"][start:end]
+
+        left = np.searchsorted(times, start_time, side="left") if start_time else 0
+        right = np.searchsorted(times, end_time, side="right") if end_time else len(times)
+        return np.asarray(times[left:right]), np.asarray(rates[left:right])
+
+    def get_dataframe(self, symbol: str) -> pd.DataFrame:
+        """"""
+        symbol_id = self.symbol_ids.get(symbol, None)
+        if symbol_id is None:
+            return pd.DataFrame(columns=COLUMNS[1:])
+
+        start, end = self.offsets[symbol_id], self.offsets[symbol_id + 1]
+        df = pd.DataFrame({name: np.asarray(self.columns[name][start:end]) for name in COLUMNS[1:]})
+        df["datetime"] = pd.to_datetime(df["funding_time"], unit="ms", utc=True)
+        return df.set_index("datetime")
+
+    def top_symbols(self, days: float = 7, n: int = 10, end_time: int = 0) -> List[Tuple[str, float]]:
+        """
+        最近days天资金费率之和最高的n个交易对. end_time是毫秒时间戳, 默认是最后一次资金费率的时间.
+        """
+        times = np.asarray(self.columns["funding_time"])
+        if len(times) == 0:
+            return []
+
+        end_time = end_time or int(times.max())
+        start_time = end_time - int(days * 24 * 3600 * 1000)
+
+        mask = (times > start_time) & (times <= end_time)
+        sums = np.bincount(
+            np.asarray(self.columns["symbol_id"])[mask],
+            weights=np.asarray(self.columns["funding_rate"])[mask],
+            minlength=len(self.symbols)
+        )
+
+        top = np.argsort(-sums)[:n]
+        return [(self.symbols[i], float(sums[i])) for i in top]
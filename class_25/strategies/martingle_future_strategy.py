@@ -18,6 +18,8 @@ import numpy as np
 import talib
 from howtrader.trader.event import EVENT_CONTRACT, EVENT_ACCOUNT
 
+from strategies.order_book import MyOrderBook
+
 
 class MyArrayManager(object):
     """
@@ -583,8 +585,7 @@ class MartingleFutureStrategy(CtaTemplate):
         # # 合约的资产订阅
         # self.cta_engine.event_engine.register(EVENT_ACCOUNT + "BINANCES.USDT", self.process_account_event)
 
-        self.buy_orders = []  # 买单id列表。
-        self.sell_orders = []  # 卖单id列表。
+        self.order_book = MyOrderBook(self)  # 买单和卖单的id, 角色分别是"buy"和"sell".
         self.min_notional = 11  # 最小的交易金额.
 
     def on_init(self):
@@ -627,25 +628,24 @@ class MartingleFutureStrategy(CtaTemplate):
 
         if self.current_pos * bar.close_price >= self.min_notional:
 
-            if len(self.sell_orders) <= 0 and self.avg_price > 0:
+            if self.order_book.count("sell") <= 0 and self.avg_price > 0:
                 # 有利润平仓的时候
                 profit_percent = bar.close_price / self.avg_price - 1
                 if profit_percent >= self.exit_profit_pct:
                     self.cancel_all()
                     orderids = self.short(bar.close_price, abs(self.current_pos))
-                    self.sell_orders.extend(orderids)
+                    self.order_book.add_orders(orderids, "sell")
 
             # 考虑加仓的条件: 1） 当前有仓位,且仓位值要大于11USDTyi以上，2）加仓的次数小于最大的加仓次数，3）当前的价格比上次入场的价格跌了一定的百分比。
             dump_percent = self.last_entry_price / bar.close_price - 1
-            if len(
-                    self.buy_orders) <= 0 and self.current_increase_pos_times <= self.max_increase_pos_times and dump_percent >= self.increase_pos_when_dump_pct:
+            if self.order_book.count("buy") <= 0 and self.current_increase_pos_times <= self.max_increase_pos_times and dump_percent >= self.increase_pos_when_dump_pct:
                 # ** 表示的是乘方.
                 self.cancel_all()
                 increase_pos_value = self.initial_trading_value * self.trading_value_multiplier ** self.current_increase_pos_times
                 price = bar.close_price
                 vol = increase_pos_value / price
                 orderids = self.buy(price, vol)
-                self.buy_orders.extend(orderids)
+                self.order_book.add_orders(orderids, "buy")
 
         self.bg.update_bar(bar)
 
@@ -662,7 +662,7 @@ class MartingleFutureStrategy(CtaTemplate):
 
         # 突破上轨
         if last_close <= boll_up < current_close:
-            if len(self.buy_orders) == 0 and self.current_pos * bar.close_price < self.min_notional:  # 每次下单要大于等于10USDT, 为了简单设置11USDT.
+            if self.order_book.count("buy") == 0 and self.current_pos * bar.close_price < self.min_notional:  # 每次下单要大于等于10USDT, 为了简单设置11USDT.
                 # 这里没有仓位.
                 self.cancel_all()
                 # 重置当前的数据.
@@ -672,7 +672,7 @@ class MartingleFutureStrategy(CtaTemplate):
                 price = bar.close_price
                 vol = self.initial_trading_value / price
                 orderids = self.buy(price, vol)
-                self.buy_orders.extend(orderids)  # 以及已经下单的orderids.
+                self.order_book.add_orders(orderids, "buy")  # 以及已经下单的orderids.
 
         self.put_event()
 
@@ -687,11 +687,7 @@ class MartingleFutureStrategy(CtaTemplate):
                 self.last_entry_price = order.price  # 记录上一次成绩的价格.
 
         if not order.is_active():
-            if order.vt_orderid in self.sell_orders:
-                self.sell_orders.remove(order.vt_orderid)
-
-            elif order.vt_orderid in self.buy_orders:
-                self.buy_orders.remove(order.vt_orderid)
+            self.order_book.remove_order(order.vt_orderid)
 
         self.put_event()  # 更新UI使用.
 
@@ -18,6 +18,8 @@ import numpy as np
 import talib
 from howtrader.trader.event import EVENT_CONTRACT, EVENT_ACCOUNT
 
+from strategies.order_book import MyOrderBook
+
 
 class MyArrayManager(object):
     """
@@ -590,8 +592,7 @@ class MartingleSpotStrategyV2(CtaTemplate):
         # self.cta_engine.event_engine.register(EVENT_ACCOUNT + 'BINANCE.币名称', self.process_acccount_event)
         # self.cta_engine.event_engine.register(EVENT_ACCOUNT + "BINANCE.USDT", self.process_account_event)
 
-        self.buy_orders = []  # 买单id列表。
-        self.sell_orders = []  # 卖单id列表。
+        self.order_book = MyOrderBook(self)  # 买单和卖单的id, 角色分别是"buy"和"sell".
         self.min_notional = 11  # 最小的交易金额.
 
     def on_init(self):
@@ -650,7 +651,7 @@ class MartingleSpotStrategyV2(CtaTemplate):
         # 回调一定比例的时候.
         if self.current_pos * current_close < self.min_notional:
             # 每次下单要大于等于10USDT, 为了简单设置11USDT.
-            if dump_pct >= self.open_pos_when_drawdown_pct and len(self.buy_orders) == 0:
+            if dump_pct >= self.open_pos_when_drawdown_pct and self.order_book.count("buy") == 0:
                 # 这里没有仓位.
                 # 重置当前的数据.
                 self.cancel_all()
@@ -661,10 +662,10 @@ class MartingleSpotStrategyV2(CtaTemplate):
                 price = current_close
                 vol = self.initial_trading_value / price
                 orderids = self.buy(price, vol)
-                self.buy_orders.extend(orderids)  # 以及已经下单的orderids.
+                self.order_book.add_orders(orderids, "buy")  # 以及已经下单的orderids.
         else:
 
-            if len(self.sell_orders) <= 0 and self.avg_price > 0:
+            if self.order_book.count("sell") <= 0 and self.avg_price > 0:
                 # 有利润平仓的时候
                 # 清理掉其他买单.
 
@@ -672,9 +673,9 @@ class MartingleSpotStrategyV2(CtaTemplate):
                 if profit_percent >= self.exit_profit_pct:
                     self.cancel_all()
                     orderids = self.sell(bar.close_price, abs(self.current_pos))
-                    self.sell_orders.extend(orderids)
+                    self.order_book.add_orders(orderids, "sell")
 
-            if self.entry_lowest > 0 and len(self.buy_orders) <= 0:
+            if self.entry_lowest > 0 and self.order_book.count("buy") <= 0:
                 # 考虑加仓的条件: 1） 当前有仓位,且仓位值要大于11USDTyi以上，2）加仓的次数小于最大的加仓次数，3）当前的价格比上次入场的价格跌了一定的百分比。
 
                 dump_down_pct = self.last_entry_price / self.entry_lowest - 1
@@ -688,7 +689,7 @@ class MartingleSpotStrategyV2(CtaTemplate):
                     price = bar.close_price
                     vol = increase_pos_value / price
                     orderids = self.buy(price, vol)
-                    self.buy_orders.extend(orderids)
+                    self.order_book.add_orders(orderids, "buy")
 
         self.put_event()
 
@@ -705,11 +706,7 @@ class MartingleSpotStrategyV2(CtaTemplate):
                 self.entry_lowest = order.price
 
         if not order.is_active():
-            if order.vt_orderid in self.sell_orders:
-                self.sell_orders.remove(order.vt_orderid)
-
-            elif order.vt_orderid in self.buy_orders:
-                self.buy_orders.remove(order.vt_orderid)
+            self.order_book.remove_order(order.vt_orderid)
 
         self.put_event()  # 更新UI使用.
 
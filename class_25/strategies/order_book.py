@@ -0,0 +1,182 @@
+"""
+    策略自己的挂单簿.
+
+    以前策略用列表保存订单id(buy_orders, sell_orders, long_orders, short_orders, profit_orders, stop_orders),
+    on_order里面要用 in 判断和 remove 删除, 成交的时候还要把列表拼起来(self.short_orders + self.profit_orders)再撤单, 都是O(n)的操作。
+
+    MyOrderBook 用字典保存订单id和它的角色(role), 比如"long", "short", "profit", "stop":
+    1. 判断订单是否存在、查订单的角色、删除订单都是O(1).
+    2. 可以按角色统计订单数量、按角色批量撤单.
+    3. 网格重新挂单的时候可以按角色改单(requote_order), 不需要撤单再下单.
+       接口不支持改单的时候(现货、回测)先撤单, 旧的订单保留它的角色, 等收到撤单成功的推送之后再下新的订单,
+       数量减去撤单之前又成交的部分. 旧的订单在撤单之前全部成交了就不再下新的订单, 仓位不会多一倍.
+       所以策略的on_order里面要先调用 self.order_book.on_order(order).
+
+    使用方法:
+
+    self.order_book = MyOrderBook(self)
+    self.order_book.add_orders(self.buy(price, volume), "long")
+    self.order_book.count("long")
+    self.order_book.cancel_orders("short", "profit")
+    self.order_book.requote_order("long", Direction.LONG, Offset.OPEN, price, volume)  # 改单, 没有订单就下单
+    self.order_book.on_order(order)  # on_order的第一行, 记录成交数量, 撤单成功之后下替换的订单
+    self.order_book.remove_order(order.vt_orderid)  # 返回订单的角色
+    self.order_book.cancel_all()  # 撤销所有订单, 还没有下的替换订单也不会再下
+"""
+
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from howtrader.app.cta_strategy import CtaTemplate
+from howtrader.trader.constant import Direction, Offset, Status
+from howtrader.trader.object import OrderData
+
+from strategies.batch_order import send_orders, cancel_orders, modify_order
+
+
+class MyOrderBook(object):
+    """
+    按角色管理策略的挂单.
+    """
+
+    def __init__(self, strategy: CtaTemplate):
+        """"""
+        self.strategy: CtaTemplate = strategy
+
+        self.order_roles: Dict[str, str] = {}  # vt_orderid: role
+        self.role_orders: Dict[str, Dict[str, None]] = defaultdict(dict)  # role: {vt_orderid: None}, 保留下单的顺序.
+
+        self.traded: Dict[str, float] = {}  # vt_orderid: 最新推送的成交数量.
+        # 正在撤单、撤单成功之后要下的替换订单. vt_orderid: (方向, 开平, 价格, 数量, 撤单时的成交数量)
+        self.replacements: Dict[str, Tuple[Direction, Offset, float, float, float]] = {}
+
+    def __contains__(self, vt_orderid: str) -> bool:
+        """"""
+        return vt_orderid in self.order_roles
+
+    def __len__(self) -> int:
+        """"""
+        return len(self.order_roles)
+
+    def add_orders(self, vt_orderids: Iterable[str], role: str) -> None:
+        """
+        记录下单返回的订单id, 并打上角色的标签.
+        """
+        orders = self.role_orders[role]
+        for vt_orderid in vt_orderids:
+            self.order_roles[vt_orderid] = role
+            orders[vt_orderid] = None
+
+    def remove_order(self, vt_orderid: str) -> Optional[str]:
+        """
+        删除订单, 返回订单的角色, 订单不存在返回None.
+        """
+        role = self.order_roles.pop(vt_orderid, None)
+        if role is not None:
+            self.role_orders[role].pop(vt_orderid, None)
+
+        self.traded.pop(vt_orderid, None)
+        self.replacements.pop(vt_orderid, None)
+        return role
+
+    def on_order(self, order: OrderData) -> None:
+        """
+        策略的on_order里面先调用, 在策略处理之前下替换的订单, 旧的订单的角色留给策略处理.
+        旧的订单全部成交了就不再替换, 部分成交之后撤单成功, 替换的订单只下剩下的数量.
+        """
+        vt_orderid = order.vt_orderid
+        role = self.order_roles.get(vt_orderid, None)
+        if role is None:
+            return
+
+        if order.is_active():
+            self.traded[vt_orderid] = order.traded
+            return
+
+        self.traded.pop(vt_orderid, None)
+        replacement = self.replacements.pop(vt_orderid, None)
+        if not replacement or order.status == Status.ALLTRADED or not self.strategy.trading:
+            return
+
+        direction, offset, price, volume, traded = replacement
+        volume = round(volume - (order.traded - traded), 8)
+        if volume > 0:
+            self.add_orders(send_orders(self.strategy, [(direction, offset, price, volume)])[0], role)
+
+    def get_role(self, vt_orderid: str) -> Optional[str]:
+        """"""
+        return self.order_roles.get(vt_orderid, None)
+
+    def get_orders(self, role: str) -> List[str]:
+        """
+        获取某个角色的所有订单id.
+        """
+        return list(self.role_orders[role])
+
+    def count(self, role: str) -> int:
+        """
+        某个角色的订单数量.
+        """
+        return len(self.role_orders[role])
+
+    def cancel_orders(self, *roles: str) -> None:
+        """
+        按角色批量撤单, 订单等撤单成功的推送后再删除.
+        """
+        vt_orderids = [vt_orderid for role in roles for vt_orderid in self.role_orders[role]]
+        if vt_orderids:
+            self.cancel_orders_by_id(vt_orderids)
+
+    def cancel_all(self) -> None:
+        """
+        撤销策略所有的订单, 还没有下的替换订单也取消. 用它代替策略的cancel_all.
+        """
+        self.replacements.clear()
+        self.strategy.cancel_all()
+
+    def requote_order(self, role: str, direction: Direction, offset: Offset, price: float, volume: float) -> List[str]:
+        """
+        把某个角色的订单改到新的价格和数量: 第一个订单改单, 多余的订单撤掉, 没有订单就下新的订单.
+        返回这个角色现在的订单id.
+        """
+        if not self.strategy.trading:
+            return self.get_orders(role)
+
+        vt_orderids = self.get_orders(role)
+
+        if not vt_orderids:
+            self.add_orders(send_orders(self.strategy, [(direction, offset, price, volume)])[0], role)
+            return self.get_orders(role)
+
+        vt_orderid = vt_orderids[0]
+        if len(vt_orderids) > 1:
+            self.cancel_orders_by_id(vt_orderids[1:])
+
+        if vt_orderid in self.replacements:
+            # 已经在撤单了, 只更新撤单成功之后要下的订单.
+            traded = self.replacements[vt_orderid][4]
+            self.replacements[vt_orderid] = (direction, offset, price, volume, traded)
+            return self.get_orders(role)
+
+        if modify_order(self.strategy, vt_orderid, direction, offset, price, volume):
+            return self.get_orders(role)
+
+        # 不能改单(接口不支持, 或者订单已经结束, 结束的推送还在路上): 先撤单, 旧的订单保留角色, 等撤单成功的推送再下单.
+        self.replacements[vt_orderid] = (direction, offset, price, volume, self.traded.get(vt_orderid, 0))
+        cancel_orders(self.strategy, [vt_orderid])
+        return self.get_orders(role)
+
+    def cancel_orders_by_id(self, vt_orderids: List[str]) -> None:
+        """
+        按订单id撤单, 这些订单就不再替换.
+        """
+        for vt_orderid in vt_orderids:
+            self.replacements.pop(vt_orderid, None)
+        cancel_orders(self.strategy, vt_orderids)
+
+    def clear(self) -> None:
+        """"""
+        self.order_roles.clear()
+        self.role_orders.clear()
+        self.traded.clear()
+        self.replacements.clear()
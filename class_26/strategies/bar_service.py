@@ -0,0 +1,227 @@
+"""
+    共享的多周期K线合成服务.
+
+    以前每个策略都要自己创建BarGenerator, 马丁策略的 bg_1hour 和 bg_4hour 都用tick合成1分钟K线, 每个tick要处理两遍,
+    on_bar也会被调用两遍; 同一个交易对跑几个策略, 同样的K线就要合成几遍。
+
+    现在每个交易对一个服务, 服务只注册一次 EVENT_TICK + vt_symbol:
+    1. 用tick合成1分钟K线, 再用1分钟K线合成N分钟、N小时的K线, 每个周期只合成一次.
+    2. 策略订阅自己需要的周期, 比如 subscribe(1, Interval.HOUR, self.on_1hour_bar), K线完成的时候推送给所有订阅的策略.
+    3. 回测的时候没有tick事件, get_service返回策略自己的服务(shared为False), 策略在on_bar里面调用update_bar.
+    4. use_kline_stream为True的时候不用tick合成, 直接订阅交易所收盘的K线(kline_stream.py):
+       币安有的周期(1m, 5m, 1h, 4h等)直接推送交易所的K线, 其他周期用交易所的1分钟K线合成.
+    5. 策略在on_init里面订阅, 再把load_bar的历史K线交给update_bar预热, 启动之后的第一根4小时K线也是完整的.
+       预热的时候(start_warm_up到finish_warm_up之间)实时的1分钟K线先缓存, 历史K线处理完再按顺序处理.
+       已经推送过的1分钟K线(时间不比最后一根新)会丢掉, 几个策略共享服务的时候同样的历史K线只合成一次.
+
+    使用方法:
+
+    self.bar_service = BarService.get_service(self.cta_engine, self.vt_symbol)  # 或者 use_kline_stream=True
+
+    def on_init(self):
+        self.bar_subscriptions.append(self.bar_service.subscribe(1, Interval.HOUR, self.on_1hour_bar))
+        self.bar_service.start_warm_up()
+        try:
+            self.load_bar(3)
+        finally:
+            self.bar_service.finish_warm_up()
+
+    def on_start(self):
+        if self.bar_service.shared:
+            self.bar_subscriptions.append(self.bar_service.subscribe(1, Interval.MINUTE, self.on_bar))  # 实盘的1分钟K线
+
+    def on_bar(self, bar: BarData):
+        if not self.bar_service.shared or not self.inited:
+            self.bar_service.update_bar(bar)  # 回测的时候自己推送1分钟K线, 实盘初始化的时候用历史K线预热
+"""
+
+import traceback
+from datetime import datetime
+from threading import RLock
+from typing import Callable, Dict, List, Optional, Tuple
+
+from howtrader.app.cta_strategy import BarGenerator
+from howtrader.app.cta_strategy.engine import CtaEngine, EngineType
+from howtrader.event import Event, EventEngine
+from howtrader.trader.constant import Interval
+from howtrader.trader.event import EVENT_TICK
+from howtrader.trader.object import BarData, TickData
+
+from strategies.kline_stream import KlineStream, EVENT_KLINE, KLINE_INTERVALS, get_gateway_proxy
+
+
+class BarSubscription(object):
+    """
+    服务返回的订阅, 可以调用cancel取消.
+    """
+    __slots__ = ("callback", "cancelled")
+
+    def __init__(self, callback: Callable[[BarData], None]):
+        """"""
+        self.callback: Callable[[BarData], None] = callback
+        self.cancelled: bool = False
+
+    def cancel(self) -> None:
+        """
+        取消订阅, 下一次推送的时候从列表里面删掉.
+        """
+        self.cancelled = True
+
+
+class BarService(object):
+    """
+    一个交易对的多周期K线合成, 按周期推送给订阅的策略.
+    """
+
+    _services: Dict[Tuple[EventEngine, str, bool], "BarService"] = {}
+
+    @classmethod
+    def get_service(cls, cta_engine: CtaEngine, vt_symbol: str, use_kline_stream: bool = False) -> "BarService":
+        """
+        实盘的时候返回事件引擎上这个交易对共享的服务, 第一次调用的时候创建并注册EVENT_TICK + vt_symbol,
+        use_kline_stream为True的时候注册EVENT_KLINE + vt_symbol, 订阅交易所的1分钟K线, 代理跟接口连接时设置的一样.
+        回测的时候返回一个新的服务, 由策略自己推送K线.
+        """
+        if cta_engine.engine_type != EngineType.LIVE:
+            return BarService(vt_symbol, shared=False)
+
+        event_engine = cta_engine.event_engine
+        key = (event_engine, vt_symbol, use_kline_stream)
+        service = cls._services.get(key, None)
+
+        if not service:
+            if use_kline_stream:
+                proxy_host, proxy_port = get_gateway_proxy(cta_engine.main_engine, vt_symbol)
+                kline_stream = KlineStream.get_stream(event_engine, vt_symbol, proxy_host, proxy_port)
+                service = BarService(vt_symbol, shared=True, kline_stream=kline_stream)
+                event_engine.register(EVENT_KLINE + vt_symbol, service.process_kline_event)
+                service.kline_stream.subscribe(vt_symbol, "1m")
+            else:
+                service = BarService(vt_symbol, shared=True)
+                event_engine.register(EVENT_TICK + vt_symbol, service.process_tick_event)
+            cls._services[key] = service
+
+        return service
+
+    def __init__(self, vt_symbol: str, shared: bool = False, kline_stream: KlineStream = None):
+        """"""
+        self.vt_symbol: str = vt_symbol
+        self.shared: bool = shared
+        self.kline_stream: KlineStream = kline_stream
+
+        # (window, interval): 币安的周期, 比如 (4, Interval.HOUR): "4h".
+        self.native_intervals: Dict[Tuple[int, Interval], str] = {}
+        if kline_stream:
+            self.native_intervals = {key: kline_interval for kline_interval, key in KLINE_INTERVALS.items()}
+
+        self.minute_generator: BarGenerator = BarGenerator(self.process_live_bar)  # tick合成1分钟K线.
+        self.last_bar_datetime: Optional[datetime] = None  # 最后一根推送的1分钟K线的时间.
+
+        # 策略初始化的线程推送历史K线, 事件引擎的线程推送实时的K线, 用锁保证按顺序合成.
+        self.lock: RLock = RLock()
+        self.warm_up_count: int = 0  # 正在用历史K线预热的策略数量.
+        self.pending_bars: List[BarData] = []  # 预热的时候收到的实时1分钟K线.
+        self.window_generators: Dict[Tuple[int, Interval], BarGenerator] = {}
+        self.subscriptions: Dict[Tuple[int, Interval], List[BarSubscription]] = {}
+
+    def subscribe(self, window: int, interval: Interval, callback: Callable[[BarData], None]) -> BarSubscription:
+        """
+        订阅window个interval周期的K线, 比如(5, Interval.MINUTE), (4, Interval.HOUR).
+        """
+        key = (window, interval)
+
+        if key in self.native_intervals:
+            # 交易所有这个周期的K线, 直接订阅, 不需要合成.
+            self.kline_stream.subscribe(self.vt_symbol, self.native_intervals[key])
+
+        # 策略初始化的线程订阅的时候, 事件引擎的线程可能正在合成K线.
+        with self.lock:
+            if key not in self.native_intervals and key != (1, Interval.MINUTE) and key not in self.window_generators:
+                self.window_generators[key] = BarGenerator(
+                    self.update_bar, window, on_window_bar=lambda bar: self.publish(key, bar), interval=interval
+                )
+
+            subscription = BarSubscription(callback)
+            self.subscriptions.setdefault(key, []).append(subscription)
+        return subscription
+
+    def process_tick_event(self, event: Event) -> None:
+        """"""
+        self.update_tick(event.data)
+
+    def process_kline_event(self, event: Event) -> None:
+        """
+        交易所收盘的K线: 1分钟K线跟tick合成的一样处理, 其他周期直接推送.
+        """
+        kline_interval, bar = event.data
+        key = KLINE_INTERVALS[kline_interval]
+
+        if key == (1, Interval.MINUTE):
+            self.process_live_bar(bar)
+        else:
+            with self.lock:
+                self.publish(key, bar)
+
+    def start_warm_up(self) -> None:
+        """
+        开始用历史K线预热, 在finish_warm_up之前实时的1分钟K线先缓存起来.
+        """
+        with self.lock:
+            self.warm_up_count += 1
+
+    def finish_warm_up(self) -> None:
+        """
+        历史K线处理完了, 按顺序处理缓存的实时K线.
+        """
+        with self.lock:
+            self.warm_up_count -= 1
+            if self.warm_up_count > 0:
+                return
+
+            bars, self.pending_bars = self.pending_bars, []
+            for bar in bars:
+                self.update_bar(bar)
+
+    def process_live_bar(self, bar: BarData) -> None:
+        """
+        实时的1分钟K线, 有策略在预热的时候先缓存.
+        """
+        with self.lock:
+            if self.warm_up_count > 0:
+                self.pending_bars.append(bar)
+            else:
+                self.update_bar(bar)
+
+    def update_tick(self, tick: TickData) -> None:
+        """"""
+        if tick.bid_price_1 > 0 and tick.ask_price_1 > 0:
+            self.minute_generator.update_tick(tick)
+
+    def update_bar(self, bar: BarData) -> None:
+        """
+        推送1分钟K线, 再用它合成其他周期的K线. 时间不比最后一根新的K线已经推送过了, 直接丢掉.
+        """
+        with self.lock:
+            if self.last_bar_datetime and bar.datetime <= self.last_bar_datetime:
+                return
+            self.last_bar_datetime = bar.datetime
+
+            self.publish((1, Interval.MINUTE), bar)
+
+            for generator in self.window_generators.values():
+                generator.update_bar(bar)
+
+    def publish(self, key: Tuple[int, Interval], bar: BarData) -> None:
+        """"""
+        subscriptions = self.subscriptions.get(key, None)
+        if not subscriptions:
+            return
+
+        if any(subscription.cancelled for subscription in subscriptions):
+            subscriptions[:] = [subscription for subscription in subscriptions if not subscription.cancelled]
+
+        for subscription in subscriptions:
+            try:
+                subscription.callback(bar)
+            except Exception:
+                print(f"K线推送出错: {subscription.callback}\n{traceback.format_exc()}")
@@ -7,16 +7,19 @@ from howtrader.app.cta_strategy import (
     OrderData
 )
 
-from howtrader.app.cta_strategy.engine import CtaEngine
+from howtrader.app.cta_strategy.engine import CtaEngine, EngineType
 from howtrader.trader.event import EVENT_TIMER
-from howtrader.event import Event
 from howtrader.trader.object import Status, Direction, Interval, ContractData, AccountData
-from howtrader.app.cta_strategy import BarGenerator
 
-from typing import Optional, Union, Tuple
+from typing import Optional, Union, Tuple, List
 import numpy as np
 import talib
-from howtrader.trader.event import EVENT_CONTRACT, EVENT_ACCOUNT
+from howtrader.trader.event import EVENT_CONTRACT
+
+from strategies.order_book import MyOrderBook
+from strategies.state_journal import StateJournal
+from strategies.account_cache import AccountCache, AccountSubscription
+from strategies.bar_service import BarService, BarSubscription
 
 
 class MyArrayManager(object):
@@ -557,6 +560,7 @@ class MartingleSpotStrategyV3(CtaTemplate):
     exit_profit_pct = 0.01  # 出场平仓百分比 1%
     exit_pull_back_pct = 0.01  # 最高价回调超过1%，且利润超过1% 就出场.
     trading_fee = 0.00075  # 交易手续费
+    use_kline_stream = True  # 实盘直接订阅交易所的K线, 不用tick合成.
 
     # 变量
     avg_price = 0.0  # 当前持仓的平均价格.
@@ -569,7 +573,7 @@ class MartingleSpotStrategyV3(CtaTemplate):
     parameters = ["initial_trading_value", "trading_value_multiplier", "max_increase_pos_count",
                   "hour_pump_pct", "four_hour_pump_pct", "high_close_change_pct", "increase_pos_when_dump_pct",
                   "exit_profit_pct",
-                  "exit_pull_back_pct", "trading_fee"]
+                  "exit_pull_back_pct", "trading_fee", "use_kline_stream"]
 
     variables = ["avg_price", "last_entry_price", "entry_highest_price", "current_pos", "current_increase_pos_count",
                  "total_profit"]
@@ -583,22 +587,45 @@ class MartingleSpotStrategyV3(CtaTemplate):
         self.contract: Optional[ContractData, None] = None
         self.account: Optional[AccountData, None] = None
 
-        self.bg_1hour = BarGenerator(self.on_bar, 1, on_window_bar=self.on_1hour_bar, interval=Interval.HOUR)  # 1hour
-        self.bg_4hour = BarGenerator(self.on_bar, 4, on_window_bar=self.on_4hour_bar, interval=Interval.HOUR)  # 4hour
+        # 1小时和4小时的K线由交易对共享的服务合成或者直接订阅交易所的K线, 同一个交易对的策略只处理一次.
+        self.bar_service = BarService.get_service(cta_engine, vt_symbol, self.use_kline_stream)
+        self.bar_subscriptions: List[BarSubscription] = []
 
-        # self.cta_engine.event_engine.register(EVENT_ACCOUNT + 'BINANCE.币名称', self.process_acccount_event)
-        # self.cta_engine.event_engine.register(EVENT_ACCOUNT + "BINANCE.USDT", self.process_account_event)
+        # 只订阅USDT的资金变化, 现货是"BINANCE.USDT", 合约是"BINANCES.USDT". 其他资产可以用self.account_cache直接查询.
+        # 在on_start里面订阅, on_stop里面取消, 策略删除之后缓存里面不会留着它的回调.
+        self.account_cache: Optional[AccountCache] = None
+        self.account_subscription: Optional[AccountSubscription] = None
+        if cta_engine.engine_type == EngineType.LIVE:
+            self.account_cache = AccountCache.get_cache(self.cta_engine.event_engine)
 
-        self.buy_orders = []  # 买单id列表。
-        self.sell_orders = []  # 卖单id列表。
+        self.order_book = MyOrderBook(self)  # 买单和卖单的id, 角色分别是"buy"和"sell".
         self.min_notional = 11  # 最小的交易金额.
+        # 变量变化的时候追加到日志里面, 崩溃之后可以恢复到最后一次成交. 只有实盘才需要,
+        # 回测的时候strategy_name是类名, 不同的回测会读写同一个文件.
+        self.state_journal: Optional[StateJournal] = None
+        if cta_engine.engine_type == EngineType.LIVE:
+            self.state_journal = StateJournal(self)
 
     def on_init(self):
         """
         Callback when strategy is inited.
         """
         self.write_log("策略初始化")
-        self.load_bar(3)  # 加载3天的数据.
+
+        # 先订阅1小时和4小时的K线, 再用3天的历史K线预热合成器, 启动之后的第一根4小时K线不会只有1到3个小时.
+        self.subscribe_window_bars()
+        self.bar_service.start_warm_up()
+        try:
+            self.load_bar(3)  # 加载3天的数据.
+        finally:
+            self.bar_service.finish_warm_up()
+
+    def subscribe_window_bars(self):
+        """
+        订阅1小时和4小时的K线.
+        """
+        self.bar_subscriptions.append(self.bar_service.subscribe(1, Interval.HOUR, self.on_1hour_bar))
+        self.bar_subscriptions.append(self.bar_service.subscribe(4, Interval.HOUR, self.on_4hour_bar))
 
     def on_start(self):
         """
@@ -606,25 +633,47 @@ class MartingleSpotStrategyV3(CtaTemplate):
         """
         self.write_log("策略启动")
 
+        if not self.bar_subscriptions:
+            self.subscribe_window_bars()  # 停止之后重新启动.
+
+        if self.bar_service.shared:
+            # 实盘的时候1分钟K线也由共享的服务推送.
+            self.bar_subscriptions.append(self.bar_service.subscribe(1, Interval.MINUTE, self.on_bar))
+
+        if self.account_cache:
+            self.account_subscription = self.account_cache.subscribe("BINANCE.USDT", self.on_account)
+
+        if self.state_journal:
+            self.state_journal.load()  # 引擎恢复cta_strategy_data.json之后, 用日志里面最新的变量覆盖.
+
     def on_stop(self):
         """
         Callback when strategy is stopped.
         """
         self.write_log("策略停止")
 
-    # def process_account_event(self, event: Event):
-    #     self.account: AccountData = event.data
-    #     if self.account:
-    #         print(
-    #             f"self.account: available{self.account.available}, balance:{self.account.balance}, frozen: {self.account.frozen}")
+        for subscription in self.bar_subscriptions:
+            subscription.cancel()
+        self.bar_subscriptions.clear()
+
+        if self.account_subscription:
+            self.account_subscription.cancel()
+            self.account_subscription = None
+
+        if self.state_journal:
+            self.state_journal.compact()
+
+    def on_account(self, account: AccountData):
+        """
+        USDT的资金变化的时候回调.
+        """
+        self.account = account
 
     def on_tick(self, tick: TickData):
         """
         Callback of new tick data update.
         """
-        if tick.bid_price_1 > 0 and tick.ask_price_1 > 0:
-            self.bg_1hour.update_tick(tick)
-            self.bg_4hour.update_tick(tick)
+        self.tick = tick  # K线由self.bar_service合成, 这里不需要再处理.
 
     def on_bar(self, bar: BarData):
         """
@@ -635,7 +684,7 @@ class MartingleSpotStrategyV3(CtaTemplate):
 
         if self.current_pos * bar.close_price >= self.min_notional:
             # 有仓位
-            if len(self.sell_orders) <= 0 < self.avg_price:
+            if self.order_book.count("sell") <= 0 < self.avg_price:
                 # 有利润平仓的时候
                 # 清理掉其他买单.
 
@@ -644,9 +693,9 @@ class MartingleSpotStrategyV3(CtaTemplate):
                 if profit_percent >= self.exit_profit_pct and profit_pull_back_pct >= self.exit_pull_back_pct:
                     self.cancel_all()
                     orderids = self.sell(bar.close_price, abs(self.current_pos))
-                    self.sell_orders.extend(orderids)
+                    self.order_book.add_orders(orderids, "sell")
 
-            if len(self.buy_orders) <= 0:
+            if self.order_book.count("buy") <= 0:
                 # 考虑加仓的条件: 1） 当前有仓位,且仓位值要大于11USDTyi以上，2）加仓的次数小于最大的加仓次数，3）当前的价格比上次入场的价格跌了一定的百分比。
 
                 dump_down_pct = self.last_entry_price / bar.close_price - 1
@@ -659,14 +708,19 @@ class MartingleSpotStrategyV3(CtaTemplate):
                     price = bar.close_price
                     vol = increase_pos_value / price
                     orderids = self.buy(price, vol)
-                    self.buy_orders.extend(orderids)
+                    self.order_book.add_orders(orderids, "buy")
 
-        self.bg_1hour.update_bar(bar)
-        self.bg_4hour.update_bar(bar)
+        if not self.bar_service.shared or not self.inited:
+            # 回测的时候自己推送1分钟K线, 合成1小时和4小时的K线; 实盘初始化的时候用历史K线预热.
+            self.bar_service.update_bar(bar)
 
+        if self.state_journal:
+            self.state_journal.update()
         self.put_event()
 
     def on_1hour_bar(self, bar: BarData):
+        if not self.trading:
+            return  # 初始化的时候历史K线只用来预热, 不入场.
 
         close_change_pct = bar.close_price / bar.open_price - 1  # 收盘价涨了多少.
         high_change_pct = bar.high_price / bar.close_price - 1  # 计算上引线
@@ -674,8 +728,7 @@ class MartingleSpotStrategyV3(CtaTemplate):
         # 回调一定比例的时候.
         if self.current_pos * bar.close_price < self.min_notional:  # 10 USDT
             # 每次下单要大于等于10USDT, 为了简单设置11USDT.
-            if close_change_pct >= self.hour_pump_pct and high_change_pct < self.high_close_change_pct and len(
-                    self.buy_orders) == 0:
+            if close_change_pct >= self.hour_pump_pct and high_change_pct < self.high_close_change_pct and self.order_book.count("buy") == 0:
                 # 这里没有仓位.
                 # 重置当前的数据.
                 self.cancel_all()
@@ -686,17 +739,19 @@ class MartingleSpotStrategyV3(CtaTemplate):
                 price = bar.close_price
                 vol = self.initial_trading_value / price
                 orderids = self.buy(price, vol)
-                self.buy_orders.extend(orderids)  # 以及已经下单的orderids.
+                self.order_book.add_orders(orderids, "buy")  # 以及已经下单的orderids.
 
     def on_4hour_bar(self, bar: BarData):
+        if not self.trading:
+            return  # 初始化的时候历史K线只用来预热, 不入场.
+
         close_change_pct = bar.close_price / bar.open_price - 1  # 收盘价涨了多少.
         high_change_pct = bar.high_price / bar.close_price - 1  # 计算上引线
 
         # 回调一定比例的时候.
         if self.current_pos * bar.close_price < self.min_notional:
             # 每次下单要大于等于10USDT, 为了简单设置11USDT.
-            if close_change_pct >= self.four_hour_pump_pct and high_change_pct < self.high_close_change_pct and len(
-                    self.buy_orders) == 0:
+            if close_change_pct >= self.four_hour_pump_pct and high_change_pct < self.high_close_change_pct and self.order_book.count("buy") == 0:
                 # 这里没有仓位.
                 # 重置当前的数据.
                 self.cancel_all()
@@ -707,7 +762,7 @@ class MartingleSpotStrategyV3(CtaTemplate):
                 price = bar.close_price
                 vol = self.initial_trading_value / price
                 orderids = self.buy(price, vol)
-                self.buy_orders.extend(orderids)  # 以及已经下单的orderids.
+                self.order_book.add_orders(orderids, "buy")  # 以及已经下单的orderids.
 
     def on_order(self, order: OrderData):
         """
@@ -721,12 +776,10 @@ class MartingleSpotStrategyV3(CtaTemplate):
                 self.entry_highest_price = order.price
 
         if not order.is_active():
-            if order.vt_orderid in self.sell_orders:
-                self.sell_orders.remove(order.vt_orderid)
-
-            elif order.vt_orderid in self.buy_orders:
-                self.buy_orders.remove(order.vt_orderid)
+            self.order_book.remove_order(order.vt_orderid)
 
+        if self.state_journal:
+            self.state_journal.update()
         self.put_event()  # 更新UI使用.
 
     def on_trade(self, trade: TradeData):
@@ -746,6 +799,8 @@ class MartingleSpotStrategyV3(CtaTemplate):
             total_fee = trade.volume * trade.price * 2 * self.trading_fee
             self.total_profit += profit - total_fee
 
+        if self.state_journal:
+            self.state_journal.update()
         self.put_event()
 
     def on_stop_order(self, stop_order: StopOrder):
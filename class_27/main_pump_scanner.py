@@ -0,0 +1,66 @@
+from time import sleep
+from logging import INFO
+
+from howtrader.event import EventEngine
+from howtrader.trader.setting import SETTINGS
+from howtrader.trader.engine import MainEngine, LogEngine
+
+from howtrader.gateway.binance import BinanceGateway  # 现货接口
+from howtrader.app.cta_strategy import CtaStrategyApp, CtaEngine
+from howtrader.app.cta_strategy.base import EVENT_CTA_LOG
+
+from pump_scanner_engine import PumpScannerEngine
+
+SETTINGS["log.active"] = True
+SETTINGS["log.level"] = INFO
+SETTINGS["log.console"] = True
+
+# 现货的api
+binance_setting = {
+    "key": "",
+    "secret": "",
+    "session_number": 3,
+    "proxy_host": "",
+    "proxy_port": 0,
+}
+
+# 扫描的参数, 没有设置的参数使用pump_scanner_engine.py里面的DEFAULT_SETTING.
+scanner_setting = {
+    "max_strategies": 5,
+    "idle_hours": 4,
+    "strategy_setting": {"initial_trading_value": 200, "max_increase_pos_count": 5},
+}
+
+
+def run():
+    """
+    扫描所有USDT交易对, 只在触发入场条件的交易对上启动马丁策略, 不需要界面.
+    """
+    SETTINGS["log.file"] = True
+
+    event_engine = EventEngine()
+    main_engine = MainEngine(event_engine)
+    main_engine.add_gateway(BinanceGateway)
+    cta_engine: CtaEngine = main_engine.add_app(CtaStrategyApp)
+    scanner: PumpScannerEngine = main_engine.add_engine(PumpScannerEngine)
+    main_engine.write_log("主引擎创建成功")
+
+    log_engine: LogEngine = main_engine.get_engine("log")
+    event_engine.register(EVENT_CTA_LOG, log_engine.process_log_event)
+
+    main_engine.connect(binance_setting, "BINANCE")  # 连接现货的
+    main_engine.write_log("连接接口成功")
+
+    sleep(10)
+
+    cta_engine.init_engine()
+    main_engine.write_log("CTA策略初始化完成")
+
+    scanner.start(scanner_setting)
+
+    while True:
+        sleep(10)
+
+
+if __name__ == "__main__":
+    run()
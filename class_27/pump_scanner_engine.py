@@ -0,0 +1,266 @@
+"""
+    全市场的强势币扫描: 只在触发入场条件的交易对上启动MartingleSpotStrategyV3.
+
+    MartingleSpotStrategyV3 的入场条件是1小时K线涨幅超过 hour_pump_pct, 或者4小时K线涨幅超过 four_hour_pump_pct,
+    而且上引线(最高价/收盘价 - 1)小于 high_close_change_pct。以前每个交易对都要添加一个策略, 几百个策略大部分时间都在空等。
+
+    PumpScannerEngine 订阅所有USDT现货交易对的1小时和4小时K线(strategies/kline_stream.py):
+    1. 每个交易对的开盘价、最高价、收盘价放到numpy数组里面(每一行是一个交易对, 每一列是一个周期).
+    2. 整点的时候所有交易对的K线几秒钟之内陆续收盘, 收到K线只是更新数组, 最后一根K线到了SCAN_DELAY秒之后,
+       用数组的运算一次判断所有交易对的入场条件.
+    3. 触发的交易对才添加、初始化、启动策略, 然后把触发的K线交给策略的on_1hour_bar/on_4hour_bar马上入场.
+    4. 策略平仓之后空闲超过idle_hours小时就停止并删除(定时器每IDLE_CHECK_INTERVAL秒检查一次), 同时运行的策略不超过max_strategies个.
+    5. 几百个stream用一条(分批的)SUBSCRIBE消息订阅, 不超过币安每秒5条消息的限制.
+
+    使用方法参考 main_pump_scanner.py.
+"""
+
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from howtrader.app.cta_strategy import CtaEngine
+from howtrader.event import Event, EventEngine
+from howtrader.trader.engine import BaseEngine, MainEngine
+from howtrader.trader.event import EVENT_TIMER
+from howtrader.trader.object import BarData, ContractData
+
+from strategies.kline_stream import KlineStream, EVENT_KLINE, get_gateway_proxy
+from strategies.martingle_spot_strategyV3 import MartingleSpotStrategyV3
+
+APP_NAME = "PumpScanner"
+
+EVENT_PUMP_START = "ePumpStart."  # 策略初始化完成之后在事件引擎的线程里面启动.
+
+SCAN_DELAY = 3  # 最后一根K线收到之后等待多少秒再扫描.
+
+IDLE_CHECK_INTERVAL = 60  # 每隔多少秒检查一次空闲的策略.
+
+STRATEGY_CLASS = MartingleSpotStrategyV3.__name__
+
+# 扫描的参数, 默认值跟MartingleSpotStrategyV3一样.
+DEFAULT_SETTING = {
+    "hour_pump_pct": MartingleSpotStrategyV3.hour_pump_pct,
+    "four_hour_pump_pct": MartingleSpotStrategyV3.four_hour_pump_pct,
+    "high_close_change_pct": MartingleSpotStrategyV3.high_close_change_pct,
+    "quote_asset": "usdt",
+    "max_strategies": 5,  # 同时运行的策略数量.
+    "idle_hours": 4,  # 没有仓位也没有挂单超过这个小时数就删除策略.
+    "strategy_setting": {},  # 启动的策略的参数, 没有设置的用策略的默认值.
+}
+
+# K线周期, 对应数组的列.
+KLINE_INTERVALS = ("1h", "4h")
+INTERVAL_INDEX = {kline_interval: index for index, kline_interval in enumerate(KLINE_INTERVALS)}
+
+# 杠杆代币不参与扫描.
+EXCLUDED_SUFFIXES = ("upusdt", "downusdt", "bullusdt", "bearusdt")
+
+
+class PumpScannerEngine(BaseEngine):
+    """
+    用数组同时判断所有交易对入场条件的扫描引擎.
+    """
+
+    def __init__(self, main_engine: MainEngine, event_engine: EventEngine):
+        """"""
+        super().__init__(main_engine, event_engine, APP_NAME)
+
+        self.active: bool = False
+        self.setting: dict = dict(DEFAULT_SETTING)
+        self.cta_engine: CtaEngine = None
+
+        self.vt_symbols: List[str] = []
+        self.symbol_index: Dict[str, int] = {}  # vt_symbol: 数组的行号
+
+        self.strategy_start_times: Dict[str, float] = {}  # 扫描引擎启动的策略: 启动的时间
+        self.last_kline_time: float = 0  # 最后收到K线的时间, 0表示没有等待扫描的K线.
+        self.timer_count: int = 0
+
+    def start(self, setting: dict = None) -> None:
+        """
+        需要在接口连接成功、收到合约信息之后调用.
+        """
+        if self.active:
+            return
+
+        if setting:
+            self.setting.update(setting)
+
+        self.cta_engine = self.main_engine.get_engine("CtaStrategy")
+
+        quote_asset = self.setting["quote_asset"]
+        contracts: List[ContractData] = self.main_engine.get_all_contracts()
+        self.vt_symbols = sorted(
+            contract.vt_symbol for contract in contracts
+            if contract.gateway_name == "BINANCE"
+            and contract.symbol.endswith(quote_asset)
+            and not contract.symbol.endswith(EXCLUDED_SUFFIXES)
+        )
+        self.symbol_index = {vt_symbol: index for index, vt_symbol in enumerate(self.vt_symbols)}
+
+        shape = (len(self.vt_symbols), len(KLINE_INTERVALS))
+        self.open_price: np.ndarray = np.full(shape, np.nan)
+        self.high_price: np.ndarray = np.full(shape, np.nan)
+        self.close_price: np.ndarray = np.full(shape, np.nan)
+        self.open_time: np.ndarray = np.zeros(shape)  # K线开盘的时间戳.
+        self.scanned_time: np.ndarray = np.zeros(shape)  # 已经扫描过的K线的开盘时间戳.
+        self.bars: List[List[BarData]] = [[None] * len(KLINE_INTERVALS) for _ in self.vt_symbols]
+
+        for vt_symbol in self.vt_symbols:
+            self.event_engine.register(EVENT_KLINE + vt_symbol, self.process_kline_event)
+
+        # 都是现货交易对, 共用一个连接, 所有的stream一次订阅.
+        if self.vt_symbols:
+            proxy_host, proxy_port = get_gateway_proxy(self.main_engine, self.vt_symbols[0])
+            stream = KlineStream.get_stream(self.event_engine, self.vt_symbols[0], proxy_host, proxy_port)
+            stream.subscribe_streams(
+                [(vt_symbol, kline_interval) for vt_symbol in self.vt_symbols for kline_interval in KLINE_INTERVALS]
+            )
+
+        self.event_engine.register(EVENT_TIMER, self.process_timer_event)
+        self.event_engine.register(EVENT_PUMP_START, self.process_pump_start_event)
+
+        self.active = True
+        self.write_log(f"扫描引擎启动, 交易对数量: {len(self.vt_symbols)}")
+
+    def stop(self) -> None:
+        """"""
+        if not self.active:
+            return
+
+        self.active = False
+
+        for vt_symbol in self.vt_symbols:
+            self.event_engine.unregister(EVENT_KLINE + vt_symbol, self.process_kline_event)
+
+        self.event_engine.unregister(EVENT_TIMER, self.process_timer_event)
+        self.event_engine.unregister(EVENT_PUMP_START, self.process_pump_start_event)
+
+    def close(self) -> None:
+        """"""
+        self.stop()
+
+    def process_kline_event(self, event: Event) -> None:
+        """
+        只更新数组, 扫描放到定时器里面.
+        """
+        kline_interval, bar = event.data
+        row = self.symbol_index[bar.vt_symbol]
+        column = INTERVAL_INDEX[kline_interval]
+
+        self.open_price[row, column] = bar.open_price
+        self.high_price[row, column] = bar.high_price
+        self.close_price[row, column] = bar.close_price
+        self.open_time[row, column] = bar.datetime.timestamp()
+        self.bars[row][column] = bar
+
+        self.last_kline_time = time.time()
+
+    def process_timer_event(self, event: Event) -> None:
+        """"""
+        if self.last_kline_time and time.time() - self.last_kline_time >= SCAN_DELAY:
+            self.last_kline_time = 0
+            self.scan()
+
+        self.timer_count += 1
+        if self.timer_count >= IDLE_CHECK_INTERVAL:
+            self.timer_count = 0
+            self.remove_idle_strategies()
+
+    def scan(self) -> None:
+        """
+        一次判断所有交易对最新收盘的K线, 在触发的交易对上启动策略.
+        """
+        thresholds = np.array([self.setting["hour_pump_pct"], self.setting["four_hour_pump_pct"]])
+
+        new_bars = self.open_time > self.scanned_time
+        self.scanned_time[new_bars] = self.open_time[new_bars]
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            close_change_pct = self.close_price / self.open_price - 1
+            high_change_pct = self.high_price / self.close_price - 1
+
+        triggered = (
+            new_bars
+            & (close_change_pct >= thresholds)
+            & (high_change_pct < self.setting["high_close_change_pct"])
+        )
+
+        rows, columns = np.nonzero(triggered)
+        for row, column in zip(rows, columns):
+            vt_symbol = self.vt_symbols[row]
+            self.write_log(
+                f"{vt_symbol} {KLINE_INTERVALS[column]} 涨幅: {close_change_pct[row, column]:.2%}, "
+                f"上引线: {high_change_pct[row, column]:.2%}"
+            )
+            self.start_strategy(vt_symbol, KLINE_INTERVALS[column], self.bars[row][column])
+
+    def start_strategy(self, vt_symbol: str, kline_interval: str, bar: BarData) -> None:
+        """
+        添加并初始化策略, 初始化在线程池里面完成之后通过EVENT_PUMP_START启动.
+        """
+        strategy_name = f"pump_{vt_symbol.split('.')[0]}"
+
+        if strategy_name in self.strategy_start_times:
+            return
+
+        if len(self.strategy_start_times) >= self.setting["max_strategies"]:
+            self.write_log(f"策略数量已经达到{self.setting['max_strategies']}个, 不启动{vt_symbol}")
+            return
+
+        if strategy_name not in self.cta_engine.strategies:
+            self.cta_engine.add_strategy(STRATEGY_CLASS, strategy_name, vt_symbol, self.setting["strategy_setting"])
+
+        self.strategy_start_times[strategy_name] = time.time()
+
+        future = self.cta_engine.init_strategy(strategy_name)
+        future.add_done_callback(
+            lambda _: self.event_engine.put(Event(EVENT_PUMP_START, (strategy_name, kline_interval, bar)))
+        )
+
+    def process_pump_start_event(self, event: Event) -> None:
+        """
+        启动策略, 然后把触发的K线交给策略判断入场.
+        """
+        strategy_name, kline_interval, bar = event.data
+
+        strategy: MartingleSpotStrategyV3 = self.cta_engine.strategies.get(strategy_name, None)
+        if not strategy or not strategy.inited:
+            self.strategy_start_times.pop(strategy_name, None)
+            return
+
+        self.cta_engine.start_strategy(strategy_name)
+
+        if kline_interval == "1h":
+            self.cta_engine.call_strategy_func(strategy, strategy.on_1hour_bar, bar)
+        else:
+            self.cta_engine.call_strategy_func(strategy, strategy.on_4hour_bar, bar)
+
+    def remove_idle_strategies(self) -> None:
+        """
+        平仓之后没有挂单超过idle_hours小时的策略停止并删除, 给其他交易对腾出位置.
+        """
+        now = time.time()
+
+        for strategy_name, start_time in list(self.strategy_start_times.items()):
+            strategy: MartingleSpotStrategyV3 = self.cta_engine.strategies.get(strategy_name, None)
+            if not strategy or not strategy.trading:
+                continue
+
+            row = self.symbol_index[strategy.vt_symbol]
+            price = self.close_price[row, INTERVAL_INDEX["1h"]]
+            idle = strategy.current_pos * price < strategy.min_notional and len(strategy.order_book) == 0
+
+            if not idle:
+                self.strategy_start_times[strategy_name] = now  # 有仓位的时候重新计时.
+            elif now - start_time >= self.setting["idle_hours"] * 3600:
+                self.cta_engine.stop_strategy(strategy_name)
+                self.cta_engine.remove_strategy(strategy_name)
+                self.strategy_start_times.pop(strategy_name)
+                self.write_log(f"{strategy_name}空闲超过{self.setting['idle_hours']}小时, 已经删除")
+
+    def write_log(self, msg: str) -> None:
+        """"""
+        self.main_engine.write_log(msg, source=APP_NAME)
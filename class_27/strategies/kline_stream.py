@@ -0,0 +1,261 @@
+"""
+    币安websocket的K线推送.
+
+    以前策略要在on_tick里面把每个tick交给BarGenerator合成K线, 每个tick都要计算,
+    合成的K线跟交易所自己的K线也不完全一样(没有成交的时候没有tick, 断线的时候少了tick)。
+
+    KlineStream 直接订阅交易所的K线流(比如 btcusdt@kline_1m, btcusdt@kline_4h):
+    1. 只推送已经收盘的K线(k["x"]为True), 通过事件引擎的 EVENT_KLINE + vt_symbol 推送, 回调跟策略在同一个线程.
+    2. 每个市场(现货、U本位合约、币本位合约)一个websocket连接, 所有交易对和周期共用.
+    3. 断线重连的时候, 先用REST接口把断线期间已经收盘的K线补上, 再处理新的推送, K线不会缺也不会重复.
+    4. 币安每个连接每秒最多接收5条消息, 订阅很多stream的时候用 subscribe_streams 一次订阅,
+       每条SUBSCRIBE消息最多SUBSCRIBE_BATCH_SIZE个stream, 两条消息之间至少间隔SUBSCRIBE_INTERVAL秒.
+
+    一般不直接使用, 由 BarService.get_service(cta_engine, vt_symbol, use_kline_stream=True) 订阅.
+"""
+
+import time
+import traceback
+from datetime import datetime
+from threading import Lock
+from typing import Dict, List, Sequence, Tuple
+
+import pytz
+import requests
+
+from howtrader.api.websocket import WebsocketClient
+from howtrader.event import Event, EventEngine
+from howtrader.trader.constant import Exchange, Interval
+from howtrader.trader.object import BarData
+
+EVENT_KLINE = "eKline."  # 事件的数据是 (kline_interval, bar), 比如 ("4h", bar)
+
+CHINA_TZ = pytz.timezone("Asia/Shanghai")
+
+BACKFILL_LIMIT = 1000  # 补数据的时候每个周期最多请求多少根K线.
+
+SUBSCRIBE_BATCH_SIZE = 200  # 每条SUBSCRIBE消息最多订阅多少个stream.
+SUBSCRIBE_INTERVAL = 0.25  # 两条SUBSCRIBE消息之间最少间隔的秒数, 币安每秒最多5条.
+
+# 市场: (websocket地址, K线的REST接口, gateway_name)
+MARKET_HOSTS = {
+    "spot": ("wss://stream.binance.com:9443/stream", "https://api.binance.com/api/v3/klines", "BINANCE"),
+    "future": ("wss://fstream.binance.com/stream", "https://fapi.binance.com/fapi/v1/klines", "BINANCES"),
+    "coin_future": ("wss://dstream.binance.com/stream", "https://dapi.binance.com/dapi/v1/klines", "BINANCES"),
+}
+
+# 币安K线周期对应的(window, interval).
+KLINE_INTERVALS = {
+    "1m": (1, Interval.MINUTE),
+    "3m": (3, Interval.MINUTE),
+    "5m": (5, Interval.MINUTE),
+    "15m": (15, Interval.MINUTE),
+    "30m": (30, Interval.MINUTE),
+    "1h": (1, Interval.HOUR),
+    "2h": (2, Interval.HOUR),
+    "4h": (4, Interval.HOUR),
+    "6h": (6, Interval.HOUR),
+    "8h": (8, Interval.HOUR),
+    "12h": (12, Interval.HOUR),
+}
+
+
+def get_market(vt_symbol: str) -> str:
+    """
+    现货的交易对是小写的(btcusdt), U本位合约是大写的(BTCUSDT), 币本位合约带下划线(BTCUSD_PERP).
+    """
+    symbol = vt_symbol.split(".")[0]
+    if symbol.islower():
+        return "spot"
+    elif "_" in symbol:
+        return "coin_future"
+    return "future"
+
+
+def generate_datetime(timestamp: float) -> datetime:
+    """
+    直接转换成北京时间, 不依赖电脑的时区.
+    """
+    return datetime.fromtimestamp(timestamp / 1000, CHINA_TZ)
+
+
+def get_gateway_proxy(main_engine, vt_symbol: str) -> Tuple[str, int]:
+    """
+    交易对所在市场的接口(BINANCE或者BINANCES)连接时设置的代理, K线推送用同样的代理, 没有就返回("", 0).
+    """
+    gateway = main_engine.get_gateway(MARKET_HOSTS[get_market(vt_symbol)][2])
+    ws_api = getattr(gateway, "market_ws_api", None)
+    return getattr(ws_api, "proxy_host", "") or "", getattr(ws_api, "proxy_port", 0) or 0
+
+
+class KlineStream(WebsocketClient):
+    """
+    一个市场的K线推送, 所有交易对和周期共用一个连接.
+    """
+
+    _streams: Dict[Tuple[EventEngine, str], "KlineStream"] = {}
+
+    @classmethod
+    def get_stream(cls, event_engine: EventEngine, vt_symbol: str,
+                   proxy_host: str = "", proxy_port: int = 0) -> "KlineStream":
+        """
+        获取事件引擎上这个交易对所在市场共享的K线推送.
+        """
+        market = get_market(vt_symbol)
+        key = (event_engine, market)
+        stream = cls._streams.get(key, None)
+
+        if not stream:
+            stream = KlineStream(event_engine, market, proxy_host, proxy_port)
+            cls._streams[key] = stream
+
+        return stream
+
+    def __init__(self, event_engine: EventEngine, market: str, proxy_host: str = "", proxy_port: int = 0):
+        """"""
+        super().__init__()
+
+        self.event_engine: EventEngine = event_engine
+        self.ws_host, self.rest_url, self.gateway_name = MARKET_HOSTS[market]
+        self.proxy_host: str = proxy_host
+        self.proxy_port: int = proxy_port
+
+        self.streams: Dict[str, Tuple[str, str]] = {}  # "btcusdt@kline_1m": (vt_symbol, "1m")
+        self.last_open_times: Dict[str, int] = {}  # 每个stream最后推送的K线的开盘时间.
+        self.started: bool = False
+        self.request_id: int = 0
+        self.subscribe_lock: Lock = Lock()
+        self.last_subscribe_time: float = 0
+
+    def subscribe(self, vt_symbol: str, kline_interval: str) -> None:
+        """
+        订阅一个交易对某个周期的K线, kline_interval是币安的周期, 比如"1m", "4h".
+        """
+        self.subscribe_streams([(vt_symbol, kline_interval)])
+
+    def subscribe_streams(self, subscriptions: Sequence[Tuple[str, str]]) -> None:
+        """
+        一次订阅很多(vt_symbol, kline_interval), 新的stream合并到同一条SUBSCRIBE消息里面.
+        """
+        new_streams: List[str] = []
+        for vt_symbol, kline_interval in subscriptions:
+            symbol = vt_symbol.split(".")[0]
+            stream = f"{symbol.lower()}@kline_{kline_interval}"
+            if stream in self.streams:
+                continue
+
+            self.streams[stream] = (vt_symbol, kline_interval)
+            new_streams.append(stream)
+
+        if not new_streams:
+            return
+
+        if not self.started:
+            self.init(self.ws_host, self.proxy_host, self.proxy_port)
+            self.start()
+            self.started = True
+        else:
+            self.send_subscribe(new_streams)  # 还没连上的时候发送不出去, 连上之后on_connected会订阅所有的stream.
+
+    def send_subscribe(self, streams: List[str]) -> None:
+        """
+        分批发送, 每批之间等待SUBSCRIBE_INTERVAL秒, 不超过币安的消息频率限制.
+        """
+        for i in range(0, len(streams), SUBSCRIBE_BATCH_SIZE):
+            with self.subscribe_lock:
+                wait = self.last_subscribe_time + SUBSCRIBE_INTERVAL - time.time()
+                if wait > 0:
+                    time.sleep(wait)
+
+                self.request_id += 1
+                params = streams[i:i + SUBSCRIBE_BATCH_SIZE]
+                self.send_packet({"method": "SUBSCRIBE", "params": params, "id": self.request_id})
+                self.last_subscribe_time = time.time()
+
+    def on_connected(self) -> None:
+        """
+        连上或者重连之后订阅所有的stream, 然后补上断线期间的K线.
+        """
+        print(f"K线推送连接成功: {self.ws_host}")
+        self.send_subscribe(list(self.streams.keys()))
+        self.backfill()
+
+    def on_disconnected(self) -> None:
+        """"""
+        print(f"K线推送断开连接: {self.ws_host}")
+
+    def on_packet(self, packet: dict) -> None:
+        """
+        只处理已经收盘的K线.
+        """
+        data = packet.get("data", None)
+        if not data or data.get("e", None) != "kline":
+            return
+
+        kline = data["k"]
+        if not kline["x"]:
+            return
+
+        self.push_kline(
+            packet["stream"], kline["t"],
+            kline["o"], kline["h"], kline["l"], kline["c"], kline["v"]
+        )
+
+    def backfill(self) -> None:
+        """
+        用REST接口请求每个stream最后一根K线之后已经收盘的K线. 第一次连接的时候没有K线, 不需要补.
+        这个方法在websocket的线程里面执行, 补完之前不会处理新的推送, 所以K线的顺序不会乱.
+        """
+        proxies = None
+        if self.proxy_host and self.proxy_port:
+            proxy = f"http://{self.proxy_host}:{self.proxy_port}"
+            proxies = {"http": proxy, "https": proxy}
+
+        now = int(time.time() * 1000)
+
+        for stream, last_open_time in list(self.last_open_times.items()):
+            vt_symbol, kline_interval = self.streams[stream]
+            params = {
+                "symbol": vt_symbol.split(".")[0].upper(),
+                "interval": kline_interval,
+                "startTime": last_open_time + 1,
+                "limit": BACKFILL_LIMIT
+            }
+
+            try:
+                data = requests.get(self.rest_url, params=params, timeout=10, proxies=proxies).json()
+            except Exception:
+                print(f"补K线数据出错: {stream}\n{traceback.format_exc()}")
+                continue
+
+            for row in data:
+                if row[6] < now:  # 收盘时间已经过去的才是收盘的K线.
+                    self.push_kline(stream, row[0], row[1], row[2], row[3], row[4], row[5])
+
+    def push_kline(self, stream: str, open_time: int, open_price: str, high_price: str, low_price: str,
+                   close_price: str, volume: str) -> None:
+        """
+        把K线推送到事件引擎, 已经推送过的K线直接丢掉.
+        """
+        if open_time <= self.last_open_times.get(stream, -1):
+            return
+        self.last_open_times[stream] = open_time
+
+        vt_symbol, kline_interval = self.streams[stream]
+        symbol, exchange = vt_symbol.split(".")
+        _, interval = KLINE_INTERVALS[kline_interval]
+
+        bar = BarData(
+            symbol=symbol,
+            exchange=Exchange(exchange),
+            datetime=generate_datetime(open_time),
+            interval=interval,
+            volume=float(volume),
+            open_price=float(open_price),
+            high_price=float(high_price),
+            low_price=float(low_price),
+            close_price=float(close_price),
+            gateway_name=self.gateway_name
+        )
+
+        self.event_engine.put(Event(EVENT_KLINE + vt_symbol, (kline_interval, bar)))
@@ -0,0 +1,133 @@
+"""
+    策略变量的追加式日志.
+
+    马丁策略的关键状态(avg_price, current_pos, current_increase_pos_count, last_entry_price,
+    entry_highest_price, total_profit)以前只靠引擎定期把所有策略写到 cta_strategy_data.json 里面,
+    每次都要重写整个文件, 进程崩溃的时候最后一次保存之后的成交就丢了。
+
+    StateJournal 只把变化了的变量追加到每个策略自己的二进制日志里面:
+    1. 每条记录是 (时间戳, 变量序号, 变量的值), 18个字节, 写入的数据量只跟变化的变量数量有关.
+    2. 记录保存的是变量的值而不是变化量, 恢复的时候按顺序重放, 后面的值覆盖前面的值, 重复重放结果也一样.
+    3. 记录超过COMPACT_INTERVAL条的时候压缩: 先把所有变量写到快照文件(写临时文件再替换), 再清空日志.
+       替换之后、清空之前崩溃也没有关系, 重放旧的日志结果不变.
+
+    使用方法:
+
+    self.state_journal = StateJournal(self)
+    self.state_journal.load()  # on_start里面恢复变量, 要在引擎恢复cta_strategy_data.json之后
+
+    # on_order, on_trade 里面变量改了之后
+    self.state_journal.update()
+"""
+
+import json
+import os
+import struct
+from datetime import datetime
+from typing import Dict, List
+
+from howtrader.app.cta_strategy import CtaTemplate
+from howtrader.trader.utility import get_file_path
+
+RECORD_FORMAT = "<dHd"  # 时间戳, 变量序号, 变量的值.
+RECORD_SIZE = struct.calcsize(RECORD_FORMAT)
+COMPACT_INTERVAL = 1000  # 日志超过多少条记录压缩一次.
+
+
+class StateJournal(object):
+    """
+    把策略的variables追加保存到二进制日志, 定期压缩成快照.
+    """
+
+    def __init__(self, strategy: CtaTemplate, variables: List[str] = None):
+        """"""
+        self.strategy: CtaTemplate = strategy
+        self.variables: List[str] = list(variables or strategy.variables)
+        self.variable_index: Dict[str, int] = {name: i for i, name in enumerate(self.variables)}
+
+        self.journal_path: str = str(get_file_path(f"state_journal_{strategy.strategy_name}.bin"))
+        self.snapshot_path: str = str(get_file_path(f"state_snapshot_{strategy.strategy_name}.json"))
+
+        self.saved_values: Dict[str, float] = {}  # 已经写到日志里面的值, 用来判断哪些变量变了.
+        self.record_count: int = 0
+        self.loaded: bool = False  # on_init里面加载历史数据的时候变量还没有恢复, 这时候不写日志.
+
+    def load(self) -> None:
+        """
+        从快照和日志恢复策略的变量, 然后压缩一次.
+        """
+        values: Dict[str, float] = {}
+        snapshot_variables: List[str] = self.variables
+
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, mode="r", encoding="UTF-8") as f:
+                snapshot = json.load(f)
+            values.update(snapshot["values"])
+            snapshot_variables = snapshot["variables"]  # 日志里面的序号是按快照保存时候的变量顺序.
+
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, "rb") as f:
+                data = f.read()
+
+            data = data[:len(data) // RECORD_SIZE * RECORD_SIZE]  # 丢掉写了一半的记录.
+            for _, index, value in struct.iter_unpack(RECORD_FORMAT, data):
+                if index < len(snapshot_variables):
+                    values[snapshot_variables[index]] = value
+
+        for name in self.variables:
+            if name in values:
+                default = getattr(self.strategy, name)
+                setattr(self.strategy, name, type(default)(values[name]))
+
+        self.loaded = True
+        self.compact()
+
+    def update(self) -> None:
+        """
+        把变化了的变量追加到日志里面.
+        """
+        if not self.loaded:
+            return
+
+        timestamp = datetime.now().timestamp()
+        records = []
+
+        for name in self.variables:
+            value = float(getattr(self.strategy, name))
+            if self.saved_values.get(name) != value:
+                self.saved_values[name] = value
+                records.append(struct.pack(RECORD_FORMAT, timestamp, self.variable_index[name], value))
+
+        if not records:
+            return
+
+        with open(self.journal_path, "ab") as f:
+            f.write(b"".join(records))
+
+        self.record_count += len(records)
+        if self.record_count >= COMPACT_INTERVAL:
+            self.compact()
+
+    def compact(self) -> None:
+        """
+        把当前所有变量写到快照文件, 然后清空日志.
+        """
+        if not self.loaded:
+            return
+
+        self.saved_values = {name: float(getattr(self.strategy, name)) for name in self.variables}
+
+        snapshot = {
+            "variables": self.variables,
+            "values": self.saved_values
+        }
+
+        temp_path = self.snapshot_path + ".tmp"
+        with open(temp_path, mode="w+", encoding="UTF-8") as f:
+            json.dump(snapshot, f, indent=4, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.snapshot_path)
+
+        open(self.journal_path, "wb").close()
+        self.record_count = 0
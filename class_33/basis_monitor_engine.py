@@ -0,0 +1,250 @@
+"""
+    所有现货-合约交易对的实时价差监控.
+
+    币安的现货交易对是小写的(btcusdt.BINANCE), U本位合约是大写的(BTCUSDT.BINANCE), 参考main_window.py的说明。
+    做资金费率套利的时候要同时看几百个交易对的价差和资金费率, 一个一个打开盘口看不过来。
+
+    BasisMonitorEngine 订阅每一对现货和合约的盘口:
+    1. 每个交易对一行, 数据放在一个 (交易对, 列) 的numpy数组里面, 列是 COLUMNS 里面的字段.
+    2. 收到tick的时候只更新这一行: 买一卖一价、开仓价差(合约买一/现货卖一-1)、净收益, 不创建新的对象.
+    3. 资金费率用REST接口 premiumIndex 一次获取所有合约的, 在线程里面请求, 不阻塞事件引擎.
+    4. 每隔 publish_interval 秒按净收益排序, 把前 top_n 个交易对通过 EVENT_BASIS_SNAPSHOT 推送出去.
+    5. 订阅放到队列里面, 定时器每秒最多发送 subscribe_per_second 个, 不会一下子发出几百个订阅超过币安每秒5条消息的限制.
+
+    净收益 = 开仓价差 + 资金费率 * hold_funding_times - 开平仓的手续费, 表示现在买现货、空合约,
+    收 hold_funding_times 次资金费率之后以价差为0平仓大概能赚多少.
+
+    使用方法参考 main_basis_monitor.py.
+"""
+
+import traceback
+from threading import Thread
+from typing import Dict, List, Tuple
+
+import numpy as np
+import requests
+
+from howtrader.event import Event, EventEngine
+from howtrader.trader.engine import BaseEngine, MainEngine
+from howtrader.trader.event import EVENT_TICK, EVENT_TIMER
+from howtrader.trader.object import ContractData, SubscribeRequest, TickData
+
+APP_NAME = "BasisMonitor"
+
+EVENT_BASIS_SNAPSHOT = "eBasisSnapshot"  # 事件的数据是排好序的字典列表.
+EVENT_FUNDING_RATE = "eFundingRate"  # 线程里面请求到的资金费率, 回到事件引擎的线程里面更新数组.
+
+PREMIUM_INDEX_URL = "https://fapi.binance.com/fapi/v1/premiumIndex"
+
+DEFAULT_SETTING = {
+    "quote_asset": "usdt",
+    "publish_interval": 5,  # 多少秒推送一次排名.
+    "funding_interval": 60,  # 多少秒更新一次资金费率.
+    "top_n": 20,
+    "hold_funding_times": 3,  # 计算净收益的时候收多少次资金费率, 3次是一天.
+    "spot_fee": 0.00075,
+    "future_fee": 0.0004,
+    "proxy_host": "",
+    "proxy_port": 0,
+    "subscribe_per_second": 4,  # 每秒最多订阅多少个交易对的盘口.
+}
+
+# 数组的列.
+COLUMNS = ("spot_bid", "spot_ask", "future_bid", "future_ask", "basis", "funding_rate", "net_carry")
+SPOT_BID, SPOT_ASK, FUTURE_BID, FUTURE_ASK, BASIS, FUNDING_RATE, NET_CARRY = range(len(COLUMNS))
+
+
+class BasisMonitorEngine(BaseEngine):
+    """
+    用数组保存所有现货-合约交易对的价差、资金费率和净收益.
+    """
+
+    def __init__(self, main_engine: MainEngine, event_engine: EventEngine):
+        """"""
+        super().__init__(main_engine, event_engine, APP_NAME)
+
+        self.active: bool = False
+        self.setting: dict = dict(DEFAULT_SETTING)
+
+        self.symbols: List[str] = []  # 合约的交易对, 比如BTCUSDT, 对应数组的行.
+        self.symbol_rows: Dict[str, int] = {}
+        self.tick_index: Dict[str, Tuple[int, int]] = {}  # vt_symbol: (行, 买一价的列), 卖一价在下一列.
+        self.table: np.ndarray = np.zeros((0, len(COLUMNS)))
+
+        self.fee_cost: float = 0  # 开仓和平仓两边的手续费.
+        self.publish_count: int = 0
+        self.funding_count: int = 0
+        self.funding_requesting: bool = False
+        self.pending_subscriptions: List[Tuple[SubscribeRequest, str]] = []  # 还没有发送的订阅: (请求, gateway_name)
+
+    def start(self, setting: dict = None) -> None:
+        """
+        需要在现货和合约的接口都连接成功、收到合约信息之后调用.
+        """
+        if self.active:
+            return
+
+        if setting:
+            self.setting.update(setting)
+
+        quote_asset = self.setting["quote_asset"]
+        contracts: List[ContractData] = self.main_engine.get_all_contracts()
+        spot_contracts = {
+            contract.symbol: contract for contract in contracts
+            if contract.gateway_name == "BINANCE" and contract.symbol.endswith(quote_asset)
+        }
+        future_contracts = {
+            contract.symbol: contract for contract in contracts
+            if contract.gateway_name == "BINANCES" and contract.symbol.lower() in spot_contracts
+        }
+
+        self.symbols = sorted(future_contracts.keys())
+        self.symbol_rows = {symbol: row for row, symbol in enumerate(self.symbols)}
+        self.table = np.full((len(self.symbols), len(COLUMNS)), np.nan)
+        self.table[:, FUNDING_RATE] = 0
+
+        for row, symbol in enumerate(self.symbols):
+            for contract, bid_column in ((spot_contracts[symbol.lower()], SPOT_BID), (future_contracts[symbol], FUTURE_BID)):
+                self.tick_index[contract.vt_symbol] = (row, bid_column)
+                req = SubscribeRequest(symbol=contract.symbol, exchange=contract.exchange)
+                self.pending_subscriptions.append((req, contract.gateway_name))
+
+        self.fee_cost = 2 * (self.setting["spot_fee"] + self.setting["future_fee"])
+
+        self.event_engine.register(EVENT_TICK, self.process_tick_event)
+        self.event_engine.register(EVENT_TIMER, self.process_timer_event)
+        self.event_engine.register(EVENT_FUNDING_RATE, self.process_funding_rate_event)
+
+        self.active = True
+        self.send_subscriptions()
+        self.request_funding_rates()
+        self.write_log(f"价差监控启动, 交易对数量: {len(self.symbols)}")
+
+    def stop(self) -> None:
+        """"""
+        if not self.active:
+            return
+
+        self.active = False
+        self.pending_subscriptions.clear()
+        self.event_engine.unregister(EVENT_TICK, self.process_tick_event)
+        self.event_engine.unregister(EVENT_TIMER, self.process_timer_event)
+        self.event_engine.unregister(EVENT_FUNDING_RATE, self.process_funding_rate_event)
+
+    def close(self) -> None:
+        """"""
+        self.stop()
+
+    def process_tick_event(self, event: Event) -> None:
+        """
+        只更新这个交易对的一行.
+        """
+        tick: TickData = event.data
+        index = self.tick_index.get(tick.vt_symbol, None)
+        if not index or tick.bid_price_1 <= 0 or tick.ask_price_1 <= 0:
+            return
+
+        row, bid_column = index
+        values = self.table[row]
+        values[bid_column] = tick.bid_price_1
+        values[bid_column + 1] = tick.ask_price_1
+        self.update_row(values)
+
+    def update_row(self, values: np.ndarray) -> None:
+        """
+        开仓价差用合约的买一价和现货的卖一价计算, 是真的能成交的价差. 另一边还没有盘口的时候是nan.
+        """
+        values[BASIS] = values[FUTURE_BID] / values[SPOT_ASK] - 1
+        values[NET_CARRY] = values[BASIS] + values[FUNDING_RATE] * self.setting["hold_funding_times"] - self.fee_cost
+
+    def send_subscriptions(self) -> None:
+        """
+        发送队列里面最前面的 subscribe_per_second 个订阅, 剩下的下一秒再发送.
+        """
+        count = self.setting["subscribe_per_second"]
+        subscriptions, self.pending_subscriptions = self.pending_subscriptions[:count], self.pending_subscriptions[count:]
+
+        for req, gateway_name in subscriptions:
+            self.main_engine.subscribe(req, gateway_name)
+
+    def process_timer_event(self, event: Event) -> None:
+        """"""
+        if self.pending_subscriptions:
+            self.send_subscriptions()
+
+        self.publish_count += 1
+        if self.publish_count >= self.setting["publish_interval"]:
+            self.publish_count = 0
+            self.publish_snapshot()
+
+        self.funding_count += 1
+        if self.funding_count >= self.setting["funding_interval"]:
+            self.funding_count = 0
+            self.request_funding_rates()
+
+    def publish_snapshot(self) -> None:
+        """
+        按净收益从高到低排序, 推送前top_n个交易对.
+        """
+        net_carry = self.table[:, NET_CARRY]
+        valid_rows = np.flatnonzero(~np.isnan(net_carry))
+        top_rows = valid_rows[np.argsort(-net_carry[valid_rows])[:self.setting["top_n"]]]
+
+        snapshot = [
+            dict(symbol=self.symbols[row], **dict(zip(COLUMNS, self.table[row].tolist())))
+            for row in top_rows
+        ]
+        self.event_engine.put(Event(EVENT_BASIS_SNAPSHOT, snapshot))
+
+    def request_funding_rates(self) -> None:
+        """
+        在线程里面请求所有合约的资金费率, 上一次还没有返回的时候不再请求.
+        """
+        if self.funding_requesting:
+            return
+
+        self.funding_requesting = True
+        Thread(target=self.query_funding_rates, daemon=True).start()
+
+    def query_funding_rates(self) -> None:
+        """"""
+        proxies = None
+        if self.setting["proxy_host"] and self.setting["proxy_port"]:
+            proxy = f"http://{self.setting['proxy_host']}:{self.setting['proxy_port']}"
+            proxies = {"http": proxy, "https": proxy}
+
+        try:
+            data = requests.get(PREMIUM_INDEX_URL, timeout=10, proxies=proxies).json()
+            """
+            [
+                {
+                    "symbol": "BTCUSDT",
+                    "markPrice": "11793.63104562",  // 标记价格
+                    "lastFundingRate": "0.00038246",  // 最近更新的资金费率, 也就是下一次结算的预测资金费率
+                    "nextFundingTime": 1597392000000,  // 下次资金费时间
+                    ...
+                }
+            ]
+            """
+            funding_rates = {d["symbol"]: float(d["lastFundingRate"]) for d in data}
+            self.event_engine.put(Event(EVENT_FUNDING_RATE, funding_rates))
+        except Exception:
+            self.write_log(f"请求资金费率出错: {traceback.format_exc()}")
+        finally:
+            self.funding_requesting = False
+
+    def process_funding_rate_event(self, event: Event) -> None:
+        """
+        更新资金费率那一列, 再重新计算所有行的净收益.
+        """
+        funding_rates: Dict[str, float] = event.data
+        rows = [self.symbol_rows[symbol] for symbol in funding_rates if symbol in self.symbol_rows]
+        self.table[rows, FUNDING_RATE] = [funding_rates[self.symbols[row]] for row in rows]
+
+        self.table[:, NET_CARRY] = (
+            self.table[:, BASIS] + self.table[:, FUNDING_RATE] * self.setting["hold_funding_times"] - self.fee_cost
+        )
+
+    def write_log(self, msg: str) -> None:
+        """"""
+        self.main_engine.write_log(msg, source=APP_NAME)
@@ -0,0 +1,389 @@
+"""
+    现货-合约对冲的拆单执行.
+
+    资金费率套利要买入现货、同时做空同样数量的合约(平仓的时候反过来)。一次下很大的单, 盘口吃不下, 滑点很大;
+    一条腿成交了另一条腿没成交, 就有单边的敞口。class_22说的"算法拆单, 降低对冲的滑点"就是这个执行器:
+
+    1. 每次只下一个子单: 数量不超过 trade_max_usd_every_time, 也不超过盘口前几档在滑点范围(slippage_tolerance_pct)
+       以内的挂单量乘以 depth_ratio, 两条腿取数量少的那一边.
+    2. 现货和合约的子单同时发出去(不等一条腿成交再下另一条), 用超价的限价单, 价格是盘口价加减滑点.
+    3. 子单超过 order_timeout 秒没有完全成交就撤单. 两条腿成交的数量不一样的时候, 先补齐落后的那条腿, 再发下一个子单,
+       每个子单的金额不超过 max_unhedged_usd, 所以单边的敞口不会超过一个子单.
+    4. 每个子单记录每条腿从下单到第一次成交的延迟, 以及成交均价相对下单时盘口价的滑点, summary() 汇总统计.
+       成交数量以订单回报的traded为准(币安的订单回报比成交回报先到), 成交均价用成交回报计算.
+
+    下单、撤单、获取盘口用的是MainEngine的 send_order / cancel_order / get_tick / get_contract,
+    回报用事件引擎的 EVENT_ORDER / EVENT_TRADE, 所以可以直接换成 simulated_exchange.py 里面的模拟交易所来测试.
+
+    使用方法:
+
+    executor = HedgeExecutor(main_engine, event_engine)
+    executor.start("btcusdt.BINANCE", "BTCUSDT.BINANCE", 10)  # 买10个BTC现货, 空10个BTC合约, 负数是平仓.
+"""
+
+import time
+from math import floor
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+from howtrader.event import Event, EventEngine
+from howtrader.trader.constant import Direction, Offset, OrderType
+from howtrader.trader.engine import MainEngine
+from howtrader.trader.event import EVENT_ORDER, EVENT_TICK, EVENT_TIMER, EVENT_TRADE
+from howtrader.trader.object import ContractData, OrderData, OrderRequest, TickData, TradeData
+
+APP_NAME = "HedgeExecutor"
+
+DEFAULT_SETTING = {
+    "trade_max_usd_every_time": 1000,  # 每个子单最多多少USDT.
+    "slippage_tolerance_pct": 0.03,  # 0.03表示0.03%, 超价下单的幅度, 也是计算盘口深度的价格范围.
+    "depth_levels": 5,  # 看盘口的前几档.
+    "depth_ratio": 0.5,  # 最多吃掉盘口深度的比例.
+    "max_unhedged_usd": 2000,  # 单边敞口的上限, 子单的金额不会超过这个值.
+    "order_timeout": 3,  # 子单多少秒没有完全成交就撤单.
+}
+
+LEGS = ("spot", "future")
+
+
+class HedgeLeg(object):
+    """
+    对冲的一条腿, 记录合约信息、下单方向和已经成交的数量.
+    """
+
+    def __init__(self, contract: ContractData, direction: Direction, offset: Offset):
+        """"""
+        self.contract: ContractData = contract
+        self.direction: Direction = direction
+        self.offset: Offset = offset
+        self.traded: float = 0
+
+
+class HedgeExecutor(object):
+    """
+    现货和合约同时下单的拆单执行器.
+    """
+
+    def __init__(self, main_engine: MainEngine, event_engine: EventEngine, clock: Callable[[], float] = time.time):
+        """
+        clock是获取当前时间(秒)的函数, 模拟交易所用自己的时间.
+        """
+        self.main_engine: MainEngine = main_engine
+        self.event_engine: EventEngine = event_engine
+        self.clock: Callable[[], float] = clock
+        self.setting: dict = dict(DEFAULT_SETTING)
+
+        self.active: bool = False
+        self.target_volume: float = 0
+        self.legs: Dict[str, HedgeLeg] = {}
+        self.min_volume: float = 0  # 两条腿都能下单的最小数量.
+
+        self.orders: Dict[str, OrderData] = {}  # 还没有结束的订单
+        self.order_children: Dict[str, Tuple[dict, str]] = {}  # vt_orderid: (子单的记录, 哪条腿)
+        self.cancel_sent: set = set()
+        self.child_records: List[dict] = []
+        self.child_count: int = 0
+
+    def start(self, spot_vt_symbol: str, future_vt_symbol: str, volume: float, setting: dict = None) -> None:
+        """
+        volume为正数是开仓(买现货, 空合约), 负数是平仓(卖现货, 平空合约).
+        """
+        if self.active:
+            return
+
+        if setting:
+            self.setting.update(setting)
+
+        spot_contract: ContractData = self.main_engine.get_contract(spot_vt_symbol)
+        future_contract: ContractData = self.main_engine.get_contract(future_vt_symbol)
+        if not spot_contract or not future_contract:
+            self.write_log(f"找不到合约: {spot_vt_symbol}, {future_vt_symbol}")
+            return
+
+        if volume > 0:
+            self.legs = {
+                "spot": HedgeLeg(spot_contract, Direction.LONG, Offset.NONE),
+                "future": HedgeLeg(future_contract, Direction.SHORT, Offset.OPEN),
+            }
+        else:
+            self.legs = {
+                "spot": HedgeLeg(spot_contract, Direction.SHORT, Offset.NONE),
+                "future": HedgeLeg(future_contract, Direction.LONG, Offset.CLOSE),
+            }
+
+        self.target_volume = abs(volume)
+        self.min_volume = max(spot_contract.min_volume, future_contract.min_volume)
+        self.child_records = []
+
+        self.event_engine.register(EVENT_TICK, self.process_tick_event)
+        self.event_engine.register(EVENT_ORDER, self.process_order_event)
+        self.event_engine.register(EVENT_TRADE, self.process_trade_event)
+        self.event_engine.register(EVENT_TIMER, self.process_timer_event)
+
+        self.active = True
+        self.write_log(f"开始对冲: {spot_vt_symbol} {future_vt_symbol} 数量: {volume}")
+
+    def stop(self) -> None:
+        """
+        停止执行并撤掉还没有成交的订单, 订单的回报还会继续记录.
+        """
+        if not self.active:
+            return
+
+        self.active = False
+        self.cancel_all()
+        self.unregister_event()
+
+    def process_tick_event(self, event: Event) -> None:
+        """"""
+        tick: TickData = event.data
+        if any(tick.vt_symbol == leg.contract.vt_symbol for leg in self.legs.values()):
+            self.step()
+
+    def process_timer_event(self, event: Event) -> None:
+        """"""
+        self.step()
+
+    def process_order_event(self, event: Event) -> None:
+        """
+        用订单的traded更新每条腿成交的数量, 订单结束之后继续执行下一步.
+        """
+        order: OrderData = event.data
+        last_order = self.orders.get(order.vt_orderid, None)
+        if not last_order:
+            return
+
+        record, leg_name = self.order_children[order.vt_orderid]
+        traded = order.traded - last_order.traded
+        if traded > 0:
+            self.legs[leg_name].traded = round(self.legs[leg_name].traded + traded, 10)
+            record[f"{leg_name}_traded"] += traded
+            self.record_latency(record, leg_name)
+
+        if order.is_active():
+            self.orders[order.vt_orderid] = order
+            return
+
+        self.orders.pop(order.vt_orderid)
+        self.cancel_sent.discard(order.vt_orderid)
+
+        if self.active:
+            self.step()
+        elif not self.orders:
+            self.event_engine.unregister(EVENT_ORDER, self.process_order_event)
+            self.event_engine.unregister(EVENT_TRADE, self.process_trade_event)
+
+    def process_trade_event(self, event: Event) -> None:
+        """
+        记录成交的金额, 用来计算成交均价.
+        """
+        trade: TradeData = event.data
+        child = self.order_children.get(trade.vt_orderid, None)
+        if not child:
+            return
+
+        record, leg_name = child
+        record[f"{leg_name}_trade_volume"] += trade.volume
+        record[f"{leg_name}_turnover"] += trade.volume * trade.price
+        self.record_latency(record, leg_name)
+
+    def record_latency(self, record: dict, leg_name: str) -> None:
+        """
+        从下单到第一次成交的时间.
+        """
+        if record[f"{leg_name}_latency"] is None:
+            record[f"{leg_name}_latency"] = self.clock() - record["send_time"]
+
+    def step(self) -> None:
+        """
+        检查超时的订单, 补齐落后的腿, 或者发下一个子单. 上一个子单结束之前不发新的子单.
+        """
+        if not self.active:
+            return
+
+        now = self.clock()
+        for vt_orderid, order in list(self.orders.items()):
+            record, _ = self.order_children[vt_orderid]
+            if now - record["send_time"] >= self.setting["order_timeout"] and vt_orderid not in self.cancel_sent:
+                self.cancel_sent.add(vt_orderid)
+                self.main_engine.cancel_order(order.create_cancel_request(), order.gateway_name)
+
+        if self.orders:
+            return
+
+        spot_leg, future_leg = self.legs["spot"], self.legs["future"]
+        imbalance = spot_leg.traded - future_leg.traded
+        if abs(imbalance) >= self.min_volume:
+            lagging = "future" if imbalance > 0 else "spot"
+            self.send_child({lagging: self.round_volume(abs(imbalance))})
+            return
+
+        remaining = self.target_volume - min(spot_leg.traded, future_leg.traded)
+        if remaining < self.min_volume:
+            self.active = False
+            self.unregister_event()
+            self.write_log(f"对冲完成, 现货成交: {spot_leg.traded}, 合约成交: {future_leg.traded}")
+            return
+
+        volume = min(remaining, self.get_max_volume("spot"), self.get_max_volume("future"))
+        volume = self.round_volume(volume)
+        if volume > 0:
+            self.send_child({"spot": volume, "future": volume})
+
+    def get_max_volume(self, leg_name: str) -> float:
+        """
+        这条腿这一次最多能下多少: 金额上限、单边敞口上限、盘口在滑点范围以内的深度, 取最小的.
+        """
+        leg = self.legs[leg_name]
+        tick: TickData = self.main_engine.get_tick(leg.contract.vt_symbol)
+        if not tick:
+            return 0
+
+        price, limit_price = self.get_prices(leg, tick)
+        if price <= 0:
+            return 0
+
+        side = "ask" if leg.direction == Direction.LONG else "bid"
+        depth = 0
+        for level in range(1, self.setting["depth_levels"] + 1):
+            level_price = getattr(tick, f"{side}_price_{level}", 0)
+            if not level_price:
+                break
+            if (leg.direction == Direction.LONG and level_price > limit_price) or \
+                    (leg.direction == Direction.SHORT and level_price < limit_price):
+                break
+            depth += getattr(tick, f"{side}_volume_{level}", 0)
+
+        max_usd = min(self.setting["trade_max_usd_every_time"], self.setting["max_unhedged_usd"])
+        return min(max_usd / price, depth * self.setting["depth_ratio"])
+
+    def get_prices(self, leg: HedgeLeg, tick: TickData) -> Tuple[float, float]:
+        """
+        返回对手价和超价下单的价格.
+        """
+        slippage = self.setting["slippage_tolerance_pct"] / 100
+        if leg.direction == Direction.LONG:
+            price = tick.ask_price_1
+            limit_price = price * (1 + slippage)
+        else:
+            price = tick.bid_price_1
+            limit_price = price * (1 - slippage)
+
+        pricetick = leg.contract.pricetick
+        limit_price = round(round(limit_price / pricetick) * pricetick, 10) if pricetick else limit_price
+        return price, limit_price
+
+    def round_volume(self, volume: float) -> float:
+        """
+        向下取到最小下单数量的整数倍, 不会多下.
+        """
+        return round(floor(volume / self.min_volume + 1e-9) * self.min_volume, 10)
+
+    def send_child(self, volumes: Dict[str, float]) -> None:
+        """
+        每条腿同时下一个超价的限价单, volumes 是 {腿: 数量}, 补单的时候只有一条腿.
+        """
+        self.child_count += 1
+        record = {"child_id": self.child_count, "send_time": self.clock(), "volume": max(volumes.values())}
+
+        for leg_name in LEGS:
+            record[f"{leg_name}_volume"] = volumes.get(leg_name, 0)
+            record[f"{leg_name}_expected"] = 0
+            record[f"{leg_name}_traded"] = 0
+            record[f"{leg_name}_trade_volume"] = 0
+            record[f"{leg_name}_turnover"] = 0
+            record[f"{leg_name}_latency"] = None
+
+        for leg_name, volume in volumes.items():
+            leg = self.legs[leg_name]
+            tick: TickData = self.main_engine.get_tick(leg.contract.vt_symbol)
+            if not tick:
+                continue
+
+            price, limit_price = self.get_prices(leg, tick)
+            record[f"{leg_name}_expected"] = price
+
+            req = OrderRequest(
+                symbol=leg.contract.symbol,
+                exchange=leg.contract.exchange,
+                direction=leg.direction,
+                type=OrderType.LIMIT,
+                volume=volume,
+                price=limit_price,
+                offset=leg.offset,
+                reference=APP_NAME
+            )
+            vt_orderid = self.main_engine.send_order(req, leg.contract.gateway_name)
+            if not vt_orderid:
+                continue
+
+            self.orders[vt_orderid] = req.create_order_data(vt_orderid.split(".")[-1], leg.contract.gateway_name)
+            self.order_children[vt_orderid] = (record, leg_name)
+
+        self.child_records.append(record)
+        if not any(child[0] is record for child in self.order_children.values()):
+            self.write_log(f"子单下单失败: {volumes}")
+
+    def unregister_event(self) -> None:
+        """
+        还有订单没有结束的时候继续接收订单和成交的回报.
+        """
+        self.event_engine.unregister(EVENT_TICK, self.process_tick_event)
+        self.event_engine.unregister(EVENT_TIMER, self.process_timer_event)
+
+        if not self.orders:
+            self.event_engine.unregister(EVENT_ORDER, self.process_order_event)
+            self.event_engine.unregister(EVENT_TRADE, self.process_trade_event)
+
+    def cancel_all(self) -> None:
+        """"""
+        for vt_orderid, order in self.orders.items():
+            if vt_orderid not in self.cancel_sent:
+                self.cancel_sent.add(vt_orderid)
+                self.main_engine.cancel_order(order.create_cancel_request(), order.gateway_name)
+
+    def get_unhedged_volume(self) -> float:
+        """
+        现货比合约多成交的数量, 负数表示合约成交得多.
+        """
+        if not self.legs:
+            return 0
+        return self.legs["spot"].traded - self.legs["future"].traded
+
+    def get_slippage(self, record: dict, leg_name: str) -> float:
+        """
+        子单一条腿的成交均价相对下单时对手价的滑点, 正数表示成交得比对手价差, 没有成交返回nan.
+        """
+        trade_volume = record[f"{leg_name}_trade_volume"]
+        expected = record[f"{leg_name}_expected"]
+        if trade_volume <= 0 or expected <= 0:
+            return np.nan
+
+        avg_price = record[f"{leg_name}_turnover"] / trade_volume
+        sign = 1 if self.legs[leg_name].direction == Direction.LONG else -1
+        return sign * (avg_price / expected - 1)
+
+    def summary(self) -> dict:
+        """
+        所有子单每条腿的平均/最大延迟(秒)和平均/最大滑点.
+        """
+        result = {"child_count": len(self.child_records), "unhedged_volume": self.get_unhedged_volume()}
+
+        for leg_name in LEGS:
+            latency = np.array([r[f"{leg_name}_latency"] for r in self.child_records
+                                if r[f"{leg_name}_latency"] is not None], dtype=float)
+            slippage = np.array([self.get_slippage(r, leg_name) for r in self.child_records], dtype=float)
+            slippage = slippage[~np.isnan(slippage)]
+
+            result[f"{leg_name}_traded"] = self.legs[leg_name].traded if self.legs else 0
+            result[f"{leg_name}_latency_mean"] = float(latency.mean()) if len(latency) else 0.0
+            result[f"{leg_name}_latency_max"] = float(latency.max()) if len(latency) else 0.0
+            result[f"{leg_name}_slippage_mean"] = float(slippage.mean()) if len(slippage) else 0.0
+            result[f"{leg_name}_slippage_max"] = float(slippage.max()) if len(slippage) else 0.0
+
+        return result
+
+    def write_log(self, msg: str) -> None:
+        """"""
+        self.main_engine.write_log(msg, source=APP_NAME)
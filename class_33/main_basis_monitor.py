@@ -0,0 +1,76 @@
+from time import sleep
+from logging import INFO
+
+from howtrader.event import EventEngine, Event
+from howtrader.trader.setting import SETTINGS
+from howtrader.trader.engine import MainEngine
+
+from howtrader.gateway.binance import BinanceGateway  # 现货接口
+from howtrader.gateway.binances import BinancesGateway  # 合约接口
+
+from basis_monitor_engine import BasisMonitorEngine, EVENT_BASIS_SNAPSHOT
+
+SETTINGS["log.active"] = True
+SETTINGS["log.level"] = INFO
+SETTINGS["log.console"] = True
+
+# 现货的api
+binance_setting = {
+    "key": "",
+    "secret": "",
+    "session_number": 3,
+    "proxy_host": "",
+    "proxy_port": 0,
+}
+
+# 合约的api
+binances_setting = {
+    "key": "",
+    "secret": "",
+    "会话数": 3,
+    "服务器": "REAL",
+    "合约模式": "正向",
+    "代理地址": "",
+    "代理端口": 0,
+}
+
+# 监控的参数, 没有设置的参数使用basis_monitor_engine.py里面的DEFAULT_SETTING.
+monitor_setting = {
+    "publish_interval": 10,
+    "top_n": 10,
+}
+
+
+def print_snapshot(event: Event) -> None:
+    """"""
+    print("-" * 80)
+    for d in event.data:
+        print(f"{d['symbol']:<12} 价差: {d['basis']:.4%}  资金费率: {d['funding_rate']:.4%}  净收益: {d['net_carry']:.4%}")
+
+
+def run():
+    """
+    监控所有现货-合约交易对的价差和资金费率, 不需要界面.
+    """
+    event_engine = EventEngine()
+    main_engine = MainEngine(event_engine)
+    main_engine.add_gateway(BinanceGateway)
+    main_engine.add_gateway(BinancesGateway)
+    monitor: BasisMonitorEngine = main_engine.add_engine(BasisMonitorEngine)
+    main_engine.write_log("主引擎创建成功")
+
+    main_engine.connect(binance_setting, "BINANCE")  # 连接现货的
+    main_engine.connect(binances_setting, "BINANCES")  # 连接合约的
+    main_engine.write_log("连接接口成功")
+
+    sleep(10)
+
+    event_engine.register(EVENT_BASIS_SNAPSHOT, print_snapshot)
+    monitor.start(monitor_setting)
+
+    while True:
+        sleep(10)
+
+
+if __name__ == "__main__":
+    run()
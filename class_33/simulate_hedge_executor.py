@@ -0,0 +1,41 @@
+import random
+
+from howtrader.event import EventEngine
+
+from hedge_executor import HedgeExecutor
+from simulated_exchange import SimulatedExchange
+
+if __name__ == '__main__':
+    # 用模拟交易所测试拆单执行, 合约的盘口只有60%能成交, 看看执行器怎么补齐落后的腿.
+    random.seed(1)
+
+    event_engine = EventEngine()  # 不需要启动, 模拟交易所会自己处理事件.
+    exchange = SimulatedExchange(event_engine, latency=0.05)
+    exchange.add_contract("btcusdt", "BINANCE", pricetick=0.01, min_volume=0.001)
+    exchange.add_contract("BTCUSDT", "BINANCES", pricetick=0.01, min_volume=0.001, fill_ratio=0.6)
+
+    executor = HedgeExecutor(exchange, event_engine, clock=exchange.clock)
+
+    def update_books(price: float) -> None:
+        """"""
+        for vt_symbol, mid_price in (("btcusdt.BINANCE", price), ("BTCUSDT.BINANCE", price * 1.002)):
+            bids = [(round(mid_price - 0.5 - i, 2), round(random.uniform(0.01, 0.2), 3)) for i in range(5)]
+            asks = [(round(mid_price + 0.5 + i, 2), round(random.uniform(0.01, 0.2), 3)) for i in range(5)]
+            exchange.update_book(vt_symbol, bids, asks)
+
+    price = 30000
+    update_books(price)
+
+    executor.start("btcusdt.BINANCE", "BTCUSDT.BINANCE", 2, {
+        "trade_max_usd_every_time": 3000,
+        "slippage_tolerance_pct": 0.01,
+        "max_unhedged_usd": 3000,
+    })
+
+    while executor.active and exchange.time < 600:
+        exchange.advance(0.1)
+        price += random.gauss(0, 2)
+        update_books(price)
+
+    for key, value in executor.summary().items():
+        print(f"{key}: {value}")
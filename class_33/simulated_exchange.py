@@ -0,0 +1,232 @@
+"""
+    模拟交易所, 用来测试 hedge_executor.py 的拆单执行.
+
+    提供跟MainEngine一样的 send_order / cancel_order / get_tick / get_contract / write_log,
+    订单和成交的回报通过事件引擎的 EVENT_ORDER / EVENT_TRADE 推送, 执行器不需要改任何代码.
+
+    1. update_book 设置一个交易对的盘口(前几档的价格和数量), 推送tick, 然后撮合还挂着的订单.
+    2. 订单发出去之后过 latency 秒才到交易所, 撤单也一样, 用 advance 推进模拟的时间, 每过一秒推送一次 EVENT_TIMER.
+    3. 限价单按盘口一档一档成交, 成交的数量会从这次的盘口里面扣掉; fill_ratio 是盘口里面真正能成交的比例,
+       设置小于1可以模拟一条腿成交不足的情况.
+    4. 事件引擎不需要启动, 每次 update_book 和 advance 之后在当前线程里面处理完队列里面的事件, 每次运行的结果都一样.
+
+    使用方法参考 simulate_hedge_executor.py.
+"""
+
+from copy import copy
+from math import floor
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+from howtrader.event import Event, EventEngine
+from howtrader.trader.constant import Direction, Exchange, Product, Status
+from howtrader.trader.event import EVENT_ORDER, EVENT_TICK, EVENT_TIMER, EVENT_TRADE
+from howtrader.trader.object import CancelRequest, ContractData, OrderData, OrderRequest, TickData, TradeData
+
+DEPTH_LEVELS = 5
+
+
+class SimulatedExchange(object):
+    """
+    按盘口深度和延迟撮合限价单的模拟交易所.
+    """
+
+    def __init__(self, event_engine: EventEngine, latency: float = 0.05):
+        """"""
+        self.event_engine: EventEngine = event_engine
+        self.latency: float = latency
+        self.time: float = 0  # 模拟的时间(秒).
+
+        self.contracts: Dict[str, ContractData] = {}
+        self.ticks: Dict[str, TickData] = {}
+        self.books: Dict[str, Tuple[List[list], List[list]]] = {}  # vt_symbol: ([[价格, 数量], ...]买盘, 卖盘)
+        self.fill_ratios: Dict[str, float] = {}
+
+        self.orders: Dict[str, OrderData] = {}  # 挂在交易所的订单
+        self.actions: List[Tuple[float, str, object]] = []  # (到达交易所的时间, "order"或"cancel", 数据)
+        self.order_count: int = 0
+        self.trade_count: int = 0
+
+    def clock(self) -> float:
+        """"""
+        return self.time
+
+    def add_contract(self, symbol: str, gateway_name: str, pricetick: float = 0.01, min_volume: float = 0.001,
+                     fill_ratio: float = 1.0) -> ContractData:
+        """
+        添加合约, gateway_name是BINANCE(现货)或者BINANCES(合约).
+        """
+        contract = ContractData(
+            symbol=symbol,
+            exchange=Exchange.BINANCE,
+            name=symbol,
+            product=Product.SPOT if gateway_name == "BINANCE" else Product.FUTURES,
+            size=1,
+            pricetick=pricetick,
+            min_volume=min_volume,
+            gateway_name=gateway_name
+        )
+        self.contracts[contract.vt_symbol] = contract
+        self.fill_ratios[contract.vt_symbol] = fill_ratio
+        return contract
+
+    def get_contract(self, vt_symbol: str) -> ContractData:
+        """"""
+        return self.contracts.get(vt_symbol, None)
+
+    def get_tick(self, vt_symbol: str) -> TickData:
+        """"""
+        return self.ticks.get(vt_symbol, None)
+
+    def write_log(self, msg: str, source: str = "") -> None:
+        """"""
+        print(f"{self.time:.3f} {source}: {msg}")
+
+    def update_book(self, vt_symbol: str, bids: List[Tuple[float, float]], asks: List[Tuple[float, float]]) -> None:
+        """
+        设置新的盘口并推送tick, 然后撮合挂着的订单. bids从高到低, asks从低到高.
+        """
+        contract = self.contracts[vt_symbol]
+        fill_ratio = self.fill_ratios[vt_symbol]
+        self.books[vt_symbol] = (
+            [[price, volume * fill_ratio] for price, volume in bids],
+            [[price, volume * fill_ratio] for price, volume in asks]
+        )
+
+        tick = TickData(
+            symbol=contract.symbol,
+            exchange=contract.exchange,
+            datetime=self.get_datetime(),
+            gateway_name=contract.gateway_name
+        )
+        for level, (price, volume) in enumerate(bids[:DEPTH_LEVELS], 1):
+            setattr(tick, f"bid_price_{level}", price)
+            setattr(tick, f"bid_volume_{level}", volume)
+        for level, (price, volume) in enumerate(asks[:DEPTH_LEVELS], 1):
+            setattr(tick, f"ask_price_{level}", price)
+            setattr(tick, f"ask_volume_{level}", volume)
+        tick.last_price = (bids[0][0] + asks[0][0]) / 2 if bids and asks else 0
+
+        self.ticks[vt_symbol] = tick
+        self.event_engine.put(Event(EVENT_TICK, tick))
+        self.event_engine.put(Event(EVENT_TICK + vt_symbol, tick))
+
+        for order in list(self.orders.values()):
+            if order.vt_symbol == vt_symbol:
+                self.match_order(order)
+
+        self.process_events()
+
+    def send_order(self, req: OrderRequest, gateway_name: str) -> str:
+        """
+        订单先是提交中的状态, latency秒之后到达交易所.
+        """
+        self.order_count += 1
+        order = req.create_order_data(str(self.order_count), gateway_name)
+        self.push_order(order)
+
+        self.actions.append((self.time + self.latency, "order", order))
+        return order.vt_orderid
+
+    def cancel_order(self, req: CancelRequest, gateway_name: str) -> None:
+        """"""
+        self.actions.append((self.time + self.latency, "cancel", f"{gateway_name}.{req.orderid}"))
+
+    def advance(self, seconds: float) -> None:
+        """
+        推进模拟的时间, 处理这段时间到达交易所的下单和撤单.
+        """
+        last_time = self.time
+        self.time += seconds
+
+        if int(self.time) > int(last_time):
+            self.event_engine.put(Event(EVENT_TIMER))
+
+        due = [action for action in self.actions if action[0] <= self.time]
+        self.actions = [action for action in self.actions if action[0] > self.time]
+
+        for _, action_type, data in sorted(due, key=lambda action: action[0]):
+            if action_type == "order":
+                order: OrderData = data
+                order.status = Status.NOTTRADED
+                self.orders[order.vt_orderid] = order
+                self.push_order(order)
+                self.match_order(order)
+            else:
+                order = self.orders.pop(data, None)
+                if order:
+                    order.status = Status.CANCELLED
+                    self.push_order(order)
+
+        self.process_events()
+
+    def process_events(self) -> None:
+        """
+        在当前线程里面处理完事件引擎队列里面的事件, 处理的时候新产生的事件也一起处理.
+        """
+        queue = self.event_engine._queue
+        while not queue.empty():
+            self.event_engine._process(queue.get(block=False))
+
+    def match_order(self, order: OrderData) -> None:
+        """
+        限价单按对手盘一档一档成交, 成交价是盘口的价格.
+        """
+        book = self.books.get(order.vt_symbol, None)
+        if not book:
+            return
+
+        bids, asks = book
+        min_volume = self.contracts[order.vt_symbol].min_volume
+        levels = asks if order.direction == Direction.LONG else bids
+
+        for level in levels:
+            price, volume = level
+            remaining = order.volume - order.traded
+            if remaining <= 0 or volume <= 0:
+                continue
+            if (order.direction == Direction.LONG and price > order.price) or \
+                    (order.direction == Direction.SHORT and price < order.price):
+                break
+
+            traded = round(floor(min(remaining, volume) / min_volume + 1e-9) * min_volume, 10)  # 按最小数量成交.
+            if traded <= 0:
+                continue
+
+            level[1] -= traded
+            order.traded = round(order.traded + traded, 10)
+            order.status = Status.ALLTRADED if order.traded >= order.volume else Status.PARTTRADED
+
+            self.push_order(order)
+            self.push_trade(order, price, traded)
+
+        if not order.is_active():
+            self.orders.pop(order.vt_orderid, None)
+
+    def push_order(self, order: OrderData) -> None:
+        """
+        推送订单的副本, 跟真实的接口一样每次推送的都是新的对象.
+        """
+        order.datetime = self.get_datetime()
+        self.event_engine.put(Event(EVENT_ORDER, copy(order)))
+
+    def push_trade(self, order: OrderData, price: float, volume: float) -> None:
+        """"""
+        self.trade_count += 1
+        trade = TradeData(
+            symbol=order.symbol,
+            exchange=order.exchange,
+            orderid=order.orderid,
+            tradeid=str(self.trade_count),
+            direction=order.direction,
+            offset=order.offset,
+            price=price,
+            volume=volume,
+            datetime=self.get_datetime(),
+            gateway_name=order.gateway_name
+        )
+        self.event_engine.put(Event(EVENT_TRADE, trade))
+
+    def get_datetime(self) -> datetime:
+        """"""
+        return datetime.fromtimestamp(self.time)
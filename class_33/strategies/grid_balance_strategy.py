@@ -9,17 +9,11 @@ from howtrader.app.cta_strategy import (
     ArrayManager
 )
 
-from howtrader.trader.event import (
-    EVENT_TICK,
-    EVENT_BAR,
-    EVENT_ORDER,
-    EVENT_TRADE,
-    EVENT_POSITION,
-    EVENT_ACCOUNT
-)
-
-from howtrader.event import Event
+from howtrader.trader.object import Direction, Offset
 
+from strategies.account_cache import AccountCache
+from strategies.order_book import MyOrderBook
+from strategies.portfolio_rebalancer import PortfolioRebalancer
 
 from howtrader.trader.constant import Interval
 from datetime import datetime
@@ -32,18 +26,36 @@ class GridBalanceStrategy(CtaTemplate):
 
     author = "51bitquant"
 
-    balance_diff_pct = 0.01
+    balance_diff_pct = 0.01  # |USDT - 币的价值| / USDT 超过这个比例才调仓, 跟以前一样.
+    trading_fee = 0.00075  # 交易手续费, 按成交金额扣, 用来放大调仓的数量.
+    target_weight = 0.5  # 币的价值占总资金的比例, 剩下的是USDT.
+    quote_asset = "USDT"  # 计价资产.
+    requote_pct = 0.002  # 挂着的调仓单跟新的价格或者数量相差超过这个比例才改单.
 
-    parameters = ["balance_diff_pct"]
+    parameters = ["balance_diff_pct", "trading_fee", "target_weight", "quote_asset", "requote_pct"]
 
     def __init__(self, cta_engine: CtaEngine, strategy_name, vt_symbol, setting):
         """"""
         super().__init__(cta_engine, strategy_name, vt_symbol, setting)
 
+        # btcusdt.BINANCE -> BTC 和 USDT.
+        symbol = vt_symbol.split(".")[0].upper()
+        self.base_asset = symbol[:-len(self.quote_asset)] if symbol.endswith(self.quote_asset) else symbol
+
+        self.rebalancer = PortfolioRebalancer(
+            {self.base_asset: self.target_weight, self.quote_asset: 1 - self.target_weight},
+            self.quote_asset, self.balance_diff_pct, self.trading_fee
+        )
+        self.order_book = MyOrderBook(self)  # 调仓的买单和卖单, 角色分别是"buy"和"sell".
+        self.quotes = {}  # 角色: 最后一次下单或者改单的(价格, 数量)
+
+        # 实盘用账户缓存里面真实的资金, 回测用my_balance模拟USDT的数量.
+        self.account_cache: AccountCache = None
         if cta_engine.engine_type == EngineType.LIVE:
-            self.cta_engine.event_engine.register(EVENT_ACCOUNT, self.process_account)
+            self.account_cache = AccountCache.get_cache(self.cta_engine.event_engine)
 
         self.my_balance = 300000
+
     def on_init(self):
         """
         Callback when strategy is inited.
@@ -78,29 +90,45 @@ class GridBalanceStrategy(CtaTemplate):
         # print("1分钟的K线数据", bar)
 
         price = bar.close_price
-        self.cancel_all()  # 撤单.
 
-        if self.my_balance <= 0:
-            return
+        if self.account_cache:
+            balances = self.rebalancer.get_balances(self.account_cache, "BINANCE")
+        else:
+            balances = {self.base_asset: self.pos, self.quote_asset: self.my_balance}
 
-        if (abs(self.my_balance - self.pos * price) / self.my_balance) >= self.balance_diff_pct:
+        # 在死区里面的时候返回空的, 不下单也不撤单, 已经挂着的单继续等成交.
+        volume = self.rebalancer.compute_trades(balances, {self.base_asset: price}).get(self.base_asset, 0.0)
 
-            balance_diff = abs(self.my_balance - self.pos * price) / 2
-            # print('需要进行资金平衡.', balance_diff, self.my_balance, self.pos, price)
-            if self.my_balance > self.pos * price:
-                self.buy(price*1.001, balance_diff/price)
-            else:
-                self.sell(price * 0.999, balance_diff / price)
+        if volume > 0:
+            self.order_book.cancel_orders("sell")
+            self.requote("buy", Direction.LONG, Offset.OPEN, price * 1.001, volume)
+        elif volume < 0:
+            self.order_book.cancel_orders("buy")
+            self.requote("sell", Direction.SHORT, Offset.CLOSE, price * 0.999, abs(volume))
 
         self.put_event()
 
-    def process_account(self, event: Event):
-        print("event account", event.data)
+    def requote(self, role: str, direction: Direction, offset: Offset, price: float, volume: float):
+        """
+        没有挂单的时候下单; 挂着的单跟新的价格和数量相差不超过requote_pct就继续等成交, 不改单也不撤单.
+        """
+        last_quote = self.quotes.get(role, None)
+        if self.order_book.count(role) and last_quote:
+            last_price, last_volume = last_quote
+            if abs(price / last_price - 1) <= self.requote_pct and abs(volume / last_volume - 1) <= self.requote_pct:
+                return
+
+        self.quotes[role] = (price, volume)
+        self.order_book.requote_order(role, direction, offset, price, volume)
 
     def on_order(self, order: OrderData):
         """
         订单的回调方法: 订单状态更新的时候，会调用这个方法。
         """
+        self.order_book.on_order(order)  # 撤单成功之后下替换的订单, 要在处理订单之前调用.
+
+        if not order.is_active():
+            self.order_book.remove_order(order.vt_orderid)
 
         self.put_event()
 
@@ -112,7 +140,6 @@ class GridBalanceStrategy(CtaTemplate):
         系统通过里面处理这个方法，知道你当前的仓位数量
 
         """
-        from howtrader.trader.object import Offset
         if trade.offset == Offset.OPEN:
             self.my_balance -= trade.price * trade.volume
         elif trade.offset == Offset.CLOSE:
@@ -0,0 +1,85 @@
+"""
+    多资产的均仓(资金平衡)计算.
+
+    以前 GridBalanceStrategy 每根1分钟K线都 cancel_all(), 再用假的资金 my_balance 判断币和USDT是否各占一半,
+    偏离一点点就撤单再下单, 一天下来有上千次撤单和下单。
+
+    PortfolioRebalancer 用真实的资金(AccountCache里面的balance)一次计算所有资产需要调整的数量:
+    1. 每个资产的价值 = 数量 * 价格, 目标价值 = 总价值 * 目标占比, 用numpy一次算完所有资产.
+    2. 偏离的比例跟以前一样: 资产的价值按目标占比换算之后跟计价资产比较, |资产价值/资产占比 - USDT/USDT占比| / (USDT/USDT占比),
+       各占一半的时候就是以前的 |USDT - 币的价值| / USDT. 超过 balance_diff_pct 才需要调整, 在这个区间(死区)里面不下单.
+    3. 手续费按成交的金额扣: 买入的时候手续费从买到的币里面扣, 卖出的时候从收到的USDT里面扣, 调仓的数量按手续费放大一点, 成交之后正好回到目标占比.
+    4. 计价资产(比如USDT)不需要下单, 其他资产返回要买(正数)或者要卖(负数)的数量.
+
+    使用方法:
+
+    self.rebalancer = PortfolioRebalancer({"BTC": 0.25, "ETH": 0.25, "USDT": 0.5}, "USDT", balance_diff_pct=0.01, trading_fee=0.001)
+    balances = self.rebalancer.get_balances(self.account_cache, "BINANCE")  # 或者自己传入每个资产的数量
+    trades = self.rebalancer.compute_trades(balances, {"BTC": btc_price, "ETH": eth_price})  # {"BTC": 0.01, "ETH": -0.2}
+"""
+
+from typing import Dict, List
+
+import numpy as np
+
+from strategies.account_cache import AccountCache
+
+
+class PortfolioRebalancer(object):
+    """
+    按目标占比计算多个资产的调仓数量.
+    """
+
+    def __init__(self, target_weights: Dict[str, float], quote_asset: str = "USDT",
+                 balance_diff_pct: float = 0.01, trading_fee: float = 0.001):
+        """"""
+        self.assets: List[str] = list(target_weights.keys())
+        self.quote_asset: str = quote_asset
+        self.balance_diff_pct: float = balance_diff_pct
+        self.trading_fee: float = trading_fee
+
+        weights = np.array([target_weights[asset] for asset in self.assets], dtype=float)
+        self.weights: np.ndarray = weights / weights.sum()  # 占比加起来不是1的时候按比例缩放.
+        self.tradable: np.ndarray = np.array([asset != quote_asset for asset in self.assets])
+
+        if quote_asset not in self.assets or target_weights[quote_asset] <= 0:
+            raise Exception(f"目标占比里面需要有计价资产{quote_asset}")
+        self.quote_index: int = self.assets.index(quote_asset)
+
+    def get_balances(self, account_cache: AccountCache, gateway_name: str) -> Dict[str, float]:
+        """
+        从账户缓存读取每个资产的数量(包括挂单冻结的).
+        """
+        return {asset: account_cache.get_balance(f"{gateway_name}.{asset}") for asset in self.assets}
+
+    def compute_trades(self, balances: Dict[str, float], prices: Dict[str, float]) -> Dict[str, float]:
+        """
+        返回需要调整的资产和数量, 买是正数, 卖是负数. prices是每个资产用计价资产表示的价格.
+        """
+        amounts = np.array([balances.get(asset, 0.0) for asset in self.assets], dtype=float)
+        price_array = np.array([prices.get(asset, 0.0) if tradable else 1.0
+                                for asset, tradable in zip(self.assets, self.tradable)], dtype=float)
+
+        values = amounts * price_array
+        total_value = values.sum()
+        if total_value <= 0 or not np.all(price_array > 0):
+            return {}
+
+        # 偏离的比例: 按目标占比换算之后跟计价资产比较, 没有计价资产的时候只能卖.
+        with np.errstate(invalid="ignore", divide="ignore"):
+            scaled_values = values / self.weights  # 目标占比是0还有数量的资产是inf, 要全部卖掉.
+            quote_value = scaled_values[self.quote_index]
+            if quote_value > 0:
+                drift = np.abs(scaled_values - quote_value) / quote_value
+            else:
+                drift = np.full(len(self.assets), np.inf)
+        drift = np.nan_to_num(drift, nan=0.0)
+
+        need_trade = self.tradable & (drift >= self.balance_diff_pct)
+
+        # 手续费按成交的金额扣, 买入少拿到币, 卖出少拿到USDT, 所以要多买或者多卖一点.
+        diff_values = self.weights * total_value - values
+        fee_share = np.where(diff_values > 0, 1 - self.weights, self.weights) * self.trading_fee
+        volumes = diff_values / (price_array * (1 - fee_share))
+
+        return {asset: float(volume) for asset, volume, trade in zip(self.assets, volumes, need_trade) if trade}